@@ -7,3 +7,4 @@ class ApiPuntsCarregaConfig(AppConfig):
     
     def ready(self):
         import api_punts_carrega.translation
+        import api_punts_carrega.signals
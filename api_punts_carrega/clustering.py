@@ -0,0 +1,128 @@
+"""
+Agrupación (clustering) de puntos del mapa precalculada para todos los niveles de zoom.
+
+Se usa una rejilla en coordenadas Web Mercator: al zoom z el mundo mide
+TAMANO_TILE_PX * 2**z píxeles y se divide en celdas de TAMANO_CELDA_CLUSTER_PX, así que
+cada celda de un zoom cae entera dentro de una celda del zoom anterior y dentro de una
+sola tesela. Cada celda ocupada es un clúster con su centroide, el número de puntos y la
+suma de los campos numéricos indicados (por ejemplo la potencia de las estaciones).
+
+Igual que el índice espacial, los niveles se guardan en memoria del proceso y se
+recalculan cuando cambia la versión guardada en la base de datos (ver spatial_index.py).
+"""
+import threading
+
+import numpy as np
+
+from .models import EstacioCarrega
+from .spatial_index import obtener_version, CLAVE_VERSION_ESTACIONES
+
+TAMANO_TILE_PX = 256
+TAMANO_CELDA_CLUSTER_PX = 64
+ZOOM_MAXIMO = 20
+CELDAS_POR_TILE = TAMANO_TILE_PX // TAMANO_CELDA_CLUSTER_PX
+
+# Límite de latitud de la proyección Web Mercator
+LAT_MAXIMA_MERCATOR = 85.05112878
+
+
+def a_mercator(lats, lngs):
+    """Coordenadas Web Mercator normalizadas a [0, 1) (x hacia el este, y hacia el sur)."""
+    lats_rad = np.radians(np.clip(lats, -LAT_MAXIMA_MERCATOR, LAT_MAXIMA_MERCATOR))
+    u = (np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0
+    v = (1 - np.log(np.tan(lats_rad) + 1 / np.cos(lats_rad)) / np.pi) / 2
+    return np.clip(u, 0.0, np.nextafter(1.0, 0.0)), np.clip(v, 0.0, np.nextafter(1.0, 0.0))
+
+
+class MotorClusters:
+
+    def __init__(self, model, clave_version, campo_lat='lat', campo_lng='lng', campos_suma=(),
+                 zoom_maximo=ZOOM_MAXIMO):
+        self.model = model
+        self.clave_version = clave_version
+        self.campo_lat = campo_lat
+        self.campo_lng = campo_lng
+        self.campos_suma = tuple(campos_suma)
+        self.zoom_maximo = zoom_maximo
+        self._version = None
+        self._niveles = None
+        self._lock = threading.Lock()
+
+    def _construir(self):
+        filas = list(self.model.objects.values_list('pk', self.campo_lat, self.campo_lng, *self.campos_suma))
+        ids = np.array([fila[0] for fila in filas], dtype=object)
+        lats = np.array([fila[1] for fila in filas], dtype=np.float64)
+        lngs = np.array([fila[2] for fila in filas], dtype=np.float64)
+        sumandos = {
+            campo: np.array([fila[3 + i] or 0 for fila in filas], dtype=np.float64)
+            for i, campo in enumerate(self.campos_suma)
+        }
+        u, v = a_mercator(lats, lngs)
+
+        niveles = []
+        for z in range(self.zoom_maximo + 1):
+            celdas_lado = CELDAS_POR_TILE * 2 ** z
+            col = np.floor(u * celdas_lado).astype(np.int64)
+            fila = np.floor(v * celdas_lado).astype(np.int64)
+            claves, primero, grupo, num = np.unique(
+                col * celdas_lado + fila, return_index=True, return_inverse=True, return_counts=True
+            )
+            niveles.append({
+                'col': claves // celdas_lado,
+                'fila': claves % celdas_lado,
+                'lat': np.bincount(grupo, weights=lats, minlength=len(claves)) / num,
+                'lng': np.bincount(grupo, weights=lngs, minlength=len(claves)) / num,
+                'num': num,
+                'id': ids[primero],
+                'sumas': {
+                    campo: np.bincount(grupo, weights=valores, minlength=len(claves))
+                    for campo, valores in sumandos.items()
+                },
+            })
+        return niveles
+
+    def _actualizar_si_es_necesario(self):
+        version = obtener_version(self.clave_version)
+        if version == self._version:
+            return self._niveles
+        with self._lock:
+            if version != self._version:
+                self._niveles = self._construir()
+                self._version = version
+            return self._niveles
+
+    def _serializar(self, nivel, seleccion):
+        clusters = []
+        for pos in np.flatnonzero(seleccion):
+            num = int(nivel['num'][pos])
+            cluster = {
+                self.campo_lat: float(nivel['lat'][pos]),
+                self.campo_lng: float(nivel['lng'][pos]),
+                'num_estacions': num,
+                'id': nivel['id'][pos] if num == 1 else None,
+            }
+            for campo, sumas in nivel['sumas'].items():
+                cluster[f'{campo}_total'] = float(sumas[pos])
+            clusters.append(cluster)
+        return clusters
+
+    def clusters(self, z, lat_min=None, lat_max=None, lng_min=None, lng_max=None):
+        """
+        Clústeres del zoom z. Si se indica una caja, solo los que tienen el centroide dentro.
+        Los clústeres de un solo punto llevan su pk en 'id'.
+        """
+        nivel = self._actualizar_si_es_necesario()[z]
+        seleccion = np.ones(len(nivel['num']), dtype=bool)
+        if lat_min is not None:
+            seleccion &= (nivel['lat'] >= lat_min) & (nivel['lat'] <= lat_max)
+            seleccion &= (nivel['lng'] >= lng_min) & (nivel['lng'] <= lng_max)
+        return self._serializar(nivel, seleccion)
+
+    def clusters_en_tile(self, z, x, y):
+        """Clústeres cuyas celdas caen dentro de la tesela z/x/y."""
+        nivel = self._actualizar_si_es_necesario()[z]
+        seleccion = (nivel['col'] // CELDAS_POR_TILE == x) & (nivel['fila'] // CELDAS_POR_TILE == y)
+        return self._serializar(nivel, seleccion)
+
+
+clusters_estaciones = MotorClusters(EstacioCarrega, CLAVE_VERSION_ESTACIONES, campos_suma=('potencia',))
@@ -0,0 +1,97 @@
+"""
+Compatibilidad entre vehículos y estaciones de carga según sus tipos de cargador.
+
+Cada TipusCarregador tiene asignado un bit y los cargadores de una estación o de un
+vehículo se guardan como una máscara (un entero), así que comprobar si un vehículo puede
+cargar en una estación es un AND de dos enteros.
+
+Las máscaras de las estaciones se guardan en memoria del proceso, agrupadas por máscara,
+y se recalculan cuando cambia la versión guardada en la base de datos (igual que el
+índice espacial), así que también ven las importaciones hechas por otros procesos. Las
+señales m2m_changed (ver signals.py) y la importación cambian esa versión. La máscara de
+un vehículo se calcula en cada consulta (son sus pocos tipos de cargador): así no hay
+ninguna copia por proceso que se pueda quedar obsoleta cuando otro proceso lo modifica.
+"""
+import threading
+
+from .models import EstacioCarrega, TipusCarregador, Vehicle
+from .spatial_index import obtener_version, incrementar_version
+
+CLAVE_VERSION_COMPATIBILIDAD = 'compatibilidad_carregadors:version'
+
+
+def invalidar_compatibilidad():
+    """Marca como obsoletas las máscaras de las estaciones y la asignación de bits."""
+    incrementar_version(CLAVE_VERSION_COMPATIBILIDAD)
+
+
+class MatrizCompatibilidad:
+
+    def __init__(self, clave_version=CLAVE_VERSION_COMPATIBILIDAD):
+        self.clave_version = clave_version
+        self._version = None
+        self._datos = None
+        self._lock = threading.Lock()
+
+    def _construir(self):
+        bits = {
+            id_carregador: 1 << posicion
+            for posicion, id_carregador in enumerate(TipusCarregador.objects.order_by('pk').values_list('pk', flat=True))
+        }
+        mascaras = {}
+        for id_punt, id_carregador in EstacioCarrega.objects.filter(
+            tipus_carregador__isnull=False
+        ).values_list('pk', 'tipus_carregador'):
+            mascaras[id_punt] = mascaras.get(id_punt, 0) | bits.get(id_carregador, 0)
+
+        por_mascara = {}
+        for id_punt, mascara in mascaras.items():
+            por_mascara.setdefault(mascara, []).append(id_punt)
+        return {'bits': bits, 'estaciones': mascaras, 'por_mascara': por_mascara}
+
+    def _actualizar_si_es_necesario(self):
+        version = obtener_version(self.clave_version)
+        if version == self._version:
+            return self._datos
+        with self._lock:
+            if version != self._version:
+                self._datos = self._construir()
+                self._version = version
+            return self._datos
+
+    def mascara_tipos(self, ids_carregador):
+        datos = self._actualizar_si_es_necesario()
+        mascara = 0
+        for id_carregador in ids_carregador:
+            mascara |= datos['bits'].get(id_carregador, 0)
+        return mascara
+
+    def mascara_estacion(self, id_punt):
+        return self._actualizar_si_es_necesario()['estaciones'].get(id_punt, 0)
+
+    @staticmethod
+    def _mascara_vehicle(datos, matricula):
+        mascara = 0
+        for id_carregador in Vehicle.objects.filter(pk=matricula).values_list('tipus_carregador', flat=True):
+            mascara |= datos['bits'].get(id_carregador, 0)
+        return mascara
+
+    def mascara_vehicle(self, matricula):
+        return self._mascara_vehicle(self._actualizar_si_es_necesario(), matricula)
+
+    def son_compatibles(self, matricula, id_punt):
+        """Indica si el vehículo y la estación comparten algún tipo de cargador."""
+        datos = self._actualizar_si_es_necesario()
+        return bool(self._mascara_vehicle(datos, matricula) & datos['estaciones'].get(id_punt, 0))
+
+    def estaciones_compatibles(self, mascara):
+        """Ids de las estaciones con algún cargador de la máscara (recorre solo las máscaras distintas)."""
+        datos = self._actualizar_si_es_necesario()
+        compatibles = []
+        for mascara_estacion, ids in datos['por_mascara'].items():
+            if mascara_estacion & mascara:
+                compatibles.extend(ids)
+        return compatibles
+
+
+compatibilidad_carregadors = MatrizCompatibilidad()
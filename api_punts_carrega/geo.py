@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+from django.db.models import F
+
+# Radio de la Tierra en km
+RADIO_TIERRA_KM = 6378.0
+KM_POR_GRADO = math.radians(1) * RADIO_TIERRA_KM
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # degree 2 radians
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    # Haversine forumla
+    # a = sin²(difLat/2) + cos(lat1) * cos(lat2) * sin²(difLon/2)
+    # c = 2*atan2(√a, √(1-a))
+    # distance = R * c
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return RADIO_TIERRA_KM * c
+
+
+def distancia_minima_fuera_de_caja(lat, lng, lat_min, lat_max, lng_min, lng_max):
+    """
+    Cota inferior (km) de la distancia entre (lat, lng), que está dentro de la caja,
+    y cualquier punto que quede fuera de ella. No tiene en cuenta el antimeridiano.
+    """
+    margen_lat = min(lat - lat_min, lat_max - lat)
+    margen_lng = min(lng - lng_min, lng_max - lng)
+
+    # Un punto fuera en latitud está al menos a esa diferencia de latitud
+    cota_lat = RADIO_TIERRA_KM * math.radians(margen_lat)
+
+    # Un punto dentro en latitud pero fuera en longitud: a >= cos²(lat_extrema) * sin²(dLng/2)
+    lat_extrema = min(90.0, max(abs(lat_min), abs(lat_max)))
+    seno = math.cos(math.radians(lat_extrema)) * math.sin(math.radians(margen_lng) / 2)
+    cota_lng = 2 * RADIO_TIERRA_KM * math.asin(min(1.0, seno))
+
+    return min(cota_lat, cota_lng)
+
+
+def haversine_distances(lat: float, lng: float, lats, lngs) -> np.ndarray:
+    """
+    Versión vectorizada de haversine_distance: distancias (km) desde (lat, lng)
+    a cada punto de los arrays lats/lngs.
+    """
+    lats_rad = np.radians(np.ascontiguousarray(lats, dtype=np.float64))
+    lngs_rad = np.radians(np.ascontiguousarray(lngs, dtype=np.float64))
+    lat_rad = math.radians(lat)
+    lng_rad = math.radians(lng)
+
+    a = (np.sin((lats_rad - lat_rad) / 2) ** 2
+         + math.cos(lat_rad) * np.cos(lats_rad) * np.sin((lngs_rad - lng_rad) / 2) ** 2)
+
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def k_menores(distancias: np.ndarray, k: int) -> np.ndarray:
+    """
+    Posiciones de las k distancias más pequeñas, ordenadas de menor a mayor.
+    Usa argpartition para no ordenar el array entero.
+    """
+    if k <= 0 or len(distancias) == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(distancias):
+        candidatos = np.argpartition(distancias, k - 1)[:k]
+    else:
+        candidatos = np.arange(len(distancias))
+    return candidatos[np.argsort(distancias[candidatos], kind='stable')]
+
+
+def caja_envolvente(lat, lng, radio_km):
+    """
+    Caja (lat_min, lat_max, lng_min, lng_max) que contiene todos los puntos a menos
+    de radio_km de (lat, lng). No tiene en cuenta el antimeridiano.
+    """
+    margen_lat = radio_km / KM_POR_GRADO
+    lat_min = max(-90.0, lat - margen_lat)
+    lat_max = min(90.0, lat + margen_lat)
+
+    # La longitud se estrecha con la latitud: se usa la latitud más alejada del ecuador
+    cos_extremo = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if cos_extremo <= 0 or radio_km / (KM_POR_GRADO * cos_extremo) >= 180:
+        return lat_min, lat_max, -180.0, 180.0
+    margen_lng = radio_km / (KM_POR_GRADO * cos_extremo)
+    return lat_min, lat_max, lng - margen_lng, lng + margen_lng
+
+
+def filtrar_por_caja(queryset, lat, lng, radio_km):
+    """Descarta en la base de datos los puntos que quedan fuera de la caja del radio."""
+    lat_min, lat_max, lng_min, lng_max = caja_envolvente(lat, lng, radio_km)
+    return queryset.filter(lat__range=(lat_min, lat_max), lng__range=(lng_min, lng_max))
+
+
+def ordenar_por_distancia_aproximada(queryset, lat, lng):
+    """
+    Ordena en la base de datos por la distancia equirectangular al cuadrado.
+    Solo usa aritmética (el coseno se calcula aquí), así que funciona igual en
+    PostgreSQL y en SQLite. Sirve para preseleccionar candidatos, no para la distancia final.
+    """
+    escala_lng = math.cos(math.radians(lat))
+    dif_lat = F('lat') - lat
+    dif_lng = (F('lng') - lng) * escala_lng
+    return queryset.annotate(
+        distancia_aprox=dif_lat * dif_lat + dif_lng * dif_lng
+    ).order_by('distancia_aprox')
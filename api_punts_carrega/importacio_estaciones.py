@@ -0,0 +1,325 @@
+"""
+Sincronización incremental de las estaciones de carga por etapas.
+
+1. Se normalizan las filas de la fuente a medida que llegan y se calcula un hash de cada una.
+2. Por lotes, se comparan los hashes con hash_origen para saber qué estaciones son nuevas
+   o han cambiado (ver calcular_cambios).
+3. Solo esas estaciones se insertan o actualizan con operaciones en bloque, en una
+   transacción corta por lote. Al terminar de leer la fuente, las que ya no están se dan
+   de baja lógica (fuera de servicio), sin borrar nada.
+"""
+import hashlib
+import itertools
+import json
+import random
+
+from django.db import connection, transaction
+
+from .models import EstacioCarrega, Punt, TipusCarregador, TipusVelocitat
+from .compatibilidad import invalidar_compatibilidad
+from .spatial_index import invalidar_estaciones
+
+TAMANO_LOTE = 500
+
+CAMPOS_PUNT = ['lat', 'lng', 'direccio', 'ciutat', 'provincia']
+CAMPOS_ESTACIO = ['gestio', 'tipus_acces', 'nplaces', 'potencia']
+
+# Motivo con el que se marcan las estaciones que desaparecen de la fuente
+MOTIVO_BAJA_ORIGEN = "Estación retirada del registro de puntos de carga de la Generalitat"
+
+
+def split_multiple_values(text):
+    """
+    Función para dividir texto que puede contener múltiples valores
+    separados por diferentes delimitadores: '+', ',', ' i '
+    """
+    if not text or text == "Unknown":
+        return ["Unknown"]
+
+    # Primero reemplazamos todos los separadores por un separador común
+    normalized = text.replace(" i ", "|||").replace("+", "|||").replace(",", "|||")
+
+    # Dividimos por el separador común y limpiamos espacios
+    values = [value.strip() for value in normalized.split("|||") if value.strip()]
+
+    return values if values else ["Unknown"]
+
+
+def normalize_case(text):
+    """
+    Normaliza la capitalización del texto.
+    Convierte la primera letra de cada palabra a mayúscula y el resto a minúscula.
+    """
+    if not text or text == "Unknown":
+        return "Unknown"
+
+    # Title case: primera letra de cada palabra en mayúscula, resto en minúscula
+    return text.title()
+
+
+def _valores_validos(text):
+    valores = [normalize_case(v) for v in split_multiple_values(text)]
+    # Sin vacíos ni "Unknown" y sin repetir, manteniendo el orden
+    return list(dict.fromkeys(v for v in valores if v and v != "Unknown"))
+
+
+def _parse_potencia(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def normalizar_estacion(station):
+    """
+    Convierte una fila de la API de la Generalitat en un diccionario con los campos del
+    modelo y los tipos de velocidad y cargador ya separados. Devuelve None si la fila se
+    descarta (sin tipo de conexión, sin potencia o sin dirección).
+    """
+    tipus_connexi_raw = station.get("tipus_connexi", "Unknown")
+    potencia_raw = station.get("kw", "Unknown")
+    if not tipus_connexi_raw or tipus_connexi_raw == "Unknown" or potencia_raw == "0":
+        return None
+
+    direccio = station.get("adre_a")
+    if not direccio or direccio == "No address available":
+        return None
+
+    # Si la fuente no indica plazas se decide al crear la estación (ver aplicar_cambios)
+    num_places = station.get("nplaces_estaci", "Unknown")
+    if num_places == "" or num_places == "Unknown":
+        num_places = None
+
+    ac_dc = station.get("ac_dc", "Unknown")
+    carregadors = [
+        {
+            'id_carregador': f"{connector} {ac_dc}",
+            'nom_tipus': connector,
+            'tipus_connector': connector,
+            'tipus_corrent': ac_dc,
+        }
+        for connector in _valores_validos(tipus_connexi_raw)
+    ]
+
+    estacio = {
+        'id_punt': station.get("id", "Unknown"),
+        'lat': float(station.get("latitud", 0)),
+        'lng': float(station.get("longitud", 0)),
+        'direccio': direccio,
+        'ciutat': station.get("municipi", "Unknown"),
+        'provincia': station.get("provincia", "Unknown"),
+        'gestio': station.get("promotor_gestor", "Unknown"),
+        'tipus_acces': station.get("acces", "Unknown"),
+        'nplaces': num_places,
+        'potencia': _parse_potencia(potencia_raw),
+        'velocitats': _valores_validos(station.get("tipus_velocitat", "Unknown")),
+        'carregadors': carregadors,
+    }
+    estacio['hash_origen'] = hash_estacion(estacio)
+    return estacio
+
+
+def _en_lotes(elementos, tamano=TAMANO_LOTE):
+    """Agrupa cualquier iterable (también un generador) en listas de como mucho `tamano` elementos."""
+    iterador = iter(elementos)
+    while lote := list(itertools.islice(iterador, tamano)):
+        yield lote
+
+
+def _insertar_filas_estacio(estacions):
+    """
+    Inserta solo las filas de la tabla hija de EstacioCarrega (el Punt padre ya existe).
+    bulk_create no admite modelos con herencia multitabla, así que se usa executemany.
+    """
+    campos = EstacioCarrega._meta.local_concrete_fields
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(EstacioCarrega._meta.db_table),
+        ', '.join(qn(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    with connection.cursor() as cursor:
+        for lote in _en_lotes(estacions):
+            cursor.executemany(sql, [
+                [campo.get_db_prep_save(getattr(estacio, campo.attname), connection) for campo in campos]
+                for estacio in lote
+            ])
+
+
+def _guardar_tipos(estacions):
+    velocitats = {v for estacio in estacions for v in estacio['velocitats']}
+    carregadors = {c['id_carregador']: c for estacio in estacions for c in estacio['carregadors']}
+
+    # ignore_conflicts: los tipos que ya existen se dejan como estaban (igual que get_or_create)
+    TipusVelocitat.objects.bulk_create(
+        [TipusVelocitat(id_velocitat=v, nom_velocitat=v) for v in velocitats],
+        batch_size=TAMANO_LOTE, ignore_conflicts=True
+    )
+    TipusCarregador.objects.bulk_create(
+        [TipusCarregador(**c) for c in carregadors.values()],
+        batch_size=TAMANO_LOTE, ignore_conflicts=True
+    )
+
+
+def _guardar_relaciones(estacions):
+    ids = [estacio['id_punt'] for estacio in estacions]
+    through_velocitat = EstacioCarrega.tipus_velocitat.through
+    through_carregador = EstacioCarrega.tipus_carregador.through
+
+    for lote in _en_lotes(ids):
+        through_velocitat.objects.filter(estaciocarrega_id__in=lote).delete()
+        through_carregador.objects.filter(estaciocarrega_id__in=lote).delete()
+
+    through_velocitat.objects.bulk_create([
+        through_velocitat(estaciocarrega_id=estacio['id_punt'], tipusvelocitat_id=v)
+        for estacio in estacions for v in estacio['velocitats']
+    ], batch_size=TAMANO_LOTE)
+    through_carregador.objects.bulk_create([
+        through_carregador(estaciocarrega_id=estacio['id_punt'], tipuscarregador_id=c['id_carregador'])
+        for estacio in estacions for c in estacio['carregadors']
+    ], batch_size=TAMANO_LOTE)
+
+
+def hash_estacion(estacio):
+    """Huella (sha256) del contenido normalizado de una estación, para detectar cambios."""
+    contenido = {clave: valor for clave, valor in estacio.items() if clave != 'hash_origen'}
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def calcular_cambios(estacions):
+    """
+    Compara un lote de estaciones normalizadas con lo que hay en la base de datos usando
+    hash_origen. Devuelve el conjunto de cambios del lote sin aplicarlo:
+      - creadas: estaciones que no existen.
+      - actualizadas: estaciones cuyo contenido en la fuente ha cambiado.
+      - reactivadas: estaciones dadas de baja por la sincronización que vuelven a aparecer.
+      - sin_cambios: número de estaciones idénticas, que no se tocan.
+    Las bajas dependen de la fuente completa y se calculan aparte (ver calcular_bajas).
+    """
+    # Si un id se repite en la fuente, se queda la última fila
+    por_id = {estacio['id_punt']: estacio for estacio in estacions}
+    existents = {}
+    for lote in _en_lotes(por_id):
+        existents.update(
+            (pk, {'hash_origen': hash_origen, 'baja_origen': fuera and motivo == MOTIVO_BAJA_ORIGEN, 'nplaces': nplaces})
+            for pk, hash_origen, fuera, motivo, nplaces in EstacioCarrega.objects.filter(pk__in=lote).values_list(
+                'pk', 'hash_origen', 'fuera_de_servicio', 'motivo_fuera_servicio', 'nplaces'
+            )
+        )
+
+    cambios = {'creadas': [], 'actualizadas': [], 'reactivadas': [], 'dadas_de_baja': [], 'sin_cambios': 0}
+    for id_punt, estacio in por_id.items():
+        actual = existents.get(id_punt)
+        if actual is None:
+            cambios['creadas'].append(estacio)
+            continue
+        if estacio['nplaces'] is None:
+            # Sin plazas en la fuente: se conservan las que ya tenía la estación
+            estacio['nplaces'] = actual['nplaces']
+        if actual['baja_origen']:
+            cambios['reactivadas'].append(estacio)
+        elif actual['hash_origen'] != estacio['hash_origen']:
+            cambios['actualizadas'].append(estacio)
+        else:
+            cambios['sin_cambios'] += 1
+    return cambios
+
+
+def calcular_bajas(ids_vistos):
+    """
+    Estaciones importadas (con hash_origen) y activas que no aparecen en ids_vistos.
+    Las estaciones sin hash_origen (creadas a mano desde el panel) nunca se dan de baja.
+    """
+    candidatas = EstacioCarrega.objects.filter(hash_origen__isnull=False).exclude(
+        fuera_de_servicio=True, motivo_fuera_servicio=MOTIVO_BAJA_ORIGEN
+    ).values_list('pk', flat=True)
+    return sorted(set(candidatas) - set(ids_vistos))
+
+
+def aplicar_cambios(cambios):
+    creadas = cambios['creadas']
+    modificadas = cambios['actualizadas'] + cambios['reactivadas']
+    if not (creadas or modificadas or cambios['dadas_de_baja']):
+        return
+
+    with transaction.atomic():
+        _guardar_tipos(creadas + modificadas)
+
+        ids_creadas = [e['id_punt'] for e in creadas]
+        # Puntos que existen sin fila de estación (por ejemplo, de una importación a medias)
+        punts_existents = set()
+        for lote in _en_lotes(ids_creadas):
+            punts_existents.update(Punt.objects.filter(pk__in=lote).values_list('pk', flat=True))
+
+        for estacio in creadas:
+            if estacio['nplaces'] is None:
+                estacio['nplaces'] = str(random.randint(1, 10))
+
+        def _punt(e):
+            return Punt(id_punt=e['id_punt'], **{campo: e[campo] for campo in CAMPOS_PUNT})
+
+        Punt.objects.bulk_create(
+            [_punt(e) for e in creadas if e['id_punt'] not in punts_existents], batch_size=TAMANO_LOTE
+        )
+        Punt.objects.bulk_update(
+            [_punt(e) for e in creadas if e['id_punt'] in punts_existents] + [_punt(e) for e in modificadas],
+            CAMPOS_PUNT, batch_size=TAMANO_LOTE
+        )
+
+        def _estacio(e, **extra):
+            return EstacioCarrega(id_punt=e['id_punt'], punt_ptr_id=e['id_punt'], hash_origen=e['hash_origen'],
+                                  **{campo: e[campo] for campo in CAMPOS_PUNT + CAMPOS_ESTACIO}, **extra)
+
+        _insertar_filas_estacio([_estacio(e) for e in creadas])
+        EstacioCarrega.objects.bulk_update(
+            [_estacio(e) for e in cambios['actualizadas']],
+            CAMPOS_ESTACIO + ['hash_origen'], batch_size=TAMANO_LOTE
+        )
+        EstacioCarrega.objects.bulk_update(
+            [_estacio(e, fuera_de_servicio=False, motivo_fuera_servicio=None) for e in cambios['reactivadas']],
+            CAMPOS_ESTACIO + ['hash_origen', 'fuera_de_servicio', 'motivo_fuera_servicio'], batch_size=TAMANO_LOTE
+        )
+
+        _guardar_relaciones(creadas + modificadas)
+
+        # Baja lógica: se conservan reservas, valoraciones y reportes
+        for lote in _en_lotes(cambios['dadas_de_baja']):
+            EstacioCarrega.objects.filter(pk__in=lote).update(
+                fuera_de_servicio=True, motivo_fuera_servicio=MOTIVO_BAJA_ORIGEN
+            )
+
+        # Las operaciones en bloque no lanzan post_save ni m2m_changed: se invalidan a mano
+        # índice, teselas y máscaras de compatibilidad. Las versiones están en la base de
+        # datos, así que los demás procesos las ven cambiar al confirmarse la importación
+        invalidar_estaciones()
+        invalidar_compatibilidad()
+
+
+def guardar_estaciones(estacions, dry_run=False, tamano_lote=TAMANO_LOTE):
+    """
+    Sincroniza la tabla de estaciones con las estaciones normalizadas (ver normalizar_estacion)
+    aplicando solo las altas, modificaciones y bajas lógicas necesarias.
+
+    `estacions` puede ser un generador: se consume por lotes de `tamano_lote`, cada uno en su
+    propia transacción, así que solo hay un lote en memoria. Las bajas se aplican al final y
+    solo si la fuente se ha leído entera. Devuelve los ids de cada tipo de cambio y el número
+    de estaciones sin cambios; con dry_run no se escribe nada.
+    """
+    resumen = {'creadas': [], 'actualizadas': [], 'reactivadas': [], 'dadas_de_baja': [], 'sin_cambios': 0}
+    ids_vistos = set()
+    for lote in _en_lotes(estacions, tamano_lote):
+        cambios = calcular_cambios(lote)
+        if not dry_run:
+            aplicar_cambios(cambios)
+        ids_vistos.update(estacio['id_punt'] for estacio in lote)
+        for clave in ('creadas', 'actualizadas', 'reactivadas'):
+            resumen[clave].extend(estacio['id_punt'] for estacio in cambios[clave])
+        resumen['sin_cambios'] += cambios['sin_cambios']
+
+    # Una fuente vacía se trata como un error de la fuente, no como la retirada de todas las estaciones
+    if ids_vistos:
+        resumen['dadas_de_baja'] = calcular_bajas(ids_vistos)
+        if not dry_run:
+            aplicar_cambios({'creadas': [], 'actualizadas': [], 'reactivadas': [],
+                             'dadas_de_baja': resumen['dadas_de_baja']})
+    return resumen
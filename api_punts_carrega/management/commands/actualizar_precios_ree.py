@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+import requests
+from api_punts_carrega.precios_ree import actualizar_precios
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the hourly electricity prices from REE and store them for the API. "
+        "Meant to run periodically (e.g. from cron): REE publishes the next day's prices in the evening"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias", type=int, default=2,
+            help="Number of days to refresh starting today (default: today and tomorrow)",
+        )
+
+    def handle(self, *args, **kwargs):
+        hoy = date.today()
+        fallos = 0
+        for desplazamiento in range(kwargs["dias"]):
+            fecha = hoy + timedelta(days=desplazamiento)
+            try:
+                registro = actualizar_precios(fecha)
+            except requests.RequestException as e:
+                fallos += 1
+                self.stderr.write(f"{fecha}: failed to fetch prices from REE: {e}")
+                continue
+            if registro is None:
+                self.stdout.write(f"{fecha}: prices not published yet")
+            else:
+                self.stdout.write(f"{fecha}: stored {len(registro.precios)} hourly prices")
+        if fallos:
+            self.stderr.write(f"{fallos} day(s) could not be refreshed; the API keeps serving the stored prices")
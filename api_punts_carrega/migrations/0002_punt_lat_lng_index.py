@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_punts_carrega', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='punt',
+            index=models.Index(fields=['lat', 'lng'], name='punt_lat_lng_idx'),
+        ),
+    ]
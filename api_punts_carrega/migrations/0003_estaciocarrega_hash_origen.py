@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_punts_carrega', '0002_punt_lat_lng_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estaciocarrega',
+            name='hash_origen',
+            field=models.CharField(blank=True, help_text='Hash del registro en la fuente de datos abiertos (solo estaciones importadas)', max_length=64, null=True),
+        ),
+    ]
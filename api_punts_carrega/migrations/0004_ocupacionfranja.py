@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:00
+
+import math
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SEGUNDOS_FRANJA = 15 * 60
+FRANJAS_DIA = 24 * 60 * 60 // SEGUNDOS_FRANJA
+
+
+def rellenar_ocupacion(apps, schema_editor):
+    """Calcula las franjas de las reservas que ya existían."""
+    Reserva = apps.get_model('api_punts_carrega', 'Reserva')
+    OcupacionFranja = apps.get_model('api_punts_carrega', 'OcupacionFranja')
+
+    ocupacion = Counter()
+    for estacion_id, fecha, hora, duracion in Reserva.objects.values_list(
+        'estacion_id', 'fecha', 'hora', 'duracion'
+    ).iterator():
+        inicio = hora.hour * 3600 + hora.minute * 60 + hora.second
+        fin = inicio + duracion.total_seconds()
+        for indice in range(inicio // SEGUNDOS_FRANJA, math.ceil(fin / SEGUNDOS_FRANJA)):
+            dias, franja = divmod(indice, FRANJAS_DIA)
+            ocupacion[(estacion_id, fecha + timedelta(days=dias), franja)] += 1
+
+    OcupacionFranja.objects.bulk_create([
+        OcupacionFranja(estacion_id=estacion_id, fecha=fecha, franja=franja, ocupadas=ocupadas)
+        for (estacion_id, fecha, franja), ocupadas in ocupacion.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_punts_carrega', '0003_estaciocarrega_hash_origen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionFranja',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('franja', models.PositiveSmallIntegerField(help_text='Índice de la franja de 15 minutos dentro del día (0-95)')),
+                ('ocupadas', models.PositiveIntegerField(default=0)),
+                ('estacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion_franjas', to='api_punts_carrega.estaciocarrega')),
+            ],
+            options={
+                'unique_together': {('estacion', 'fecha', 'franja')},
+            },
+        ),
+        migrations.RunPython(rellenar_ocupacion, migrations.RunPython.noop),
+    ]
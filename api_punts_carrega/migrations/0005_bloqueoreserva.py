@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_punts_carrega', '0004_ocupacionfranja'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('estacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloqueos_reserva', to='api_punts_carrega.estaciocarrega')),
+            ],
+            options={
+                'unique_together': {('estacion', 'fecha')},
+            },
+        ),
+    ]
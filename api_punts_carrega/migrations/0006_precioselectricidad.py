@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_punts_carrega', '0005_bloqueoreserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreciosElectricidad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('precios', models.JSONField(help_text="Lista de {'hora': 'HH:MM', 'precio_kwh': float} ordenada por hora")),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Precios de electricidad',
+                'verbose_name_plural': 'Precios de electricidad',
+            },
+        ),
+    ]
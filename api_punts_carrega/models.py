@@ -150,6 +150,9 @@ class Punt(models.Model):
     
     class Meta:
         abstract = False
+        indexes = [
+            models.Index(fields=['lat', 'lng'], name='punt_lat_lng_idx'),
+        ]
 
 class EstacioCarrega(Punt):
     gestio = models.CharField(max_length=100)
@@ -160,6 +163,7 @@ class EstacioCarrega(Punt):
     tipus_carregador = models.ManyToManyField('TipusCarregador', related_name='estacions_de_carrega')
     fuera_de_servicio = models.BooleanField(default=False, help_text="Indica si la estación está fuera de servicio")
     motivo_fuera_servicio = models.CharField(max_length=255, blank=True, null=True, help_text="Motivo por el que la estación está fuera de servicio")
+    hash_origen = models.CharField(max_length=64, blank=True, null=True, help_text="Hash del registro en la fuente de datos abiertos (solo estaciones importadas)")
 
     def __str__(self):
         return f"Estació {self.id_punt} - {self.lat}, {self.lng}"
@@ -200,6 +204,39 @@ class ReservaFinalitzada(models.Model):
     def __str__(self):
         return f"Reserva Finalitzada: {self.reserva}"
 
+class OcupacionFranja(models.Model):
+    """
+    Reservas que tocan cada franja de 15 minutos de una estación y día. Se mantiene desde
+    las señales de Reserva (ver signals.py) y permite leer la ocupación de un día con una
+    sola consulta por rango sobre el índice único.
+    """
+    estacion = models.ForeignKey(EstacioCarrega, on_delete=models.CASCADE, related_name='ocupacion_franjas')
+    fecha = models.DateField()
+    franja = models.PositiveSmallIntegerField(help_text="Índice de la franja de 15 minutos dentro del día (0-95)")
+    ocupadas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('estacion', 'fecha', 'franja')
+
+    def __str__(self):
+        return f"{self.estacion_id} {self.fecha} franja {self.franja}: {self.ocupadas}"
+
+class BloqueoReserva(models.Model):
+    """
+    Fila de bloqueo por estación y día. Las altas y cambios de reservas la actualizan antes
+    de comprobar la ocupación, de modo que las reservas de una misma estación y día se
+    admiten de una en una sin bloquear el resto (ver ocupacion.bloquear_dias_reserva).
+    """
+    estacion = models.ForeignKey(EstacioCarrega, on_delete=models.CASCADE, related_name='bloqueos_reserva')
+    fecha = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('estacion', 'fecha')
+
+    def __str__(self):
+        return f"Bloqueo {self.estacion_id} {self.fecha}"
+
 class Vehicle(models.Model):
     matricula = models.CharField(max_length=10, primary_key=True)
     carrega_actual = models.FloatField()
@@ -337,4 +374,35 @@ class ReporteEstacion(models.Model):
 
     def __str__(self):
         usuario_str = self.usuario_reporta.username if self.usuario_reporta else "Usuario Desconocido"
-        return f"Reporte en '{self.estacion.id_punt}' por {usuario_str} ({self.get_tipo_error_display()}) - {self.get_estado_display()}"
\ No newline at end of file
+        return f"Reporte en '{self.estacion.id_punt}' por {usuario_str} ({self.get_tipo_error_display()}) - {self.get_estado_display()}"
+
+
+class PreciosElectricidad(models.Model):
+    """
+    Precios horarios del kWh de un día según REE. Los guarda el comando
+    actualizar_precios_ree y la vista de precios los lee de aquí sin llamar a REE.
+    """
+    fecha = models.DateField(unique=True)
+    precios = models.JSONField(help_text="Lista de {'hora': 'HH:MM', 'precio_kwh': float} ordenada por hora")
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Precios de electricidad"
+        verbose_name_plural = "Precios de electricidad"
+
+    def __str__(self):
+        return f"Precios REE {self.fecha} ({len(self.precios)} horas)"
+
+
+class VersionDatos(models.Model):
+    """
+    Versión de un conjunto de datos derivados (índice espacial, clústeres, teselas,
+    máscaras de compatibilidad...). Está en la base de datos para que un cambio hecho por
+    cualquier proceso, incluidos los comandos de importación, lo vean todos los demás.
+    Ver spatial_index.obtener_version.
+    """
+    clave = models.CharField(max_length=100, unique=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.clave}: {self.version}"
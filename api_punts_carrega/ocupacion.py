@@ -0,0 +1,265 @@
+"""
+Ocupación de las plazas de una estación de carga a lo largo de un día.
+
+Las reservas se convierten en intervalos [inicio, fin) en segundos desde la medianoche
+del día consultado (las del día anterior que siguen activas empiezan en negativo y las
+que pasan de medianoche terminan después de SEGUNDOS_DIA). Un barrido (sweep line) sobre
+los extremos da un perfil escalonado con el número de reservas simultáneas en cada tramo.
+"Máximo de reservas simultáneas en [inicio, fin)" son dos búsquedas binarias y el máximo
+de los tramos que caen dentro, y el máximo de todas las franjas del día sale de un solo
+recorrido del perfil. El perfil se construye en cada petición, así que no compensa
+precalcular nada más sobre él.
+
+Además se mantiene la tabla OcupacionFranja con el número de reservas que tocan cada
+franja de 15 minutos. Es una cota superior de la ocupación real dentro de la franja, así
+que sirve como vía rápida: si ninguna franja llega al número de plazas, la reserva cabe
+seguro y no hace falta leer las reservas; si no, se decide con el perfil exacto.
+"""
+import math
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.db.models import F, Max, Q
+
+from .models import BloqueoReserva, OcupacionFranja, Reserva
+
+SEGUNDOS_DIA = 24 * 60 * 60
+MINUTOS_FRANJA = 15
+SEGUNDOS_FRANJA = MINUTOS_FRANJA * 60
+FRANJAS_DIA = SEGUNDOS_DIA // SEGUNDOS_FRANJA
+
+
+def a_segundos(hora):
+    return hora.hour * 3600 + hora.minute * 60 + hora.second
+
+
+def formatear_segundos(segundos):
+    """'HH:MM' de un instante del día; el final del día se muestra como '24:00'."""
+    segundos = int(segundos)
+    return f"{segundos // 3600:02d}:{segundos % 3600 // 60:02d}"
+
+
+def plazas_estacion(estacion):
+    """Número de plazas de la estación; si nplaces no es numérico se asume una."""
+    try:
+        return int(estacion.nplaces)
+    except (ValueError, TypeError):
+        return 1
+
+
+class PerfilOcupacion:
+
+    def __init__(self, intervalos):
+        eventos = {}
+        for inicio, fin in intervalos:
+            if fin > inicio:
+                eventos[inicio] = eventos.get(inicio, 0) + 1
+                eventos[fin] = eventos.get(fin, 0) - 1
+
+        # niveles[i] = reservas simultáneas en [puntos[i], puntos[i + 1]); fuera de los puntos es 0
+        self.puntos = sorted(eventos)
+        self.niveles = []
+        actual = 0
+        for punto in self.puntos:
+            actual += eventos[punto]
+            self.niveles.append(actual)
+
+    def ocupacion_maxima(self, inicio, fin):
+        """Máximo de reservas simultáneas en [inicio, fin)."""
+        if fin <= inicio or not self.puntos:
+            return 0
+        # Último tramo que empieza antes de fin y tramo que contiene inicio
+        j = bisect_left(self.puntos, fin) - 1
+        if j < 0:
+            return 0
+        i = max(bisect_right(self.puntos, inicio) - 1, 0)
+        return max(self.niveles[i:j + 1])
+
+    def maximos_por_franja(self, tamano, num_franjas):
+        """Máximo de reservas simultáneas en cada franja [k * tamano, (k + 1) * tamano), en un solo recorrido."""
+        maximos = []
+        indice = -1
+        for franja in range(num_franjas):
+            inicio, fin = franja * tamano, (franja + 1) * tamano
+            while indice + 1 < len(self.puntos) and self.puntos[indice + 1] <= inicio:
+                indice += 1
+            maximo = self.niveles[indice] if indice >= 0 else 0
+            while indice + 1 < len(self.puntos) and self.puntos[indice + 1] < fin:
+                indice += 1
+                maximo = max(maximo, self.niveles[indice])
+            maximos.append(maximo)
+        return maximos
+
+    def franjas_libres(self, capacidad, inicio=0, fin=SEGUNDOS_DIA, duracion_minima=0):
+        """
+        Tramos maximales dentro de [inicio, fin) con al menos una plaza libre, como
+        (inicio, fin, plazas_libres) donde plazas_libres es el mínimo dentro del tramo.
+        Se descartan los tramos más cortos que duracion_minima.
+        """
+        limites = [inicio] + [p for p in self.puntos if inicio < p < fin] + [fin]
+        franjas = []
+        abierta = None
+        for a, b in zip(limites, limites[1:]):
+            indice = bisect_right(self.puntos, a) - 1
+            libres = capacidad - (self.niveles[indice] if indice >= 0 else 0)
+            if libres > 0:
+                if abierta is None:
+                    abierta = [a, b, libres]
+                else:
+                    abierta[1] = b
+                    abierta[2] = min(abierta[2], libres)
+            elif abierta is not None:
+                franjas.append(tuple(abierta))
+                abierta = None
+        if abierta is not None:
+            franjas.append(tuple(abierta))
+        return [f for f in franjas if f[1] - f[0] >= duracion_minima]
+
+
+def intervalos_reservas(estacion, fecha, excluir_id=None):
+    """Intervalos de las reservas de la estación que pueden ocupar alguna plaza en `fecha`."""
+    reservas = Reserva.objects.filter(
+        estacion=estacion, fecha__range=(fecha - timedelta(days=1), fecha + timedelta(days=1))
+    )
+    if excluir_id is not None:
+        reservas = reservas.exclude(id=excluir_id)
+
+    for fecha_reserva, hora, duracion in reservas.values_list('fecha', 'hora', 'duracion'):
+        inicio = a_segundos(hora) + (fecha_reserva - fecha).days * SEGUNDOS_DIA
+        yield inicio, inicio + duracion.total_seconds()
+
+
+def ocupacion_dia(estacion, fecha, excluir_id=None):
+    return PerfilOcupacion(intervalos_reservas(estacion, fecha, excluir_id))
+
+
+def franjas_reserva(fecha, hora, duracion):
+    """Agrupa por día las franjas que toca [hora, hora + duracion), que puede pasar de medianoche."""
+    inicio = a_segundos(hora)
+    fin = inicio + duracion.total_seconds()
+    por_fecha = {}
+    for indice in range(inicio // SEGUNDOS_FRANJA, math.ceil(fin / SEGUNDOS_FRANJA)):
+        dias, franja = divmod(indice, FRANJAS_DIA)
+        por_fecha.setdefault(fecha + timedelta(days=dias), []).append(franja)
+    return por_fecha
+
+
+def ajustar_franjas(estacion_id, fecha, hora, duracion, delta):
+    """Suma `delta` (+1 al reservar, -1 al liberar) a las franjas que ocupa una reserva."""
+    por_fecha = franjas_reserva(fecha, hora, duracion)
+    if delta > 0:
+        OcupacionFranja.objects.bulk_create([
+            OcupacionFranja(estacion_id=estacion_id, fecha=dia, franja=franja)
+            for dia, franjas in por_fecha.items() for franja in franjas
+        ], ignore_conflicts=True)
+
+    for dia, franjas in por_fecha.items():
+        filas = OcupacionFranja.objects.filter(estacion_id=estacion_id, fecha=dia, franja__in=franjas)
+        if delta < 0:
+            filas = filas.filter(ocupadas__gte=-delta)
+        filas.update(ocupadas=F('ocupadas') + delta)
+
+    if delta < 0:
+        OcupacionFranja.objects.filter(
+            estacion_id=estacion_id, fecha__in=list(por_fecha), ocupadas=0
+        ).delete()
+
+
+def ocupacion_maxima_franjas(estacion, fecha, hora_inicio, duracion):
+    """Máximo de reservas por franja en el intervalo (una consulta por rango)."""
+    condiciones = Q()
+    for dia, franjas in franjas_reserva(fecha, hora_inicio, duracion).items():
+        condiciones |= Q(fecha=dia, franja__range=(franjas[0], franjas[-1]))
+    if not condiciones:
+        return 0
+    maximo = OcupacionFranja.objects.filter(condiciones, estacion=estacion).aggregate(maximo=Max('ocupadas'))
+    return maximo['maximo'] or 0
+
+
+def ocupacion_franjas_dia(estacion, fecha):
+    """Lista con las reservas de cada una de las FRANJAS_DIA franjas del día."""
+    ocupacion = [0] * FRANJAS_DIA
+    for franja, ocupadas in OcupacionFranja.objects.filter(estacion=estacion, fecha=fecha).values_list(
+        'franja', 'ocupadas'
+    ):
+        ocupacion[franja] = ocupadas
+    return ocupacion
+
+
+def bloquear_dias_reserva(estacion, fecha, hora_inicio, duracion):
+    """Bloquea la estación en todos los días que toca la reserva (ver bloquear_estaciones_dias)."""
+    bloquear_estaciones_dias((estacion.pk, dia) for dia in franjas_reserva(fecha, hora_inicio, duracion))
+
+
+def bloquear_estaciones_dias(pares):
+    """
+    Bloquea, hasta el final de la transacción, cada par (estacion_id, fecha); dos reservas
+    que coinciden en el tiempo comparten al menos un día. Se empieza con un UPDATE para
+    tomar el bloqueo de escritura desde el principio: en PostgreSQL bloquea la fila y en
+    SQLite toma el bloqueo de escritura de la base de datos antes de leer la ocupación.
+    Los pares se recorren en orden para no provocar interbloqueos.
+    Debe llamarse dentro de transaction.atomic.
+    """
+    for estacion_id, dia in sorted(set(pares)):
+        bloqueo = BloqueoReserva.objects.filter(estacion_id=estacion_id, fecha=dia)
+        if not bloqueo.update(version=F('version') + 1):
+            BloqueoReserva.objects.bulk_create(
+                [BloqueoReserva(estacion_id=estacion_id, fecha=dia)], ignore_conflicts=True
+            )
+            bloqueo.update(version=F('version') + 1)
+
+
+def intervalo_absoluto(fecha, hora, duracion):
+    """[inicio, fin) de una reserva en segundos desde una época fija, comparable entre días."""
+    inicio = fecha.toordinal() * SEGUNDOS_DIA + a_segundos(hora)
+    return inicio, inicio + duracion.total_seconds()
+
+
+def intervalos_reservas_estaciones(pares):
+    """
+    Intervalos absolutos, agrupados por estación, de las reservas que pueden ocupar alguna
+    plaza el día de cada par (estacion_id, fecha). Una sola consulta para todos los pares,
+    con una condición por fecha que solo abarca ese día y sus vecinos.
+    """
+    estaciones_por_fecha = {}
+    for estacion_id, fecha in pares:
+        estaciones_por_fecha.setdefault(fecha, set()).add(estacion_id)
+    intervalos = {estacion_id: [] for estaciones in estaciones_por_fecha.values() for estacion_id in estaciones}
+    if not intervalos:
+        return intervalos
+
+    condiciones = Q()
+    for fecha, estaciones in estaciones_por_fecha.items():
+        condiciones |= Q(
+            estacion_id__in=sorted(estaciones),
+            fecha__range=(fecha - timedelta(days=1), fecha + timedelta(days=1)),
+        )
+    reservas = Reserva.objects.filter(condiciones)
+    for estacion_id, fecha, hora, duracion in reservas.values_list('estacion_id', 'fecha', 'hora', 'duracion'):
+        intervalos[estacion_id].append(intervalo_absoluto(fecha, hora, duracion))
+    return intervalos
+
+
+def hay_plaza_libre(estacion, fecha, hora_inicio, duracion, excluir_id=None):
+    """Indica si cabe una reserva más en [hora_inicio, hora_inicio + duracion) de `fecha`."""
+    plazas = plazas_estacion(estacion)
+    # Las franjas sobrestiman la ocupación (y cuentan la reserva excluida): si hay sitio, lo hay seguro
+    if ocupacion_maxima_franjas(estacion, fecha, hora_inicio, duracion) < plazas:
+        return True
+
+    inicio = a_segundos(hora_inicio)
+    perfil = ocupacion_dia(estacion, fecha, excluir_id)
+    return perfil.ocupacion_maxima(inicio, inicio + duracion.total_seconds()) < plazas
+
+
+def plazas_libres_estaciones(estaciones, fecha, hora_inicio, duracion):
+    """
+    Plazas libres de cada estación durante todo [hora_inicio, hora_inicio + duracion) de
+    `fecha`, como diccionario pk -> plazas. Lee las reservas de todas con una sola consulta.
+    """
+    intervalos = intervalos_reservas_estaciones((estacion.pk, fecha) for estacion in estaciones)
+    inicio, fin = intervalo_absoluto(fecha, hora_inicio, duracion)
+    return {
+        estacion.pk: plazas_estacion(estacion) - PerfilOcupacion(intervalos[estacion.pk]).ocupacion_maxima(inicio, fin)
+        for estacion in estaciones
+    }
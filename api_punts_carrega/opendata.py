@@ -0,0 +1,138 @@
+"""
+Lectura paginada y en streaming de los conjuntos de datos abiertos (API Socrata de
+analisi.transparenciacatalunya.cat).
+
+Cada página se pide con $limit/$offset (y un $order estable) y se analiza con un parser
+JSON incremental a medida que llegan los bytes, así que nunca se tiene en memoria ni el
+cuerpo entero ni la lista completa de registros. Se piden páginas hasta que una llega
+incompleta, de modo que el límite por defecto del servidor no recorta filas sin avisar.
+"""
+import codecs
+import itertools
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+TAMANO_PAGINA = 1000
+TAMANO_FRAGMENTO = 64 * 1024
+TIMEOUT_PETICION = 30
+
+# Límite que aplica Socrata cuando la petición no indica $limit
+LIMITE_POR_DEFECTO_SOCRATA = 1000
+
+_ESPACIOS = ' \t\n\r'
+
+
+def iterar_array_json(fragmentos):
+    """
+    Genera uno a uno los elementos de un array JSON a partir de fragmentos de texto,
+    sin esperar a tener el documento completo. Lanza ValueError si el JSON no es un
+    array o llega truncado.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    abierto = cerrado = False
+
+    for fragmento in itertools.chain(fragmentos, [None]):
+        final = fragmento is None
+        if not final:
+            buffer += fragmento
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _ESPACIOS:
+                pos += 1
+            if pos == len(buffer) or cerrado:
+                break
+            if not abierto:
+                if buffer[pos] != '[':
+                    raise ValueError("Se esperaba un array JSON")
+                abierto = True
+                pos += 1
+            elif buffer[pos] == ']':
+                cerrado = True
+                pos += 1
+            elif buffer[pos] == ',':
+                pos += 1
+            else:
+                try:
+                    elemento, fin = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError("JSON inválido o truncado")
+                    break  # el elemento aún no ha llegado entero
+                if fin == len(buffer) and not final:
+                    break  # un número al final del fragmento podría continuar en el siguiente
+                yield elemento
+                pos = fin
+        buffer = buffer[pos:]
+
+    if not cerrado:
+        raise ValueError("JSON truncado: falta el cierre del array")
+    if buffer.strip():
+        raise ValueError("Contenido inesperado después del array JSON")
+
+
+def iterar_registros(url, tamano_pagina=TAMANO_PAGINA, timeout=TIMEOUT_PETICION):
+    """
+    Genera todos los registros de un recurso Socrata pidiendo páginas de `tamano_pagina`.
+    Los errores HTTP se propagan como requests.HTTPError.
+    """
+    offset = 0
+    while True:
+        params = {'$limit': tamano_pagina, '$offset': offset, '$order': ':id'}
+        recibidos = 0
+        with requests.get(url, params=params, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            # JSON siempre va en UTF-8; el decodificador incremental no parte caracteres multibyte
+            decodificador = codecs.getincrementaldecoder('utf-8')()
+            fragmentos = itertools.chain(
+                (decodificador.decode(bloque) for bloque in response.iter_content(TAMANO_FRAGMENTO)),
+                [decodificador.decode(b'', final=True)],
+            )
+            for registro in iterar_array_json(fragmentos):
+                recibidos += 1
+                yield registro
+
+        if recibidos < tamano_pagina:
+            return
+        offset += recibidos
+
+
+@contextmanager
+def servidor_fixture(ruta):
+    """
+    Sirve en local un fichero JSON (una lista de registros) imitando la paginación de
+    Socrata ($limit/$offset), para probar la importación sin conexión.
+    Devuelve la URL del recurso.
+    """
+    with open(ruta, encoding='utf-8') as fichero:
+        registros = json.load(fichero)
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            limit = int(query.get('$limit', [LIMITE_POR_DEFECTO_SOCRATA])[0])
+            offset = int(query.get('$offset', [0])[0])
+            cuerpo = json.dumps(registros[offset:offset + limit], ensure_ascii=False).encode('utf-8')
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, format, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield f'http://127.0.0.1:{servidor.server_address[1]}/resource.json'
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
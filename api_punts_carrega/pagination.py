@@ -0,0 +1,64 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# Filas que se leen de la base de datos en cada bloque del modo streaming
+STREAMING_CHUNK_SIZE = 500
+
+
+class EstacionesCursorPagination(CursorPagination):
+    """
+    Paginación por cursor (keyset) ordenada por id_punt.
+    Es opcional: solo se activa si la petición incluye ?page_size o ?cursor,
+    para no cambiar la respuesta de los clientes que esperan la lista completa.
+    """
+    ordering = 'id_punt'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        if (self.page_size_query_param not in request.query_params
+                and self.cursor_query_param not in request.query_params):
+            return None
+        return super().get_page_size(request)
+
+
+def es_streaming(request):
+    return request.query_params.get('stream', 'false').lower() == 'true'
+
+
+def respuesta_json_streaming(queryset, serializer_class, context=None):
+    """
+    Devuelve una lista JSON que se va generando por bloques de .iterator(),
+    sin cargar ni serializar toda la tabla en memoria de golpe.
+    """
+    def generar():
+        yield '['
+        separador = ''
+        for obj in queryset.iterator(chunk_size=STREAMING_CHUNK_SIZE):
+            datos = serializer_class(obj, context=context or {}).data
+            yield separador + json.dumps(datos, cls=JSONEncoder, ensure_ascii=False)
+            separador = ','
+        yield ']'
+
+    return StreamingHttpResponse(generar(), content_type='application/json')
+
+
+def listar_estaciones(request, queryset, serializer_class):
+    """
+    Respuesta común de los listados de estaciones: streaming (?stream=true),
+    paginada por cursor (?page_size / ?cursor) o la lista completa de siempre.
+    """
+    if es_streaming(request):
+        return respuesta_json_streaming(queryset.order_by('id_punt'), serializer_class)
+
+    paginator = EstacionesCursorPagination()
+    pagina = paginator.paginate_queryset(queryset, request)
+    if pagina is not None:
+        return paginator.get_paginated_response(serializer_class(pagina, many=True).data)
+
+    return Response(serializer_class(queryset, many=True).data)
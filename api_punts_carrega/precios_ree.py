@@ -0,0 +1,115 @@
+"""
+Precios horarios del kWh publicados por Red Eléctrica de España (REE).
+
+El comando actualizar_precios_ree descarga los precios de hoy y de mañana y los guarda en
+PreciosElectricidad; las vistas leen de ahí, así que una petición de un cliente no espera
+a REE. Solo si aún no hay precios del día se llama a REE en el momento (y se guardan para
+las siguientes peticiones). Si esa llamada falla, durante ESPERA_TRAS_FALLO_REE segundos
+se responde con el mismo error sin volver a llamar, para que REE caído no haga esperar el
+timeout a cada petición. El aviso se guarda en la caché de Django, que es por proceso:
+cada proceso llama como mucho una vez por intervalo.
+"""
+import json
+from datetime import datetime
+
+import requests
+from django.core.cache import cache
+
+from .models import PreciosElectricidad
+
+URL_REE = "https://apidatos.ree.es/es/datos/mercados/precios-mercados-tiempo-real"
+CABECERAS_REE = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json'
+}
+TIMEOUT_REE = 10
+ESPERA_TRAS_FALLO_REE = 60
+
+
+def _procesar_valor_hora(valor_hora):
+    precio_mwh = valor_hora.get("value")
+    timestamp_str = valor_hora.get("datetime")
+    if precio_mwh is not None and timestamp_str:
+        try:
+            precio_kwh = float(precio_mwh) / 1000
+            hora_dt = datetime.fromisoformat(timestamp_str)
+            hora_simple = hora_dt.strftime("%H:%M")
+            return {"hora": hora_simple, "precio_kwh": round(precio_kwh, 5)}
+        except (ValueError, TypeError) as e:
+            print(f"Error procesando valor REE {valor_hora}: {e}")
+    return None
+
+
+def parse_precios_kwh_ree(data):
+    precios_kwh = []
+    for valor_hora in _obtener_valores_horarios(data):
+        resultado = _procesar_valor_hora(valor_hora)
+        if resultado:
+            precios_kwh.append(resultado)
+    return precios_kwh
+
+
+def _obtener_valores_horarios(data):
+    if "included" in data and data["included"]:
+        indicador_precios = data["included"][0]
+        if "attributes" in indicador_precios and "values" in indicador_precios["attributes"]:
+            return indicador_precios["attributes"]["values"]
+    return []
+
+
+def parse_ree_http_error(e):
+    error_detail = f"Error HTTP {e.response.status_code} desde API REE"
+    try:
+        error_data = e.response.json()
+        if "errors" in error_data and error_data["errors"]:
+            error_detail = error_data["errors"][0].get("detail", error_detail)
+    except (json.JSONDecodeError, AttributeError, IndexError, KeyError):
+        pass
+    return error_detail
+
+
+def descargar_precios(fecha):
+    """Precios horarios de `fecha` según REE. Los errores de red o HTTP se propagan."""
+    fecha_str_api = fecha.strftime("%Y-%m-%d")
+    params = {
+        'start_date': f"{fecha_str_api}T00:00",
+        'end_date': f"{fecha_str_api}T23:59",
+        'time_trunc': 'hour',
+    }
+    response = requests.get(URL_REE, params=params, headers=CABECERAS_REE, timeout=TIMEOUT_REE)
+    response.raise_for_status()
+    return parse_precios_kwh_ree(response.json())
+
+
+def actualizar_precios(fecha):
+    """
+    Descarga y guarda los precios de `fecha`. Devuelve el PreciosElectricidad guardado, o
+    None si REE aún no los ha publicado (no se sobrescribe lo que hubiera).
+    """
+    precios = descargar_precios(fecha)
+    if not precios:
+        return None
+    registro, _ = PreciosElectricidad.objects.update_or_create(fecha=fecha, defaults={'precios': precios})
+    return registro
+
+
+def precios_guardados(fecha):
+    return PreciosElectricidad.objects.filter(fecha=fecha).first()
+
+
+def ultimos_precios_guardados(antes_de):
+    """Los precios guardados más recientes anteriores a `antes_de`, para servirlos si REE falla."""
+    return PreciosElectricidad.objects.filter(fecha__lt=antes_de).order_by('-fecha').first()
+
+
+def _clave_fallo(fecha):
+    return f'precios_ree:fallo:{fecha.isoformat()}'
+
+
+def fallo_reciente(fecha):
+    """(datos, status) del último error al pedir a REE los precios de `fecha`, si es reciente."""
+    return cache.get(_clave_fallo(fecha))
+
+
+def recordar_fallo(fecha, error):
+    cache.set(_clave_fallo(fecha), error, ESPERA_TRAS_FALLO_REE)
@@ -29,7 +29,12 @@ class PuntSerializer(serializers.ModelSerializer):
 class EstacioCarregaSerializer(serializers.ModelSerializer):
     class Meta:
         model = EstacioCarrega
-        fields = '__all__'
+        exclude = ['hash_origen']
+
+class EstacioCarregaLiteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EstacioCarrega
+        fields = ['id_punt', 'lat', 'lng', 'potencia', 'fuera_de_servicio']
     
 class TipusCarregadorSerializer(serializers.ModelSerializer):   
     class Meta:
@@ -174,7 +179,7 @@ class EstacioCarregaConValoracionesSerializer(EstacioCarregaSerializer):
 
     class Meta:
         model = EstacioCarrega
-        fields = '__all__'
+        exclude = ['hash_origen']
 
     def to_representation(self, instance):
         # Obtenemos la representación base
@@ -0,0 +1,57 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .compatibilidad import invalidar_compatibilidad
+from .models import EstacioCarrega, Reserva, TipusCarregador
+from .ocupacion import ajustar_franjas
+from .spatial_index import invalidar_estaciones
+
+
+@receiver([post_save, post_delete], sender=EstacioCarrega)
+def invalidar_datos_estaciones(sender, **kwargs):
+    # La versión está en la base de datos: los demás procesos la ven cambiar junto con la estación
+    invalidar_estaciones()
+
+
+@receiver(m2m_changed, sender=EstacioCarrega.tipus_carregador.through)
+@receiver([post_save, post_delete], sender=TipusCarregador)
+@receiver(post_delete, sender=EstacioCarrega)
+def invalidar_compatibilidad_estaciones(sender, action=None, **kwargs):
+    if action is not None and not action.startswith('post_'):
+        return
+    invalidar_compatibilidad()
+
+
+def _datos_franjas(reserva):
+    """(estacion_id, fecha, hora, duracion) con los tipos del modelo, aunque se hayan asignado como texto."""
+    return (
+        reserva.estacion_id,
+        Reserva._meta.get_field('fecha').to_python(reserva.fecha),
+        Reserva._meta.get_field('hora').to_python(reserva.hora),
+        Reserva._meta.get_field('duracion').to_python(reserva.duracion),
+    )
+
+
+@receiver(pre_save, sender=Reserva)
+def recordar_franjas_reserva(sender, instance, **kwargs):
+    instance._franjas_previas = None
+    if instance.pk:
+        instance._franjas_previas = Reserva.objects.filter(pk=instance.pk).values_list(
+            'estacion_id', 'fecha', 'hora', 'duracion'
+        ).first()
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_franjas_reserva(sender, instance, **kwargs):
+    actual = _datos_franjas(instance)
+    previa = getattr(instance, '_franjas_previas', None)
+    if previa == actual:
+        return
+    if previa:
+        ajustar_franjas(*previa, -1)
+    ajustar_franjas(*actual, 1)
+
+
+@receiver(post_delete, sender=Reserva)
+def liberar_franjas_reserva(sender, instance, **kwargs):
+    ajustar_franjas(*_datos_franjas(instance), -1)
@@ -0,0 +1,164 @@
+"""
+Índice espacial en memoria (por proceso) para buscar los puntos más cercanos.
+
+Los puntos se reparten en una rejilla de celdas de TAMANO_CELDA_GRADOS. Una consulta
+recorre anillos de celdas alrededor del punto de búsqueda y se detiene en cuanto
+ningún punto fuera de los anillos visitados puede mejorar el resultado, de modo que
+solo se calcula la distancia (en bloque, con NumPy) de unos pocos cientos de candidatos.
+
+El índice se reconstruye de forma perezosa cuando cambia la versión guardada en la base
+de datos (ver `obtener_version` e `invalidar_estaciones`), así que un cambio hecho por
+cualquier proceso, también por los comandos de importación, obliga a los demás a
+reconstruir el suyo. Comprobar la versión cuesta una consulta por el índice único.
+"""
+import math
+import threading
+import uuid
+
+import numpy as np
+
+from .geo import haversine_distances, k_menores, distancia_minima_fuera_de_caja
+from .models import EstacioCarrega, VersionDatos
+
+TAMANO_CELDA_GRADOS = 0.1
+CLAVE_VERSION_ESTACIONES = 'estaciones_carga:version'
+
+
+def _nueva_version():
+    # Valores únicos y no consecutivos: si se deshace una transacción que había cambiado la
+    # versión, la siguiente no puede repetir la que ya vio algún proceso
+    return uuid.uuid4().hex
+
+
+def obtener_version(clave):
+    version = VersionDatos.objects.filter(clave=clave).values_list('version', flat=True).first()
+    if version is None:
+        version = VersionDatos.objects.get_or_create(clave=clave, defaults={'version': _nueva_version()})[0].version
+    return version
+
+
+def incrementar_version(clave):
+    """Cambia la versión de `clave`. Dentro de una transacción, los demás procesos la ven al confirmarla."""
+    version = _nueva_version()
+    if not VersionDatos.objects.filter(clave=clave).update(version=version):
+        VersionDatos.objects.update_or_create(clave=clave, defaults={'version': version})
+    return version
+
+
+def invalidar_estaciones():
+    """Marca como obsoletos los datos derivados de las estaciones de carga."""
+    incrementar_version(CLAVE_VERSION_ESTACIONES)
+
+
+class IndiceEspacial:
+
+    def __init__(self, model, clave_version, tamano_celda=TAMANO_CELDA_GRADOS):
+        self.model = model
+        self.clave_version = clave_version
+        self.tamano_celda = tamano_celda
+        self._version = None
+        self._datos = None
+        self._lock = threading.Lock()
+
+    def _celda(self, lat, lng):
+        return math.floor(lat / self.tamano_celda), math.floor(lng / self.tamano_celda)
+
+    def _construir(self):
+        puntos = list(
+            self.model.objects.filter(lat__isnull=False, lng__isnull=False).values_list('pk', 'lat', 'lng')
+        )
+        ids = [pk for pk, _, _ in puntos]
+        lats = np.fromiter((lat for _, lat, _ in puntos), dtype=np.float64, count=len(puntos))
+        lngs = np.fromiter((lng for _, _, lng in puntos), dtype=np.float64, count=len(puntos))
+
+        celdas = {}
+        for pos, (_, lat, lng) in enumerate(puntos):
+            celdas.setdefault(self._celda(lat, lng), []).append(pos)
+        celdas = {celda: np.array(posiciones, dtype=np.intp) for celda, posiciones in celdas.items()}
+
+        if celdas:
+            filas = [i for i, _ in celdas]
+            columnas = [j for _, j in celdas]
+            extension = (min(filas), max(filas), min(columnas), max(columnas))
+        else:
+            extension = None
+        return ids, lats, lngs, celdas, extension
+
+    def _actualizar_si_es_necesario(self):
+        version = obtener_version(self.clave_version)
+        if version == self._version:
+            return self._datos
+        with self._lock:
+            if version != self._version:
+                self._datos = self._construir()
+                self._version = version
+            return self._datos
+
+    def invalidar(self):
+        incrementar_version(self.clave_version)
+
+    @staticmethod
+    def _celdas_anillo(ci, cj, anillo):
+        if anillo == 0:
+            yield ci, cj
+            return
+        for j in range(cj - anillo, cj + anillo + 1):
+            yield ci - anillo, j
+            yield ci + anillo, j
+        for i in range(ci - anillo + 1, ci + anillo):
+            yield i, cj - anillo
+            yield i, cj + anillo
+
+    def k_mas_cercanos(self, lat, lng, k, radio_km=None, admitidos=None):
+        """
+        Devuelve una lista de (pk, distancia_km) con los k puntos más cercanos a (lat, lng),
+        ordenada por distancia. Si se indica radio_km, descarta los puntos más lejanos, y si
+        se indica admitidos (un conjunto de pks), solo tiene en cuenta esos puntos.
+        """
+        ids, lats, lngs, celdas, extension = self._actualizar_si_es_necesario()
+        if extension is None or k <= 0:
+            return []
+
+        ci, cj = self._celda(lat, lng)
+        fila_min, fila_max, col_min, col_max = extension
+        ultimo_anillo = max(ci - fila_min, fila_max - ci, cj - col_min, col_max - cj)
+
+        posiciones = []
+        distancias = []
+        encontrados = 0
+        anillo = 0
+        while anillo <= ultimo_anillo:
+            en_anillo = [celdas[celda] for celda in self._celdas_anillo(ci, cj, anillo) if celda in celdas]
+            if en_anillo:
+                nuevas = np.concatenate(en_anillo)
+                distancias_nuevas = haversine_distances(lat, lng, lats[nuevas], lngs[nuevas])
+                if radio_km is not None:
+                    dentro = distancias_nuevas <= radio_km
+                    nuevas, distancias_nuevas = nuevas[dentro], distancias_nuevas[dentro]
+                if admitidos is not None:
+                    dentro = np.fromiter((ids[pos] in admitidos for pos in nuevas), dtype=bool, count=len(nuevas))
+                    nuevas, distancias_nuevas = nuevas[dentro], distancias_nuevas[dentro]
+                posiciones.append(nuevas)
+                distancias.append(distancias_nuevas)
+                encontrados += len(nuevas)
+
+            cota = distancia_minima_fuera_de_caja(
+                lat, lng,
+                (ci - anillo) * self.tamano_celda, (ci + anillo + 1) * self.tamano_celda,
+                (cj - anillo) * self.tamano_celda, (cj + anillo + 1) * self.tamano_celda,
+            )
+            if encontrados >= k and np.partition(np.concatenate(distancias), k - 1)[k - 1] <= cota:
+                break
+            if radio_km is not None and cota > radio_km:
+                break
+            anillo += 1
+
+        if not encontrados:
+            return []
+        posiciones = np.concatenate(posiciones)
+        distancias = np.concatenate(distancias)
+        mejores = k_menores(distancias, k)
+        return [(ids[pos], float(distancia)) for pos, distancia in zip(posiciones[mejores], distancias[mejores])]
+
+
+indice_estaciones = IndiceEspacial(EstacioCarrega, CLAVE_VERSION_ESTACIONES)
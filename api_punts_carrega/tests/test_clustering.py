@@ -0,0 +1,67 @@
+import random
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega
+from api_punts_carrega.clustering import clusters_estaciones, ZOOM_MAXIMO
+
+
+class TestClusteringEstacions(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        rng = random.Random(7)
+        self.potencia_total = 0
+        for i in range(200):
+            potencia = rng.choice([7, 22, 50, None])
+            EstacioCarrega.objects.create(
+                id_punt=f"estacio_{i}",
+                lat=rng.uniform(40.5, 42.9),
+                lng=rng.uniform(0.2, 3.3),
+                gestio="Pública",
+                tipus_acces="Lliure",
+                potencia=potencia
+            )
+            self.potencia_total += potencia or 0
+
+    def test_todos_los_zooms_conservan_totales(self):
+        for z in range(ZOOM_MAXIMO + 1):
+            clusters = clusters_estaciones.clusters(z)
+            self.assertEqual(sum(c['num_estacions'] for c in clusters), 200)
+            self.assertAlmostEqual(sum(c['potencia_total'] for c in clusters), self.potencia_total)
+
+    def test_menos_clusters_a_menos_zoom(self):
+        anteriores = len(clusters_estaciones.clusters(0))
+        self.assertEqual(anteriores, 1)
+        for z in range(1, ZOOM_MAXIMO + 1):
+            actuales = len(clusters_estaciones.clusters(z))
+            self.assertGreaterEqual(actuales, anteriores)
+            anteriores = actuales
+        self.assertEqual(anteriores, 200)
+
+    def test_cluster_individual_lleva_id(self):
+        for cluster in clusters_estaciones.clusters(ZOOM_MAXIMO):
+            self.assertEqual(cluster['num_estacions'], 1)
+            self.assertTrue(cluster['id'].startswith("estacio_"))
+
+    def test_endpoint_con_caja(self):
+        response = self.client.get(reverse('clusters_estacions'), {
+            'zoom': 10, 'lat_min': 41.0, 'lat_max': 42.0, 'lng_min': 1.0, 'lng_max': 2.0
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['zoom'], 10)
+        self.assertTrue(response.data['clusters'])
+        for cluster in response.data['clusters']:
+            self.assertTrue(41.0 <= cluster['lat'] <= 42.0)
+            self.assertTrue(1.0 <= cluster['lng'] <= 2.0)
+
+    def test_endpoint_zoom_invalido(self):
+        for params in [{}, {'zoom': 'abc'}, {'zoom': ZOOM_MAXIMO + 1}, {'zoom': 5, 'lat_min': 41.0}]:
+            response = self.client.get(reverse('clusters_estacions'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_se_recalcula_al_cambiar_estaciones(self):
+        clusters_estaciones.clusters(0)
+        EstacioCarrega.objects.filter(pk="estacio_0").delete()
+        self.assertEqual(clusters_estaciones.clusters(0)[0]['num_estacions'], 199)
@@ -0,0 +1,60 @@
+from django.test import TestCase
+from api_punts_carrega.compatibilidad import compatibilidad_carregadors
+from api_punts_carrega.models import EstacioCarrega, TipusCarregador, Usuario, Vehicle
+
+
+class TestMatrizCompatibilidad(TestCase):
+    def setUp(self):
+        self.ccs = TipusCarregador.objects.create(id_carregador="M-CCS", nom_tipus="CCS", tipus_connector="CCS2", tipus_corrent="DC")
+        self.mennekes = TipusCarregador.objects.create(id_carregador="M-MEN", nom_tipus="Mennekes", tipus_connector="Tipus 2", tipus_corrent="AC")
+
+        self.estacio = EstacioCarrega.objects.create(
+            id_punt="M-EST", lat=41.3, lng=2.1, nplaces="1", gestio="TestG", tipus_acces="TestA"
+        )
+        self.estacio.tipus_carregador.add(self.ccs)
+        usuari = Usuario.objects.create_user(username='mascara', email='mascara@example.com', password='pw')
+        self.vehicle = Vehicle.objects.create(
+            matricula="MASC01", propietari=usuari, marca="M", model="X", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=70.0
+        )
+        self.vehicle.tipus_carregador.add(self.mennekes)
+
+    def test_mascaras_por_tipo(self):
+        self.assertEqual(compatibilidad_carregadors.mascara_estacion("M-EST"), compatibilidad_carregadors.mascara_tipos(["M-CCS"]))
+        self.assertEqual(compatibilidad_carregadors.mascara_estacion("NO-EXISTE"), 0)
+        self.assertFalse(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+
+    def test_cambios_m2m_invalidan_estaciones(self):
+        self.assertFalse(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+        self.estacio.tipus_carregador.add(self.mennekes)
+        self.assertTrue(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+        self.assertIn("M-EST", compatibilidad_carregadors.estaciones_compatibles(
+            compatibilidad_carregadors.mascara_vehicle("MASC01")
+        ))
+
+    def test_cambios_m2m_invalidan_vehiculos(self):
+        self.assertFalse(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+        # Cambio desde el lado del tipo de cargador (relación inversa)
+        self.ccs.tipus_carregador.add(self.vehicle)
+        self.assertTrue(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+        self.vehicle.tipus_carregador.clear()
+        self.assertFalse(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+
+    def test_comprobacion_sin_reconstruir_las_mascaras(self):
+        compatibilidad_carregadors.son_compatibles("MASC01", "M-EST")
+        # La versión y los cargadores del vehículo; las máscaras de las estaciones no se recalculan
+        with self.assertNumQueries(2):
+            compatibilidad_carregadors.son_compatibles("MASC01", "M-EST")
+
+    def test_ve_la_importacion_de_otro_proceso(self):
+        from api_punts_carrega.compatibilidad import CLAVE_VERSION_COMPATIBILIDAD
+        from api_punts_carrega.models import VersionDatos
+
+        self.assertFalse(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
+        # Como fetch_charging_stations: escribe en bloque (sin señales aquí) y cambia la versión
+        EstacioCarrega.tipus_carregador.through.objects.bulk_create([
+            EstacioCarrega.tipus_carregador.through(estaciocarrega_id="M-EST", tipuscarregador_id="M-MEN")
+        ])
+        VersionDatos.objects.filter(clave=CLAVE_VERSION_COMPATIBILIDAD).update(version="importacion")
+
+        self.assertTrue(compatibilidad_carregadors.son_compatibles("MASC01", "M-EST"))
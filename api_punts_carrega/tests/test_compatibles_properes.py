@@ -0,0 +1,77 @@
+from datetime import date, time, timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, Reserva, TipusCarregador, Usuario, Vehicle
+
+
+class TestEstacionsCompatiblesProperes(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Usuario.objects.create_user(username='proper', email='proper@example.com', password='pw')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+        ccs = TipusCarregador.objects.create(id_carregador="P-CCS", nom_tipus="CCS", tipus_connector="CCS2", tipus_corrent="DC")
+        chademo = TipusCarregador.objects.create(id_carregador="P-CHA", nom_tipus="CHAdeMO", tipus_connector="CHAdeMO", tipus_corrent="DC")
+        self.vehicle = Vehicle.objects.create(
+            matricula="PROP01", propietari=self.user, marca="M", model="X", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=70.0
+        )
+        self.vehicle.tipus_carregador.add(ccs)
+
+        # De más cercana a más lejana desde (41.38, 2.17)
+        def estacio(id_punt, lng, tipus, **extra):
+            estacio = EstacioCarrega.objects.create(
+                id_punt=id_punt, lat=41.38, lng=lng, nplaces="1", gestio="TestG", tipus_acces="TestA", **extra
+            )
+            estacio.tipus_carregador.add(tipus)
+            return estacio
+
+        self.incompatible = estacio("P-INCOMP", 2.171, chademo)
+        self.fuera_servicio = estacio("P-FUERA", 2.172, ccs, fuera_de_servicio=True)
+        self.ocupada = estacio("P-OCUPADA", 2.173, ccs)
+        self.libre = estacio("P-LIBRE", 2.174, ccs)
+        self.lejana = estacio("P-LEJANA", 2.30, ccs)
+
+        Reserva.objects.create(
+            usuario=self.user, estacion=self.ocupada, fecha=date(2025, 6, 1),
+            hora=time(9, 30), duracion=timedelta(hours=1)
+        )
+        self.url = reverse('estacions_compatibles_properes')
+        self.params = {
+            'vehicle': 'PROP01', 'lat': 41.38, 'lng': 2.17,
+            'fecha': '01/06/2025', 'hora': '10:00', 'duracion': '01:00',
+        }
+
+    def test_devuelve_compatibles_en_servicio_y_con_plaza(self):
+        response = self.client.get(self.url, self.params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [fila['estacio_carrega']['id_punt'] for fila in response.data]
+        self.assertEqual(ids, ['P-LIBRE', 'P-LEJANA'])
+        self.assertEqual(response.data[0]['places_lliures'], 1)
+        self.assertLess(response.data[0]['distancia_km'], response.data[1]['distancia_km'])
+
+    def test_la_franja_decide_si_hay_plaza(self):
+        response = self.client.get(self.url, {**self.params, 'hora': '11:00', 'limit': 2})
+        ids = [fila['estacio_carrega']['id_punt'] for fila in response.data]
+        self.assertEqual(ids, ['P-OCUPADA', 'P-LIBRE'])
+
+    def test_radio_y_limite(self):
+        response = self.client.get(self.url, {**self.params, 'radio_km': 1})
+        self.assertEqual([fila['estacio_carrega']['id_punt'] for fila in response.data], ['P-LIBRE'])
+        response = self.client.get(self.url, {**self.params, 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+
+    def test_errores(self):
+        self.assertEqual(
+            self.client.get(self.url, {**self.params, 'hora': '25:00'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(self.url, {**self.params, 'vehicle': 'AJENO'}).status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.client.credentials()
+        self.assertIn(self.client.get(self.url, self.params).status_code, [401, 403])
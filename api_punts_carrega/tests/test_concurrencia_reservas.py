@@ -0,0 +1,86 @@
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api_punts_carrega import views
+from api_punts_carrega.models import EstacioCarrega, Reserva, Usuario
+from api_punts_carrega.ocupacion import ocupacion_dia, SEGUNDOS_DIA
+
+NUM_HILOS = 12
+PLAZAS = 2
+# Tiempo que cada petición espera, tras mirar la ocupación, a que las demás también la miren
+ESPERA_CARRERA = 0.5
+
+
+# SQLite no espera a que se libere el bloqueo de escritura (responde "table is locked"), así
+# que el resultado depende de cómo se repartan los hilos; en PostgreSQL es exacto
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requiere los bloqueos de fila de PostgreSQL")
+class TestConcurrenciaReservas(TransactionTestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='carga', email='carga@example.com', password='pw')
+        self.token = Token.objects.create(user=self.user).key
+        self.estacio = EstacioCarrega.objects.create(
+            id_punt="CONC-1", lat=41.3, lng=2.1, nplaces=str(PLAZAS), gestio="TestG", tipus_acces="TestA"
+        )
+
+    def _reservar(self, inicio):
+        client = APIClient()
+        datos = json.dumps({"estacion": self.estacio.id_punt, "fecha": "01/06/2025", "hora": "10:00", "duracion": "01:00"})
+        inicio.wait()
+        try:
+            return client.post(
+                reverse('reserva-crear'), data=datos, content_type='application/json',
+                HTTP_AUTHORIZATION=f'Token {self.token}'
+            ).status_code
+        finally:
+            connection.close()
+
+    def _reservar_a_la_vez(self):
+        """
+        Lanza NUM_HILOS reservas de la misma franja a la vez. Cada una, después de comprobar
+        que hay plaza, espera a que las demás lleguen al mismo punto antes de guardar: sin
+        bloqueo todas ven la estación libre. Con el bloqueo la primera agota la espera y
+        rompe la barrera, así que el resto ya no espera.
+        """
+        barrera = threading.Barrier(NUM_HILOS)
+        hay_plaza_libre = views.hay_plaza_libre
+
+        def hay_plaza_libre_lento(*args, **kwargs):
+            libre = hay_plaza_libre(*args, **kwargs)
+            try:
+                barrera.wait(ESPERA_CARRERA)
+            except threading.BrokenBarrierError:
+                pass
+            return libre
+
+        inicio = threading.Event()
+        with patch('api_punts_carrega.views.hay_plaza_libre', side_effect=hay_plaza_libre_lento):
+            with ThreadPoolExecutor(max_workers=NUM_HILOS) as executor:
+                futuros = [executor.submit(self._reservar, inicio) for _ in range(NUM_HILOS)]
+                inicio.set()
+                return [futuro.result() for futuro in futuros]
+
+    def test_no_se_supera_el_numero_de_plazas(self):
+        resultados = self._reservar_a_la_vez()
+
+        self.assertEqual(resultados.count(201), PLAZAS)
+        self.assertEqual(resultados.count(409), NUM_HILOS - PLAZAS)
+        self.assertEqual(Reserva.objects.filter(estacion=self.estacio).count(), PLAZAS)
+        perfil = ocupacion_dia(self.estacio, date(2025, 6, 1))
+        self.assertEqual(perfil.ocupacion_maxima(0, SEGUNDOS_DIA), PLAZAS)
+
+    @patch('api_punts_carrega.views.bloquear_dias_reserva')
+    def test_sin_bloqueo_se_superan_las_plazas(self, mock_bloquear):
+        # Comprueba que el test anterior detecta la carrera: sin el bloqueo, pasan todas
+        resultados = self._reservar_a_la_vez()
+
+        self.assertGreater(resultados.count(201), PLAZAS)
+        self.assertGreater(Reserva.objects.filter(estacion=self.estacio).count(), PLAZAS)
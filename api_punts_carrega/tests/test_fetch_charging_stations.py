@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+from datetime import date, time, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api_punts_carrega.importacio_estaciones import MOTIVO_BAJA_ORIGEN
+from api_punts_carrega.models import (
+    EstacioCarrega, TipusCarregador, TipusVelocitat, Reserva, Usuario, Vehicle
+)
+
+
+def _fila(id_estacio, **extra):
+    fila = {
+        "id": id_estacio,
+        "latitud": "41.38",
+        "longitud": "2.17",
+        "adre_a": f"Carrer {id_estacio}",
+        "municipi": "Barcelona",
+        "provincia": "Barcelona",
+        "promotor_gestor": "Ajuntament",
+        "acces": "Públic",
+        "nplaces_estaci": "2",
+        "kw": "22",
+        "ac_dc": "AC",
+        "tipus_connexi": "MENNEKES + SCHUKO",
+        "tipus_velocitat": "RAPID i semiRAPID",
+    }
+    fila.update(extra)
+    return fila
+
+
+class TestFetchChargingStations(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.fixture = os.path.join(directorio.name, "estacions.json")
+
+    def _importar(self, filas, **opciones):
+        # Modo --fixture: la fuente se sirve en local con paginación estilo Socrata
+        with open(self.fixture, "w", encoding="utf-8") as fichero:
+            json.dump(filas, fichero)
+        salida = StringIO()
+        call_command("fetch_charging_stations", fixture=self.fixture, stdout=salida, stderr=salida, **opciones)
+        return salida.getvalue()
+
+    def test_importa_estaciones_tipos_y_relaciones(self):
+        self._importar([
+            _fila("E1"),
+            _fila("E2", kw="50", ac_dc="DC", tipus_connexi="CCS Combo2"),
+            _fila("E3", tipus_connexi=""),  # se descarta
+            _fila("E4", adre_a=""),  # se descarta
+        ])
+
+        self.assertEqual(set(EstacioCarrega.objects.values_list("pk", flat=True)), {"E1", "E2"})
+        e1 = EstacioCarrega.objects.get(pk="E1")
+        self.assertEqual(e1.potencia, 22)
+        self.assertEqual(e1.ciutat, "Barcelona")
+        self.assertEqual(
+            set(e1.tipus_carregador.values_list("pk", flat=True)), {"Mennekes AC", "Schuko AC"}
+        )
+        self.assertEqual(set(e1.tipus_velocitat.values_list("pk", flat=True)), {"Rapid", "Semirapid"})
+        self.assertTrue(TipusCarregador.objects.filter(pk="Ccs Combo2 DC").exists())
+        self.assertEqual(TipusVelocitat.objects.count(), 2)
+
+    def test_reimportar_actualiza_sin_perder_estado(self):
+        self._importar([_fila("E1"), _fila("E2")])
+
+        usuario = Usuario.objects.create_user(username="u", password="p")
+        vehicle = Vehicle.objects.create(
+            matricula="1234ABC", carrega_actual=10, capacitat_bateria=50, propietari=usuario,
+            model="M", marca="X", any_model=2020
+        )
+        vehicle.tipus_carregador.add("Mennekes AC")
+        EstacioCarrega.objects.filter(pk="E1").update(fuera_de_servicio=True, motivo_fuera_servicio="Avería")
+        Reserva.objects.create(usuario=usuario, estacion_id="E1", fecha=date.today(), hora=time(10, 0),
+                               duracion=timedelta(hours=1))
+
+        self._importar([_fila("E1", kw="50", tipus_connexi="CHAdeMO"), _fila("E3")])
+
+        self.assertEqual(set(EstacioCarrega.objects.values_list("pk", flat=True)), {"E1", "E2", "E3"})
+        e2 = EstacioCarrega.objects.get(pk="E2")
+        self.assertTrue(e2.fuera_de_servicio)
+        self.assertEqual(e2.motivo_fuera_servicio, MOTIVO_BAJA_ORIGEN)
+        e1 = EstacioCarrega.objects.get(pk="E1")
+        self.assertEqual(e1.potencia, 50)
+        self.assertTrue(e1.fuera_de_servicio)
+        self.assertEqual(e1.motivo_fuera_servicio, "Avería")
+        self.assertEqual(e1.reservas.count(), 1)
+        self.assertEqual(list(e1.tipus_carregador.values_list("pk", flat=True)), ["Chademo AC"])
+        # Los tipos ya no se borran en cada importación
+        self.assertEqual(list(vehicle.tipus_carregador.values_list("pk", flat=True)), ["Mennekes AC"])
+
+    def test_numero_de_consultas_no_depende_del_numero_de_estaciones(self):
+        filas = [_fila(f"E{i}") for i in range(300)]
+        with CaptureQueriesContext(connection) as consultas:
+            self._importar(filas)
+        self.assertEqual(EstacioCarrega.objects.count(), 300)
+        self.assertLess(len(consultas), 40)
+
+    def test_lee_todas_las_paginas(self):
+        # Más filas que el límite por defecto de Socrata y que el tamaño de página
+        filas = [_fila(f"E{i:04d}") for i in range(1205)]
+        salida = self._importar(filas, page_size=500)
+        self.assertIn("Processed: 1205", salida)
+        self.assertEqual(EstacioCarrega.objects.count(), 1205)
+
+    def test_fuente_vacia_no_da_de_baja(self):
+        self._importar([_fila("E1")])
+        self._importar([])
+        self.assertFalse(EstacioCarrega.objects.get(pk="E1").fuera_de_servicio)
+
+    def test_reimportar_sin_cambios_no_escribe(self):
+        filas = [_fila(f"E{i}", nplaces_estaci="") for i in range(50)]
+        self._importar(filas)
+        nplaces = dict(EstacioCarrega.objects.values_list("pk", "nplaces"))
+
+        with CaptureQueriesContext(connection) as consultas:
+            salida = self._importar(filas)
+        self.assertIn("Unchanged: 50", salida)
+        # Una consulta para comparar el lote y otra para buscar bajas
+        self.assertEqual(len(consultas), 2)
+        # Las plazas inventadas al crear no cambian en cada sincronización
+        self.assertEqual(dict(EstacioCarrega.objects.values_list("pk", "nplaces")), nplaces)
+
+    def test_estacion_que_vuelve_se_reactiva(self):
+        self._importar([_fila("E1"), _fila("E2")])
+        self._importar([_fila("E1")])
+        self.assertTrue(EstacioCarrega.objects.get(pk="E2").fuera_de_servicio)
+
+        salida = self._importar([_fila("E1"), _fila("E2")])
+        self.assertIn("Reactivated: 1", salida)
+        e2 = EstacioCarrega.objects.get(pk="E2")
+        self.assertFalse(e2.fuera_de_servicio)
+        self.assertIsNone(e2.motivo_fuera_servicio)
+
+    def test_estaciones_manuales_no_se_dan_de_baja(self):
+        EstacioCarrega.objects.create(
+            id_punt="MANUAL", lat=41.0, lng=2.0, gestio="Pública", tipus_acces="Lliure", potencia=22
+        )
+        self._importar([_fila("E1")])
+        self.assertFalse(EstacioCarrega.objects.get(pk="MANUAL").fuera_de_servicio)
+
+    def test_dry_run_no_aplica_cambios(self):
+        self._importar([_fila("E1")])
+        salida = self._importar([_fila("E2")], dry_run=True, verbosity=2)
+        self.assertIn("+ E2", salida)
+        self.assertIn("- E1", salida)
+        self.assertEqual(list(EstacioCarrega.objects.values_list("pk", flat=True)), ["E1"])
+        self.assertFalse(EstacioCarrega.objects.get(pk="E1").fuera_de_servicio)
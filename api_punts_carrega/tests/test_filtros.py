@@ -2,7 +2,8 @@ from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from api_punts_carrega.models import EstacioCarrega, TipusCarregador, TipusVelocitat
+from rest_framework.authtoken.models import Token
+from api_punts_carrega.models import EstacioCarrega, TipusCarregador, TipusVelocitat, Usuario, Vehicle
 
 class TestFiltros(TestCase):
     """Tests para todas las funcionalidades relacionadas con filtros"""
@@ -362,4 +363,40 @@ class TestFiltros(TestCase):
         url = reverse('filtrar_estacions') + f'?potencia_min=200&velocitat={self.velocitat_lenta.id_velocitat}'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)  # No hay resultados
\ No newline at end of file
+        self.assertEqual(len(response.data), 0)  # No hay resultados
+
+    def _vehicle_ccs(self):
+        usuari = Usuario.objects.create_user(username='conductor', email='conductor@example.com', password='pw')
+        vehicle = Vehicle.objects.create(
+            matricula="CCS001", propietari=usuari, marca="M", model="X", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=70.0
+        )
+        vehicle.tipus_carregador.add(self.carregador_ccs)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=usuari).key}')
+        return vehicle
+
+    def test_filtrar_estacions_vehicle(self):
+        """Test para filtrar estaciones compatibles con un vehículo del usuario"""
+        vehicle = self._vehicle_ccs()
+        url = reverse('filtrar_estacions') + f'?vehicle={vehicle.matricula}&potencia_min=100'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([estacion['id_punt'] for estacion in response.data], ['estacio_test_3'])
+
+        # Al añadir un cargador al vehículo cambia el resultado sin esperar a la caché
+        vehicle.tipus_carregador.add(self.carregador_tipus1)
+        response = self.client.get(reverse('filtrar_estacions') + f'?vehicle={vehicle.matricula}')
+        ids_estaciones = {estacion['id_punt'] for estacion in response.data}
+        self.assertEqual(ids_estaciones, {'estacio_test_1', 'estacio_test_3', 'estacio_test_4'})
+
+    def test_filtrar_estacions_vehicle_ajeno_o_inexistente(self):
+        """Test para filtrar por un vehículo que no es del usuario"""
+        self.assertEqual(
+            self.client.get(reverse('filtrar_estacions') + '?vehicle=CCS001').status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+        self._vehicle_ccs()
+        self.assertEqual(
+            self.client.get(reverse('filtrar_estacions') + '?vehicle=NOEXISTE').status_code,
+            status.HTTP_404_NOT_FOUND
+        )
@@ -0,0 +1,24 @@
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+from api_punts_carrega.geo import haversine_distance, haversine_distances, k_menores
+
+
+class TestGeo(SimpleTestCase):
+    def test_kernel_vectorizado_coincide_con_escalar(self):
+        rng = random.Random(7)
+        lats = [rng.uniform(-80, 80) for _ in range(500)]
+        lngs = [rng.uniform(-179, 179) for _ in range(500)]
+        distancias = haversine_distances(41.3856, 2.1737, lats, lngs)
+        for lat, lng, distancia in zip(lats, lngs, distancias):
+            self.assertAlmostEqual(distancia, haversine_distance(41.3856, 2.1737, lat, lng), places=6)
+
+    def test_mismo_punto_distancia_cero(self):
+        self.assertEqual(haversine_distances(41.0, 2.0, [41.0], [2.0])[0], 0.0)
+
+    def test_k_menores_ordenado(self):
+        distancias = np.array([5.0, 1.0, 4.0, 3.0, 2.0, 0.5])
+        self.assertEqual(list(k_menores(distancias, 3)), [5, 1, 4])
+        self.assertEqual(list(k_menores(distancias, 10)), [5, 1, 4, 3, 2, 0])
+        self.assertEqual(len(k_menores(np.array([]), 3)), 0)
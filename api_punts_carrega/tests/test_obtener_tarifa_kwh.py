@@ -1,8 +1,13 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from io import StringIO
 import json
 
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
 # --- Simulación / Importación de dependencias ---
 try:
     from rest_framework.response import Response
@@ -46,13 +51,19 @@ except ImportError:
 # --- Importa tu función desde la ubicación correcta ---
 try:
     from api_punts_carrega.views import obtenir_preu_actual_kwh
+    from api_punts_carrega.models import PreciosElectricidad
 except ImportError:
     print("ADVERTENCIA: No se pudo importar 'obtenir_preu_actual_kwh' desde 'api_punts_carrega.views'.")
     def obtenir_preu_actual_kwh(request):
         return Response({"error": "Función no implementada localmente"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # --- Clase de Tests ---
-class ObtenirPreuActualKwhTests(unittest.TestCase):
+# La vista guarda los precios en la base de datos: TestCase deshace los cambios entre tests
+class ObtenirPreuActualKwhTests(TestCase):
+
+    def setUp(self):
+        # Los errores de REE se recuerdan un rato en la caché
+        cache.clear()
 
     # --- Método _get_mock_request CORREGIDO ---
     def _get_mock_request(self):
@@ -61,7 +72,7 @@ class ObtenirPreuActualKwhTests(unittest.TestCase):
         request = factory.get('/api/preu-kwh/')
         return request
 
-    @patch('api_punts_carrega.views.requests.get')
+    @patch('api_punts_carrega.precios_ree.requests.get')
     def test_obtenir_preu_success(self, mock_requests_get):
         # ... (resto del código del test sin cambios) ...
         mock_api_response_data = { "data": { "type": "Precio mercado spot diario", "id": "datos-mercados-precios-mercados-tiempo-real", "attributes": {"title": "Precio mercado spot diario", "last-update": "2023-10-27T15:20:00+02:00", "description": None}, "meta": {"cache-expire-date": "2023-10-27T15:25:00+02:00"} }, "included": [ { "type": "Precios mercado spot (€/MWh)", "id": "10210", "groupId": None, "attributes": { "title": "PVPC (€/MWh)", "description": None, "color": "#00447e", "type": None, "magnitude": None, "composite": False, "step": False, "values": [ {"value": 100.50, "percentage": 0.345, "datetime": "2023-10-27T00:00:00+02:00"}, {"value": 95.20, "percentage": 0.335, "datetime": "2023-10-27T01:00:00+02:00"}, {"value": None, "percentage": 0.335, "datetime": "2023-10-27T02:00:00+02:00"}, {"value": 98.0, "percentage": 0.335, "datetime": None}, ] } } ] }
@@ -90,7 +101,7 @@ class ObtenirPreuActualKwhTests(unittest.TestCase):
         mock_requests_get.assert_called_once()
 
 
-    @patch('api_punts_carrega.views.requests.get')
+    @patch('api_punts_carrega.precios_ree.requests.get')
     def test_obtenir_preu_api_http_error(self, mock_requests_get):
         # ... (resto del código del test sin cambios) ...
         mock_response = MagicMock()
@@ -110,7 +121,7 @@ class ObtenirPreuActualKwhTests(unittest.TestCase):
         self.assertIn("Error al obtener datos de REE: Recurso no encontrado", response.data['error'])
 
 
-    @patch('api_punts_carrega.views.requests.get')
+    @patch('api_punts_carrega.precios_ree.requests.get')
     def test_obtenir_preu_api_timeout(self, mock_requests_get):
         # ... (resto del código del test sin cambios) ...
         mock_requests_get.side_effect = requests.Timeout("Tiempo de espera agotado")
@@ -124,7 +135,7 @@ class ObtenirPreuActualKwhTests(unittest.TestCase):
         self.assertEqual(response.data['error'], "Timeout conectando con API REE") # <-- Cambiado
 
 
-    @patch('api_punts_carrega.views.requests.get')
+    @patch('api_punts_carrega.precios_ree.requests.get')
     def test_obtenir_preu_api_no_relevant_data(self, mock_requests_get):
         # ... (resto del código del test sin cambios) ...
         mock_api_response_data = { "data": {}, "included": [] }
@@ -141,6 +152,76 @@ class ObtenirPreuActualKwhTests(unittest.TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn('error', response.data)
         self.assertEqual(response.data['error'], "No se encontraron datos horarios en la respuesta de la API REE")
+
+
+def _respuesta_ree(precios_mwh):
+    values = [
+        {"value": precio, "datetime": f"2023-10-27T{hora:02d}:00:00+02:00"} for hora, precio in enumerate(precios_mwh)
+    ]
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"included": [{"attributes": {"values": values}}]}
+    mock_response.raise_for_status.return_value = None
+    return mock_response
+
+
+class AlmacenPreciosReeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _get(self):
+        return obtenir_preu_actual_kwh(APIRequestFactory().get('/api/preu-kwh/'))
+
+    @patch('api_punts_carrega.precios_ree.requests.get')
+    def test_segunda_peticion_no_llama_a_ree(self, mock_requests_get):
+        mock_requests_get.return_value = _respuesta_ree([100.0, 90.0])
+        primera = self._get()
+        segunda = self._get()
+
+        mock_requests_get.assert_called_once()
+        self.assertEqual(segunda.status_code, status.HTTP_200_OK)
+        self.assertEqual(segunda.data['precios_hoy'], primera.data['precios_hoy'])
+        self.assertFalse(segunda.data['obsoleto'])
+        self.assertIn('Last-Modified', segunda)
+
+    @patch('api_punts_carrega.precios_ree.requests.get')
+    def test_ree_caido_sirve_los_ultimos_precios_guardados(self, mock_requests_get):
+        ayer = date.today() - timedelta(days=1)
+        PreciosElectricidad.objects.create(fecha=ayer, precios=[{"hora": "00:00", "precio_kwh": 0.1}])
+        mock_requests_get.side_effect = requests.Timeout("Tiempo de espera agotado")
+
+        response = self._get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['obsoleto'])
+        self.assertEqual(response.data['fecha'], ayer.strftime("%d/%m/%Y"))
+        self.assertIn('Stale', response['Warning'])
+
+    @patch('api_punts_carrega.precios_ree.requests.get')
+    def test_ree_caido_no_se_vuelve_a_llamar_enseguida(self, mock_requests_get):
+        mock_requests_get.side_effect = requests.Timeout("Tiempo de espera agotado")
+
+        primera = self._get()
+        segunda = self._get()
+
+        mock_requests_get.assert_called_once()
+        self.assertEqual(primera.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(segunda.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(segunda.data, primera.data)
+
+    @patch('api_punts_carrega.precios_ree.requests.get')
+    def test_comando_guarda_hoy_y_manana(self, mock_requests_get):
+        mock_requests_get.side_effect = [_respuesta_ree([100.0] * 24), _respuesta_ree([])]
+        salida = StringIO()
+
+        call_command('actualizar_precios_ree', stdout=salida)
+
+        self.assertEqual(mock_requests_get.call_count, 2)
+        self.assertEqual(len(PreciosElectricidad.objects.get(fecha=date.today()).precios), 24)
+        self.assertFalse(PreciosElectricidad.objects.filter(fecha=date.today() + timedelta(days=1)).exists())
+        self.assertIn("not published yet", salida.getvalue())
+
 # --- Ejecutar los tests ---
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
@@ -0,0 +1,202 @@
+import json
+import random
+from datetime import date, time, timedelta
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, OcupacionFranja, Reserva, Usuario
+from api_punts_carrega.ocupacion import (
+    PerfilOcupacion, hay_plaza_libre, intervalo_absoluto, intervalos_reservas_estaciones
+)
+
+
+class TestPerfilOcupacion(SimpleTestCase):
+    def _fuerza_bruta(self, intervalos, inicio, fin):
+        # Con extremos enteros basta con mirar cada segundo del rango
+        return max(
+            (sum(1 for a, b in intervalos if a <= t < b) for t in range(inicio, fin)),
+            default=0
+        )
+
+    def test_coincide_con_fuerza_bruta(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            intervalos = []
+            for _ in range(rng.randint(0, 15)):
+                a = rng.randint(-20, 100)
+                intervalos.append((a, a + rng.randint(1, 40)))
+            perfil = PerfilOcupacion(intervalos)
+            for _ in range(20):
+                inicio = rng.randint(-30, 130)
+                fin = inicio + rng.randint(1, 60)
+                self.assertEqual(
+                    perfil.ocupacion_maxima(inicio, fin), self._fuerza_bruta(intervalos, inicio, fin)
+                )
+
+    def test_maximos_por_franja(self):
+        # La primera empieza antes de la franja 0 y las dos siguientes coinciden entre 15 y 20
+        perfil = PerfilOcupacion([(-5, 5), (10, 20), (15, 30), (40, 50)])
+        self.assertEqual(perfil.maximos_por_franja(10, 6), [1, 2, 1, 0, 1, 0])
+        self.assertEqual(PerfilOcupacion([]).maximos_por_franja(10, 3), [0, 0, 0])
+
+    def test_reservas_consecutivas_no_se_solapan(self):
+        perfil = PerfilOcupacion([(0, 10), (10, 20)])
+        self.assertEqual(perfil.ocupacion_maxima(0, 20), 1)
+        self.assertEqual(perfil.ocupacion_maxima(20, 30), 0)
+
+    def test_franjas_libres(self):
+        perfil = PerfilOcupacion([(10, 20), (15, 30), (40, 50)])
+        self.assertEqual(
+            perfil.franjas_libres(2, 0, 60),
+            [(0, 15, 1), (20, 60, 1)]
+        )
+        self.assertEqual(perfil.franjas_libres(1, 0, 60), [(0, 10, 1), (30, 40, 1), (50, 60, 1)])
+        self.assertEqual(perfil.franjas_libres(1, 0, 60, duracion_minima=11), [])
+
+
+class TestOcupacionReservas(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Usuario.objects.create_user(username='ocupacion', email='ocupacion@example.com', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.estacio = EstacioCarrega.objects.create(
+            id_punt="OCUP-1", lat=41.3, lng=2.1, nplaces="2", gestio="TestG", tipus_acces="TestA"
+        )
+
+    def _reserva(self, fecha, hora, horas):
+        return Reserva.objects.create(
+            usuario=self.user, estacion=self.estacio, fecha=fecha, hora=hora, duracion=timedelta(hours=horas)
+        )
+
+    def _crear(self, fecha, hora, duracion):
+        return self.client.post(
+            reverse('reserva-crear'),
+            data=json.dumps({"estacion": self.estacio.id_punt, "fecha": fecha, "hora": hora, "duracion": duracion}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_cuenta_ocupacion_simultanea_y_no_solapamientos(self):
+        # 10-11 y 11-12 nunca coinciden: una reserva de 10 a 12 cabe en una estación de 2 plazas
+        self._reserva(date(2025, 5, 1), time(10, 0), 1)
+        self._reserva(date(2025, 5, 1), time(11, 0), 1)
+        self.assertEqual(self._crear("01/05/2025", "10:00", "02:00").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._crear("01/05/2025", "10:30", "00:15").status_code, status.HTTP_409_CONFLICT)
+
+    def test_reservas_que_cruzan_medianoche(self):
+        self._reserva(date(2025, 5, 1), time(23, 0), 3)
+        self._reserva(date(2025, 5, 1), time(23, 30), 2)
+        self.assertEqual(self._crear("02/05/2025", "00:30", "01:00").status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self._crear("02/05/2025", "01:30", "01:00").status_code, status.HTTP_201_CREATED)
+
+    def test_intervalos_solo_de_los_dias_de_cada_estacion(self):
+        otra = EstacioCarrega.objects.create(
+            id_punt="OCUP-2", lat=41.3, lng=2.1, nplaces="2", gestio="TestG", tipus_acces="TestA"
+        )
+        vispera = self._reserva(date(2025, 4, 30), time(23, 0), 2)
+        self._reserva(date(2025, 5, 10), time(10, 0), 1)
+        Reserva.objects.create(
+            usuario=self.user, estacion=otra, fecha=date(2025, 5, 1), hora=time(10, 0), duracion=timedelta(hours=1)
+        )
+
+        # Las reservas de self.estacio el día 10 quedan entre las fechas pedidas pero no son de su par
+        intervalos = intervalos_reservas_estaciones([(self.estacio.pk, date(2025, 5, 1)), (otra.pk, date(2025, 5, 20))])
+        self.assertEqual(intervalos, {
+            self.estacio.pk: [intervalo_absoluto(vispera.fecha, vispera.hora, vispera.duracion)],
+            otra.pk: [],
+        })
+        self.assertEqual(intervalos_reservas_estaciones([]), {})
+
+    def test_endpoint_franjas_libres(self):
+        self._reserva(date(2025, 5, 1), time(10, 0), 2)
+        self._reserva(date(2025, 5, 1), time(11, 0), 2)
+        url = reverse('estaciocarrega-franjas-libres', kwargs={'pk': self.estacio.pk})
+
+        response = self.client.get(url, {'dia': '01/05/2025'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nplaces'], 2)
+        self.assertEqual(response.data['franjas'], [
+            {'inicio': '00:00', 'fin': '11:00', 'places_lliures': 1},
+            {'inicio': '12:00', 'fin': '24:00', 'places_lliures': 1},
+        ])
+
+        response = self.client.get(url, {'dia': '01/05/2025', 'duracion': '12:00'})
+        self.assertEqual(response.data['franjas'], [{'inicio': '12:00', 'fin': '24:00', 'places_lliures': 1}])
+
+    def test_endpoint_franjas_libres_parametros_invalidos(self):
+        url = reverse('estaciocarrega-franjas-libres', kwargs={'pk': self.estacio.pk})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'dia': '2025-05-01'}).status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('estaciocarrega-franjas-libres', kwargs={'pk': 'NO-EXISTE'})
+        self.assertEqual(self.client.get(url, {'dia': '01/05/2025'}).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestOcupacionFranjas(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Usuario.objects.create_user(username='franjas', email='franjas@example.com', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = f'Token {self.token.key}'
+        self.estacio = EstacioCarrega.objects.create(
+            id_punt="FRANJA-1", lat=41.3, lng=2.1, nplaces="1", gestio="TestG", tipus_acces="TestA"
+        )
+
+    def _franjas(self, dia='01/05/2025'):
+        url = reverse('estaciocarrega-ocupacion', kwargs={'pk': self.estacio.pk})
+        return self.client.get(url, {'dia': dia}).data['franjas']
+
+    def test_se_mantiene_al_crear_modificar_y_eliminar(self):
+        response = self.client.post(
+            reverse('reserva-crear'),
+            data=json.dumps({"estacion": self.estacio.id_punt, "fecha": "01/05/2025", "hora": "10:10", "duracion": "00:30"}),
+            content_type='application/json', HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        franjas = self._franjas()
+        self.assertEqual(len(franjas), 96)
+        # 10:10-10:40 toca las franjas 10:00, 10:15 y 10:30
+        self.assertEqual([i for i, n in enumerate(franjas) if n], [40, 41, 42])
+
+        reserva = Reserva.objects.get()
+        response = self.client.put(
+            reverse('reserva-modificar', kwargs={'pk': reserva.pk}),
+            data=json.dumps({"hora": "23:45", "duracion": "00:30"}),
+            content_type='application/json', HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([i for i, n in enumerate(self._franjas()) if n], [95])
+        self.assertEqual([i for i, n in enumerate(self._franjas('02/05/2025')) if n], [0])
+
+        response = self.client.delete(reverse('reserva-eliminar', kwargs={'pk': reserva.pk}), HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(self._franjas()))
+        self.assertFalse(OcupacionFranja.objects.exists())
+
+    def test_conflicto_en_franja_se_resuelve_con_el_perfil_exacto(self):
+        # Misma franja (10:00-10:15) pero sin coincidir en el tiempo
+        Reserva.objects.create(
+            usuario=self.user, estacion=self.estacio, fecha=date(2025, 5, 1),
+            hora=time(10, 0), duracion=timedelta(minutes=5)
+        )
+        response = self.client.post(
+            reverse('reserva-crear'),
+            data=json.dumps({"estacion": self.estacio.id_punt, "fecha": "01/05/2025", "hora": "10:05", "duracion": "00:10"}),
+            content_type='application/json', HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._franjas()[40], 2)
+
+    def test_comprobacion_sin_conflicto_no_lee_reservas(self):
+        Reserva.objects.create(
+            usuario=self.user, estacion=self.estacio, fecha=date(2025, 5, 1),
+            hora=time(10, 0), duracion=timedelta(hours=1)
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(hay_plaza_libre(self.estacio, date(2025, 5, 1), time(12, 0), timedelta(hours=1)))
+        self.assertEqual(len(consultas), 1)
+        self.assertNotIn('"api_punts_carrega_reserva"', consultas[0]['sql'])
@@ -0,0 +1,34 @@
+import json
+
+from django.test import SimpleTestCase
+from api_punts_carrega.opendata import iterar_array_json
+
+
+class TestIterarArrayJson(SimpleTestCase):
+    def setUp(self):
+        self.registros = [
+            {"id": "E1", "municipi": "Lleida", "kw": "22"},
+            {"id": "E2", "adre_a": "Carrer d'Àngel Guimerà, 3", "nested": {"a": [1, 2, {"b": "]"}]}},
+            12345,
+            "text amb \"cometes\" i ,]",
+            None,
+        ]
+        self.texto = json.dumps(self.registros, ensure_ascii=False, indent=1)
+
+    def test_fragmentos_de_cualquier_tamano(self):
+        for tamano in [1, 2, 3, 7, 64, len(self.texto)]:
+            fragmentos = [self.texto[i:i + tamano] for i in range(0, len(self.texto), tamano)]
+            self.assertEqual(list(iterar_array_json(fragmentos)), self.registros)
+
+    def test_array_vacio(self):
+        self.assertEqual(list(iterar_array_json([" [ ", " ] "])), [])
+
+    def test_json_truncado(self):
+        with self.assertRaises(ValueError):
+            list(iterar_array_json([self.texto[:-10]]))
+        with self.assertRaises(ValueError):
+            list(iterar_array_json([self.texto[:-1]]))
+
+    def test_no_es_un_array(self):
+        with self.assertRaises(ValueError):
+            list(iterar_array_json(['{"id": 1}']))
@@ -0,0 +1,81 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, TipusCarregador
+
+
+class TestPaginacionEstaciones(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.carregador = TipusCarregador.objects.create(
+            id_carregador="tipus2",
+            nom_tipus="Tipus 2",
+            tipus_connector="Connector Tipus 2",
+            tipus_corrent="Corrent alterna"
+        )
+        for i in range(25):
+            estacio = EstacioCarrega.objects.create(
+                id_punt=f"estacio_{i:02d}",
+                lat=41.38 + i * 0.001,
+                lng=2.17,
+                gestio="Pública",
+                tipus_acces="Lliure",
+                potencia=10 * i
+            )
+            estacio.tipus_carregador.add(self.carregador)
+        self.estacions_url = reverse('estaciocarrega-list')
+
+    def _recorrer_paginas(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(e['id_punt'] for e in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_sin_parametros_devuelve_lista_completa(self):
+        response = self.client.get(self.estacions_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 25)
+
+    def test_paginacion_por_cursor(self):
+        response = self.client.get(self.estacions_url + '?page_size=10')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+
+        ids = self._recorrer_paginas(self.estacions_url + '?page_size=10')
+        self.assertEqual(ids, [f"estacio_{i:02d}" for i in range(25)])
+
+    def test_paginacion_en_filtros(self):
+        url = reverse('filtrar_per_potencia') + '?min=100&page_size=5'
+        ids = self._recorrer_paginas(url)
+        self.assertEqual(ids, [f"estacio_{i:02d}" for i in range(10, 25)])
+
+        url = reverse('filtrar_estacions') + '?tipus_carregador=tipus2&page_size=7'
+        self.assertEqual(len(self._recorrer_paginas(url)), 25)
+
+    def test_streaming_devuelve_el_mismo_contenido(self):
+        esperado = self.client.get(reverse('filtrar_per_carregador') + '?id=tipus2').data
+
+        response = self.client.get(reverse('filtrar_per_carregador') + '?id=tipus2&stream=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        datos = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            sorted(datos, key=lambda e: e['id_punt']),
+            sorted(json.loads(json.dumps(esperado)), key=lambda e: e['id_punt'])
+        )
+
+    def test_streaming_en_listado(self):
+        response = self.client.get(self.estacions_url + '?stream=true')
+        datos = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([e['id_punt'] for e in datos], [f"estacio_{i:02d}" for i in range(25)])
+        self.assertEqual(datos[0]['tipus_carregador'], ['tipus2'])
+
+    def test_streaming_sin_resultados(self):
+        response = self.client.get(reverse('filtrar_per_potencia') + '?min=100000&stream=true')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
@@ -0,0 +1,67 @@
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, RefugioClimatico
+from api_punts_carrega.geo import caja_envolvente, haversine_distance
+
+
+class TestCajaEnvolvente(TestCase):
+    def test_caja_contiene_el_radio(self):
+        lat_min, lat_max, lng_min, lng_max = caja_envolvente(41.3851, 2.1734, 10)
+        # Los bordes de la caja quedan a 10 km o algo más, nunca menos
+        self.assertAlmostEqual(haversine_distance(41.3851, 2.1734, lat_max, 2.1734), 10, places=6)
+        self.assertGreaterEqual(haversine_distance(41.3851, 2.1734, 41.3851, lng_max), 10)
+        self.assertLess(haversine_distance(41.3851, 2.1734, 41.3851, lng_max), 10.1)
+        self.assertTrue(lat_min < 41.3851 < lat_max)
+
+    def test_caja_cerca_del_polo_cubre_todas_las_longitudes(self):
+        _, _, lng_min, lng_max = caja_envolvente(89.99, 0, 50)
+        self.assertEqual((lng_min, lng_max), (-180.0, 180.0))
+
+
+class TestProximidadConRadio(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        RefugioClimatico.objects.create(
+            id_punt="refugio_bcn", nombre="Refugio BCN", lat=41.3851, lng=2.1734
+        )
+        RefugioClimatico.objects.create(
+            id_punt="refugio_badalona", nombre="Refugio Badalona", lat=41.4500, lng=2.2474
+        )
+        RefugioClimatico.objects.create(
+            id_punt="refugio_madrid", nombre="Refugio Madrid", lat=40.4168, lng=-3.7038
+        )
+        EstacioCarrega.objects.create(
+            id_punt="estacio_bcn", lat=41.3855, lng=2.1736, gestio="Pública", tipus_acces="Lliure"
+        )
+        EstacioCarrega.objects.create(
+            id_punt="estacio_girona", lat=41.9794, lng=2.8214, gestio="Pública", tipus_acces="Lliure"
+        )
+
+    def test_refugios_con_radio(self):
+        url = reverse('refugios_mas_cercanos') + '?lat=41.3851&lng=2.1734&radio_km=20'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [r['refugio']['id_punt'] for r in response.data]
+        self.assertEqual(ids, ['refugio_bcn', 'refugio_badalona'])
+        self.assertTrue(all(r['distancia_km'] <= 20 for r in response.data))
+
+    def test_refugios_sin_radio_devuelve_todos(self):
+        url = reverse('refugios_mas_cercanos') + '?lat=41.3851&lng=2.1734'
+        response = self.client.get(url)
+        self.assertEqual([r['refugio']['id_punt'] for r in response.data],
+                         ['refugio_bcn', 'refugio_badalona', 'refugio_madrid'])
+
+    def test_punt_mes_proper_con_radio(self):
+        url = reverse('punt_mes_proper') + '?lat=41.3851&lng=2.1734&radio_km=50'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['estacio_carrega']['id_punt'] for r in response.data], ['estacio_bcn'])
+
+    def test_radio_invalido(self):
+        for radio in ['abc', '-5', '0']:
+            url = reverse('punt_mes_proper') + f'?lat=41.3851&lng=2.1734&radio_km={radio}'
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+            url = reverse('refugios_mas_cercanos') + f'?lat=41.3851&lng=2.1734&radio_km={radio}'
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
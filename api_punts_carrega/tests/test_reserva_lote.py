@@ -0,0 +1,143 @@
+import json
+from datetime import date, time, timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, Reserva, Usuario, Vehicle, TipusCarregador
+from api_punts_carrega.ocupacion import ocupacion_franjas_dia
+
+
+class TestCrearReservasLote(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Usuario.objects.create_user(username='flota', email='flota@example.com', password='pw')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+        ccs = TipusCarregador.objects.create(id_carregador="LOT-CCS", nom_tipus="CCS", tipus_connector="CCS2", tipus_corrent="DC")
+        chademo = TipusCarregador.objects.create(id_carregador="LOT-CHA", nom_tipus="CHAdeMO", tipus_connector="CHAdeMO", tipus_corrent="DC")
+
+        self.vehicle = Vehicle.objects.create(
+            matricula="FLOTA1", propietari=self.user, marca="M", model="X", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=70.0
+        )
+        self.vehicle.tipus_carregador.add(ccs)
+        self.incompatible = Vehicle.objects.create(
+            matricula="FLOTA2", propietari=self.user, marca="M", model="Y", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=70.0
+        )
+        self.incompatible.tipus_carregador.add(chademo)
+
+        self.una_plaza = EstacioCarrega.objects.create(
+            id_punt="LOT-1", lat=41.3, lng=2.1, nplaces="1", gestio="TestG", tipus_acces="TestA"
+        )
+        self.dos_plazas = EstacioCarrega.objects.create(
+            id_punt="LOT-2", lat=41.4, lng=2.2, nplaces="2", gestio="TestG", tipus_acces="TestA"
+        )
+        for estacio in (self.una_plaza, self.dos_plazas):
+            estacio.tipus_carregador.add(ccs)
+
+        Reserva.objects.create(
+            usuario=self.user, estacion=self.una_plaza, fecha=date(2025, 6, 1),
+            hora=time(10, 0), duracion=timedelta(hours=1)
+        )
+        self.url = reverse('reserva-crear-lote')
+
+    def _reserva(self, estacio, hora, duracion="01:00", vehicle="FLOTA1", fecha="01/06/2025"):
+        return {"estacion": estacio.id_punt, "fecha": fecha, "hora": hora, "duracion": duracion, "vehicle": vehicle}
+
+    def _post(self, reservas, **extra):
+        return self.client.post(
+            self.url, data=json.dumps({"reservas": reservas, **extra}), content_type='application/json'
+        )
+
+    def test_crea_todas_las_reservas(self):
+        response = self._post([
+            self._reserva(self.una_plaza, "12:00"),
+            self._reserva(self.dos_plazas, "10:00"),
+            self._reserva(self.dos_plazas, "10:30"),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['creadas'], 3)
+        self.assertEqual([r['status'] for r in response.data['resultados']], [201, 201, 201])
+        self.assertEqual(Reserva.objects.count(), 4)
+        # Las señales mantienen la tabla de franjas igual que en crear
+        self.assertEqual(ocupacion_franjas_dia(self.dos_plazas, date(2025, 6, 1))[42], 2)
+
+    def test_lote_atomico_no_crea_nada_si_una_falla(self):
+        response = self._post([
+            self._reserva(self.dos_plazas, "10:00"),
+            self._reserva(self.una_plaza, "10:30"),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['creadas'], 0)
+        self.assertEqual([r['status'] for r in response.data['resultados']], [424, 409])
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_lote_parcial_crea_las_que_caben(self):
+        response = self._post([
+            self._reserva(self.dos_plazas, "10:00"),
+            self._reserva(self.una_plaza, "10:30"),
+            self._reserva(self.una_plaza, "12:00", vehicle="FLOTA2"),
+            self._reserva(self.una_plaza, "12:00", fecha="31/02/2025"),
+        ], parcial=True)
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['creadas'], 1)
+        self.assertEqual([r['status'] for r in response.data['resultados']], [201, 409, 400, 400])
+        self.assertIn('no és compatible', response.data['resultados'][2]['error'])
+        self.assertTrue(Reserva.objects.filter(id=response.data['resultados'][0]['id']).exists())
+
+    def test_reservas_del_lote_compiten_entre_ellas(self):
+        response = self._post([
+            self._reserva(self.dos_plazas, "10:00"),
+            self._reserva(self.dos_plazas, "10:15"),
+            self._reserva(self.dos_plazas, "10:45"),
+            self._reserva(self.dos_plazas, "11:00"),
+        ], parcial=True)
+
+        self.assertEqual([r['status'] for r in response.data['resultados']], [201, 201, 409, 201])
+        self.assertEqual(Reserva.objects.filter(estacion=self.dos_plazas).count(), 3)
+
+    def test_estacion_y_vehiculo_inexistentes(self):
+        response = self._post([
+            {"estacion": "NO-EXISTE", "fecha": "01/06/2025", "hora": "10:00", "duracion": "01:00"},
+            self._reserva(self.dos_plazas, "10:00", vehicle="AJENO"),
+        ], parcial=True)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in response.data['resultados']], [404, 404])
+
+    def test_parcial_como_texto_de_formulario(self):
+        response = self.client.post(self.url, data=json.dumps({
+            "reservas": [self._reserva(self.dos_plazas, "10:00"), self._reserva(self.una_plaza, "10:30")],
+            "parcial": "false",
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertEqual(self._post([self._reserva(self.dos_plazas, "10:00")], parcial="potser").status_code, 400)
+
+    def test_estacion_o_vehiculo_que_no_son_texto(self):
+        reserva = self._reserva(self.dos_plazas, "10:00")
+        response = self._post([
+            {**reserva, "estacion": [self.dos_plazas.id_punt]},
+            {**reserva, "vehicle": {"matricula": "FLOTA1"}},
+            reserva,
+        ], parcial=True)
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['resultados']], [400, 400, 201])
+
+    def test_lote_vacio_o_demasiado_grande(self):
+        self.assertEqual(self._post([]).status_code, status.HTTP_400_BAD_REQUEST)
+        reservas = [self._reserva(self.dos_plazas, "10:00")] * 51
+        self.assertEqual(self._post(reservas).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requiere_autenticacion(self):
+        self.client.credentials()
+        self.assertIn(self._post([self._reserva(self.dos_plazas, "10:00")]).status_code, [401, 403])
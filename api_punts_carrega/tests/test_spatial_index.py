@@ -0,0 +1,119 @@
+import math
+import random
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega
+from api_punts_carrega.geo import RADIO_TIERRA_KM, haversine_distance
+from api_punts_carrega.spatial_index import indice_estaciones
+
+
+LAT_CENTRO, LNG_CENTRO = 41.3856, 2.1737
+KM_POR_CENTESIMA = math.radians(0.01) * RADIO_TIERRA_KM
+
+
+class TestIndiceEspacialAleatorio(TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.coordenadas = {}
+        for i in range(300):
+            lat = rng.uniform(40.5, 42.9)
+            lng = rng.uniform(0.2, 3.3)
+            id_punt = f"estacio_{i}"
+            EstacioCarrega.objects.create(
+                id_punt=id_punt,
+                lat=lat,
+                lng=lng,
+                gestio="Pública",
+                tipus_acces="Lliure",
+                potencia=22
+            )
+            self.coordenadas[id_punt] = (lat, lng)
+
+    def _fuerza_bruta(self, lat, lng, k):
+        distancias = [
+            (id_punt, haversine_distance(lat, lng, lat_e, lng_e))
+            for id_punt, (lat_e, lng_e) in self.coordenadas.items()
+        ]
+        distancias.sort(key=lambda x: x[1])
+        return distancias[:k]
+
+    def test_coincide_con_fuerza_bruta(self):
+        for lat, lng in [(41.3856, 2.1737), (42.5, 0.5), (40.0, 4.0), (45.0, -1.0)]:
+            esperado = self._fuerza_bruta(lat, lng, 25)
+            obtenido = indice_estaciones.k_mas_cercanos(lat, lng, 25)
+            self.assertEqual([i for i, _ in obtenido], [i for i, _ in esperado])
+            for (_, d1), (_, d2) in zip(obtenido, esperado):
+                self.assertAlmostEqual(d1, d2, places=6)
+
+
+class TestIndiceEspacial(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # estacio_i queda a (i + 1) centésimas de grado del centro, alternando norte y sur
+        for i in range(70):
+            signo = 1 if i % 2 == 0 else -1
+            EstacioCarrega.objects.create(
+                id_punt=f"estacio_{i}",
+                lat=LAT_CENTRO + signo * (i + 1) * 0.01,
+                lng=LNG_CENTRO,
+                gestio="Pública",
+                tipus_acces="Lliure",
+                potencia=22
+            )
+
+    def test_ordena_por_distancia(self):
+        obtenido = indice_estaciones.k_mas_cercanos(LAT_CENTRO, LNG_CENTRO, 3)
+        self.assertEqual([i for i, _ in obtenido], ["estacio_0", "estacio_1", "estacio_2"])
+        for (_, distancia), centesimas in zip(obtenido, (1, 2, 3)):
+            self.assertAlmostEqual(distancia, centesimas * KM_POR_CENTESIMA, places=3)
+
+    def test_admitidos_restringe_los_candidatos(self):
+        admitidos = {"estacio_3", "estacio_10", "estacio_40", "estacio_2"}
+        obtenido = indice_estaciones.k_mas_cercanos(LAT_CENTRO, LNG_CENTRO, 3, admitidos=admitidos)
+        self.assertEqual([i for i, _ in obtenido], ["estacio_2", "estacio_3", "estacio_10"])
+
+    def test_radio_descarta_lejanas(self):
+        # 26 centésimas son 28.94 km y 27 ya son 30.06 km
+        obtenido = indice_estaciones.k_mas_cercanos(LAT_CENTRO, LNG_CENTRO, 70, radio_km=30)
+        self.assertEqual([i for i, _ in obtenido], [f"estacio_{i}" for i in range(26)])
+
+    def test_se_reconstruye_al_cambiar_estaciones(self):
+        indice_estaciones.k_mas_cercanos(41.0, 1.0, 1)
+        EstacioCarrega.objects.create(
+            id_punt="estacio_nova",
+            lat=41.0,
+            lng=1.0,
+            gestio="Pública",
+            tipus_acces="Lliure",
+            potencia=50
+        )
+        self.assertEqual(indice_estaciones.k_mas_cercanos(41.0, 1.0, 1)[0][0], "estacio_nova")
+
+        EstacioCarrega.objects.get(id_punt="estacio_nova").delete()
+        self.assertNotEqual(indice_estaciones.k_mas_cercanos(41.0, 1.0, 1)[0][0], "estacio_nova")
+
+    def test_ve_cambios_de_otro_proceso(self):
+        from django.core.cache import cache
+        from api_punts_carrega.models import VersionDatos
+        from api_punts_carrega.spatial_index import CLAVE_VERSION_ESTACIONES
+
+        indice_estaciones.k_mas_cercanos(41.0, 1.0, 1)
+        # Otro proceso (p. ej. el comando de importación) no lanza señales aquí ni comparte la caché
+        EstacioCarrega.objects.filter(id_punt="estacio_7").update(lat=41.0, lng=1.0)
+        VersionDatos.objects.filter(clave=CLAVE_VERSION_ESTACIONES).update(version="otro_proceso")
+        cache.clear()
+
+        self.assertEqual(indice_estaciones.k_mas_cercanos(41.0, 1.0, 1)[0][0], "estacio_7")
+
+    def test_punt_mes_proper_limita_resultados(self):
+        url = reverse('punt_mes_proper') + '?lat=41.3856&lng=2.1737'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 60)
+        self.assertEqual(
+            [r['estacio_carrega']['id_punt'] for r in response.data],
+            [f"estacio_{i}" for i in range(60)]
+        )
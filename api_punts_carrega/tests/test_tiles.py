@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega
+from api_punts_carrega.tiles import limites_tile
+
+
+class TestTilesEstacions(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        # Dos estaciones casi en el mismo sitio (Barcelona) y una aislada (Manresa)
+        for id_punt, lat, lng in [
+            ("bcn_1", 41.3856, 2.1737),
+            ("bcn_2", 41.3857, 2.1738),
+            ("manresa", 41.6, 1.6),
+        ]:
+            EstacioCarrega.objects.create(
+                id_punt=id_punt,
+                lat=lat,
+                lng=lng,
+                gestio="Pública",
+                tipus_acces="Lliure",
+                potencia=22
+            )
+
+    def _url(self, z, x, y):
+        return reverse('tile_estacions', args=[z, x, y])
+
+    def test_limites_tile(self):
+        lat_min, lat_max, lng_min, lng_max = limites_tile(0, 0, 0)
+        self.assertAlmostEqual(lng_min, -180.0)
+        self.assertAlmostEqual(lng_max, 180.0)
+        self.assertAlmostEqual(lat_max, 85.0511, places=3)
+        self.assertAlmostEqual(lat_min, -85.0511, places=3)
+
+    def test_tile_agrupa_estaciones_cercanas(self):
+        # Tesela de zoom 8 que contiene Barcelona y Manresa
+        response = self.client.get(self._url(8, 129, 95))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(response.data['clusters']), 1)
+        self.assertEqual(response.data['clusters'][0]['num_estacions'], 2)
+        self.assertEqual([e['id_punt'] for e in response.data['estacions']], ["manresa"])
+        self.assertEqual(
+            set(response.data['estacions'][0].keys()),
+            {'id_punt', 'lat', 'lng', 'potencia', 'fuera_de_servicio'}
+        )
+
+    def test_tile_sin_estaciones(self):
+        response = self.client.get(self._url(8, 0, 0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['estacions'], [])
+        self.assertEqual(response.data['clusters'], [])
+
+    def test_tile_fuera_de_rango(self):
+        response = self.client.get(self._url(3, 8, 0))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tile_se_sirve_de_cache(self):
+        self.client.get(self._url(8, 129, 95))
+        # Solo se lee la versión de las estaciones
+        with self.assertNumQueries(1):
+            response = self.client.get(self._url(8, 129, 95))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cambio_en_estacion_invalida_tile(self):
+        self.client.get(self._url(8, 129, 95))
+        estacio = EstacioCarrega.objects.get(id_punt="manresa")
+        estacio.fuera_de_servicio = True
+        estacio.save()
+
+        response = self.client.get(self._url(8, 129, 95))
+        self.assertTrue(response.data['estacions'][0]['fuera_de_servicio'])
+
+    def test_importacion_de_otro_proceso_invalida_tile(self):
+        from api_punts_carrega.models import VersionDatos
+        from api_punts_carrega.spatial_index import CLAVE_VERSION_ESTACIONES
+
+        self.client.get(self._url(8, 129, 95))
+        # Cambio sin señales en este proceso, como el de fetch_charging_stations
+        EstacioCarrega.objects.filter(id_punt="manresa").update(fuera_de_servicio=True)
+        VersionDatos.objects.filter(clave=CLAVE_VERSION_ESTACIONES).update(version="importacion")
+
+        response = self.client.get(self._url(8, 129, 95))
+        self.assertTrue(response.data['estacions'][0]['fuera_de_servicio'])
@@ -0,0 +1,98 @@
+import random
+from datetime import date, time, timedelta
+
+from django.test import TestCase, SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api_punts_carrega.models import EstacioCarrega, PreciosElectricidad, Reserva, Usuario, Vehicle
+from api_punts_carrega.ventana_carga import costes_ventanas
+
+
+class TestCostesVentanas(SimpleTestCase):
+    def _fuerza_bruta(self, precios, potencia, energia):
+        costes = []
+        for inicio in range(len(precios)):
+            restante, coste = energia, 0.0
+            for franja in range(inicio, len(precios)):
+                if restante <= 1e-9 or precios[franja] is None:
+                    break
+                cargado = min(potencia * 0.25, restante)
+                coste += cargado * precios[franja]
+                restante -= cargado
+            costes.append(coste if restante <= 1e-9 else None)
+        return costes
+
+    def test_coincide_con_fuerza_bruta(self):
+        rng = random.Random(7)
+        precios = [round(rng.uniform(0.05, 0.3), 5) for _ in range(96)]
+        precios[40] = None
+        for potencia, energia in [(22, 35), (7, 10.5), (50, 3), (150, 80)]:
+            _, costes = costes_ventanas(precios, potencia, energia)
+            for obtenido, esperado in zip(costes, self._fuerza_bruta(precios, potencia, energia)):
+                if esperado is None:
+                    self.assertIsNone(obtenido)
+                else:
+                    self.assertAlmostEqual(obtenido, esperado, places=9)
+
+
+class TestVentanaCargaEconomica(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.manana = date.today() + timedelta(days=1)
+        # Más barato de 02:00 a 04:00, y algo menos barato de 13:00 a 15:00
+        precios = [0.30] * 24
+        precios[2] = precios[3] = 0.05
+        precios[13] = precios[14] = 0.08
+        PreciosElectricidad.objects.create(
+            fecha=self.manana, precios=[{'hora': f'{h:02d}:00', 'precio_kwh': p} for h, p in enumerate(precios)]
+        )
+        self.estacio = EstacioCarrega.objects.create(
+            id_punt="VENT-1", lat=41.3, lng=2.1, nplaces="1", potencia=10, gestio="TestG", tipus_acces="TestA"
+        )
+        self.user = Usuario.objects.create_user(username='ventana', email='ventana@example.com', password='pw')
+        Vehicle.objects.create(
+            matricula="VENT01", propietari=self.user, marca="M", model="X", any_model=2024,
+            carrega_actual=50.0, capacitat_bateria=40.0
+        )
+        self.url = reverse('estaciocarrega-ventana-carga-economica', kwargs={'pk': self.estacio.id_punt})
+        self.dia = self.manana.strftime('%d/%m/%Y')
+
+    def test_ventana_mas_barata(self):
+        response = self.client.get(self.url, {'dia': self.dia, 'energia_kwh': 20})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual((response.data['inicio'], response.data['fin']), ('02:00', '04:00'))
+        self.assertAlmostEqual(response.data['coste_estimado'], 1.0)
+
+    def test_evita_franjas_sin_plaza(self):
+        Reserva.objects.create(
+            usuario=self.user, estacion=self.estacio, fecha=self.manana, hora=time(3, 30), duracion=timedelta(minutes=15)
+        )
+        response = self.client.get(self.url, {'dia': self.dia, 'energia_kwh': 20})
+        self.assertEqual((response.data['inicio'], response.data['fin']), ('13:00', '15:00'))
+
+    def test_energia_desde_el_vehiculo(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        response = self.client.get(self.url, {'dia': self.dia, 'vehicle': 'VENT01'})
+        self.assertEqual(response.data['energia_kwh'], 20)
+        self.assertEqual(response.data['duracion'], '02:00')
+
+    def test_errores(self):
+        self.assertEqual(self.client.get(self.url, {'dia': self.dia}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.url, {'dia': self.dia, 'vehicle': 'VENT01'}).status_code, status.HTTP_404_NOT_FOUND
+        )
+        pasado_manana = (self.manana + timedelta(days=1)).strftime('%d/%m/%Y')
+        self.assertEqual(
+            self.client.get(self.url, {'dia': pasado_manana, 'energia_kwh': 5}).status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(
+            self.client.get(self.url, {'dia': self.dia, 'energia_kwh': 1000}).status_code, status.HTTP_404_NOT_FOUND
+        )
+        for energia in ('nan', 'inf', '-inf', '0', '-3'):
+            self.assertEqual(
+                self.client.get(self.url, {'dia': self.dia, 'energia_kwh': energia}).status_code,
+                status.HTTP_400_BAD_REQUEST, energia
+            )
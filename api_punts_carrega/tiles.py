@@ -0,0 +1,61 @@
+"""
+Teselas (z/x/y, Web Mercator) con las estaciones de carga ya agrupadas para el mapa.
+
+Los clústeres salen del motor precalculado de clustering.py: un clúster de una sola
+estación devuelve el punto compacto y uno con varias devuelve su centroide, el número de
+estaciones y la potencia total. El resultado se guarda en caché con la versión de las
+estaciones, que está en la base de datos (ver spatial_index.py): cualquier cambio en
+EstacioCarrega, hecho por este proceso, por otro o por el comando de importación, deja
+obsoletas todas las teselas en todos los procesos.
+"""
+import math
+
+from django.core.cache import cache
+
+from .clustering import clusters_estaciones, ZOOM_MAXIMO
+from .models import EstacioCarrega
+from .serializers import EstacioCarregaLiteSerializer
+from .spatial_index import obtener_version, CLAVE_VERSION_ESTACIONES
+
+TIMEOUT_CACHE_TILE = 60 * 60
+
+
+def tile_valido(z, x, y):
+    return 0 <= z <= ZOOM_MAXIMO and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def limites_tile(z, x, y):
+    """Devuelve (lat_min, lat_max, lng_min, lng_max) de la tesela."""
+    n = 2 ** z
+    lng_min = x / n * 360.0 - 180.0
+    lng_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lat_min, lat_max, lng_min, lng_max
+
+
+def construir_tile(z, x, y):
+    grupos = clusters_estaciones.clusters_en_tile(z, x, y)
+    ids = [grupo['id'] for grupo in grupos if grupo['num_estacions'] == 1]
+    estacions = EstacioCarrega.objects.filter(pk__in=ids).only(*EstacioCarregaLiteSerializer.Meta.fields)
+
+    punts = [dict(dades) for dades in EstacioCarregaLiteSerializer(estacions.order_by('pk'), many=True).data]
+    clusters = [
+        {
+            'lat': grupo['lat'],
+            'lng': grupo['lng'],
+            'num_estacions': grupo['num_estacions'],
+            'potencia_total': grupo['potencia_total'],
+        }
+        for grupo in grupos if grupo['num_estacions'] > 1
+    ]
+    return {'z': z, 'x': x, 'y': y, 'estacions': punts, 'clusters': clusters}
+
+
+def obtener_tile(z, x, y):
+    clave = f'tile_estaciones:{obtener_version(CLAVE_VERSION_ESTACIONES)}:{z}:{x}:{y}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = construir_tile(z, x, y)
+        cache.set(clave, datos, TIMEOUT_CACHE_TILE)
+    return datos
@@ -4,6 +4,9 @@ from .views import (
     PuntViewSet,
     EstacioCarregaViewSet,
     punt_mes_proper,
+    estacions_compatibles_properes,
+    tile_estacions,
+    clusters_estacions,
     TipusCarregadorViewSet,
     ReservaViewSet,
     obtenir_preu_actual_kwh,
@@ -39,6 +42,9 @@ router.register(r'trofeos', TrofeoViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('punt_mes_proper/', punt_mes_proper, name='punt_mes_proper'),
+    path('estacions_compatibles_properes/', estacions_compatibles_properes, name='estacions_compatibles_properes'),
+    path('estacions_tile/<int:z>/<int:x>/<int:y>/', tile_estacions, name='tile_estacions'),
+    path('clusters_estacions/', clusters_estacions, name='clusters_estacions'),
     path('preu_kwh/', obtenir_preu_actual_kwh, name='obtenir_preu_actual_kwh'),
     path('sincronizar_refugios/', sincronizar_refugios, name='sincronizar_refugios'),
     path('refugios_mas_cercanos/', refugios_mas_cercanos, name='refugios_mas_cercanos'),
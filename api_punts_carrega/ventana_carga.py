@@ -0,0 +1,94 @@
+"""
+Ventana de carga más barata de un día según los precios horarios de REE.
+
+El día se divide en las franjas de 15 minutos de ocupacion.py. Para una potencia y una
+energía la carga dura n franjas: todas a plena potencia menos la última, que solo carga
+lo que falta. El coste de empezar en cada franja sale de sumas prefijas de los precios,
+así que se calculan las FRANJAS_DIA ventanas en O(n) y se guardan en caché por (día,
+versión de los precios, potencia, energía redondeada al kWh), porque no dependen de la
+estación. Lo único propio de cada estación, las franjas sin plaza libre, se cruza
+después con otra suma prefija.
+"""
+import math
+from itertools import accumulate
+
+from django.core.cache import cache
+
+from .ocupacion import FRANJAS_DIA, MINUTOS_FRANJA, SEGUNDOS_FRANJA, ocupacion_dia, plazas_estacion
+
+HORAS_FRANJA = MINUTOS_FRANJA / 60
+TIMEOUT_CACHE_COSTES = 24 * 60 * 60
+
+
+def energia_necesaria(vehicle):
+    """kWh que faltan para llenar la batería (carrega_actual es el porcentaje de carga)."""
+    porcentaje = min(max(vehicle.carrega_actual, 0), 100)
+    return vehicle.capacitat_bateria * (100 - porcentaje) / 100
+
+
+def precios_franjas(registro):
+    """Precio (€/kWh) de cada franja del día, o None si REE no da el de esa hora."""
+    por_hora = {int(precio['hora'][:2]): precio['precio_kwh'] for precio in registro.precios}
+    franjas_hora = FRANJAS_DIA // 24
+    return [por_hora.get(franja // franjas_hora) for franja in range(FRANJAS_DIA)]
+
+
+def costes_ventanas(precios, potencia_kw, energia_kwh):
+    """
+    Devuelve (num_franjas, costes): las franjas que dura la carga de `energia_kwh` a
+    `potencia_kw` y el coste (€) de empezarla en cada franja, o None si no acaba dentro
+    del día o falta el precio de alguna de sus franjas.
+    """
+    energia_franja = potencia_kw * HORAS_FRANJA
+    num_franjas = max(math.ceil(energia_kwh / energia_franja), 1)
+    energia_ultima = energia_kwh - (num_franjas - 1) * energia_franja
+
+    suma = [0.0] + list(accumulate(precio or 0.0 for precio in precios))
+    sin_precio = [0] + list(accumulate(precio is None for precio in precios))
+
+    costes = [None] * len(precios)
+    for inicio in range(len(precios) - num_franjas + 1):
+        ultima = inicio + num_franjas - 1
+        if sin_precio[ultima + 1] - sin_precio[inicio]:
+            continue
+        costes[inicio] = (suma[ultima] - suma[inicio]) * energia_franja + precios[ultima] * energia_ultima
+    return num_franjas, costes
+
+
+def costes_ventanas_cacheados(registro, potencia_kw, energia_kwh):
+    energia_kwh = math.ceil(energia_kwh)
+    clave = (
+        f'ventana_carga:{registro.fecha.isoformat()}:{registro.actualizado.timestamp()}:'
+        f'{potencia_kw}:{energia_kwh}'
+    )
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = costes_ventanas(precios_franjas(registro), potencia_kw, energia_kwh)
+        cache.set(clave, resultado, TIMEOUT_CACHE_COSTES)
+    return energia_kwh, resultado
+
+
+def franjas_sin_plaza(estacion, fecha):
+    """Lista de FRANJAS_DIA booleanos: True si en algún momento de la franja no queda plaza."""
+    plazas = plazas_estacion(estacion)
+    maximos = ocupacion_dia(estacion, fecha).maximos_por_franja(SEGUNDOS_FRANJA, FRANJAS_DIA)
+    return [maximo >= plazas for maximo in maximos]
+
+
+def ventana_mas_barata(registro, estacion, energia_kwh, desde_franja=0):
+    """
+    Ventana más barata del día de `registro` en la estación, empezando como pronto en
+    desde_franja y con plaza libre en todas sus franjas. Devuelve (inicio, num_franjas,
+    coste, energia_kwh) o None si no cabe ninguna.
+    """
+    energia_kwh, (num_franjas, costes) = costes_ventanas_cacheados(registro, estacion.potencia, energia_kwh)
+    ocupadas = [0] + list(accumulate(franjas_sin_plaza(estacion, registro.fecha)))
+
+    mejor = None
+    for inicio in range(desde_franja, len(costes)):
+        coste = costes[inicio]
+        if coste is None or ocupadas[inicio + num_franjas] - ocupadas[inicio]:
+            continue
+        if mejor is None or coste < mejor[2]:
+            mejor = (inicio, num_franjas, coste, energia_kwh)
+    return mejor
@@ -2,11 +2,14 @@ from datetime import date, datetime, timedelta
 from rest_framework.permissions import IsAuthenticated, AllowAny
 import json
 import math
+import numpy as np
 import requests
 
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
 from django.shortcuts import render, get_object_or_404
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Avg, Count, Q
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets, status, permissions, serializers
@@ -31,6 +34,32 @@ from .models import (
     TipoErrorEstacion
 )
 from .permissions import EsElMismoUsuarioOReadOnly
+from .geo import haversine_distances, k_menores, filtrar_por_caja, ordenar_por_distancia_aproximada
+from .spatial_index import indice_estaciones
+from .tiles import tile_valido, obtener_tile
+from .clustering import clusters_estaciones
+from .compatibilidad import compatibilidad_carregadors
+from .ocupacion import (
+    bloquear_dias_reserva,
+    bloquear_estaciones_dias,
+    franjas_reserva,
+    intervalo_absoluto,
+    intervalos_reservas_estaciones,
+    PerfilOcupacion,
+    hay_plaza_libre,
+    ocupacion_dia,
+    plazas_libres_estaciones,
+    ocupacion_franjas_dia,
+    plazas_estacion,
+    formatear_segundos,
+    MINUTOS_FRANJA,
+    SEGUNDOS_FRANJA,
+)
+from .precios_ree import (
+    actualizar_precios, fallo_reciente, parse_ree_http_error, precios_guardados, recordar_fallo, ultimos_precios_guardados
+)
+from .ventana_carga import energia_necesaria, ventana_mas_barata
+from .pagination import EstacionesCursorPagination, es_streaming, respuesta_json_streaming, listar_estaciones
 
 
 from .serializers import (
@@ -54,6 +83,13 @@ from .serializers import (
     TrofeoSerializerWithTranslation,
 )
 
+MAX_ESTACIONS_PROPERES = 60
+MAX_REFUGIOS_CERCANOS = 60
+# Candidatos que se piden a la base de datos por cada resultado final
+FACTOR_CANDIDATOS_BD = 2
+MAX_RESERVAS_LOTE = 50
+MAX_ESTACIONS_COMPATIBLES = 20
+
 
 class VehicleViewSet(viewsets.ModelViewSet):
     queryset = Vehicle.objects.all()
@@ -79,13 +115,20 @@ class TipusCarregadorViewSet(viewsets.ModelViewSet):
 
 
 class EstacioCarregaViewSet(viewsets.ModelViewSet):
-    queryset = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'valoraciones').all()
+    queryset = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat', 'valoraciones').all()
+    pagination_class = EstacionesCursorPagination
     
     def get_serializer_class(self):
         include_valoraciones = self.request.query_params.get('include_valoraciones', 'false').lower() == 'true'
         if include_valoraciones:
             return EstacioCarregaConValoracionesSerializer
         return EstacioCarregaSerializer
+
+    def list(self, request, *args, **kwargs):
+        if es_streaming(request):
+            queryset = self.filter_queryset(self.get_queryset()).order_by('id_punt')
+            return respuesta_json_streaming(queryset, self.get_serializer_class(), self.get_serializer_context())
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
     def valoraciones(self, request, pk=None):
@@ -113,6 +156,124 @@ class EstacioCarregaViewSet(viewsets.ModelViewSet):
             
         return Response(stats)
 
+    @action(detail=True, methods=['get'])
+    def franjas_libres(self, request, pk=None):
+        """
+        Tramos del día (?dia=DD/MM/YYYY) con al menos una plaza libre y el mínimo de plazas
+        libres en cada uno. Con ?duracion=HH:MM solo se devuelven los tramos donde cabe.
+        """
+        estacion = get_object_or_404(EstacioCarrega.objects.only('id_punt', 'nplaces'), pk=pk)
+        try:
+            fecha = datetime.strptime(request.query_params.get('dia', ''), '%d/%m/%Y').date()
+            duracion_minima = timedelta(0)
+            if request.query_params.get('duracion'):
+                duracion = datetime.strptime(request.query_params['duracion'], '%H:%M')
+                duracion_minima = timedelta(hours=duracion.hour, minutes=duracion.minute)
+        except ValueError:
+            return Response(
+                {'error': "Se requiere 'dia' con formato DD/MM/YYYY y, opcionalmente, 'duracion' con formato HH:MM"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        plazas = plazas_estacion(estacion)
+        franjas = ocupacion_dia(estacion, fecha).franjas_libres(
+            plazas, duracion_minima=duracion_minima.total_seconds()
+        )
+        return Response({
+            'estacion': estacion.id_punt,
+            'dia': fecha.strftime('%d/%m/%Y'),
+            'nplaces': plazas,
+            'franjas': [
+                {'inicio': formatear_segundos(inicio), 'fin': formatear_segundos(fin), 'places_lliures': libres}
+                for inicio, fin, libres in franjas
+            ],
+        })
+
+    @action(detail=True, methods=['get'])
+    def ocupacion(self, request, pk=None):
+        """Reservas en cada franja de 15 minutos del día (?dia=DD/MM/YYYY), para el mapa de calor."""
+        estacion = get_object_or_404(EstacioCarrega.objects.only('id_punt', 'nplaces'), pk=pk)
+        try:
+            fecha = datetime.strptime(request.query_params.get('dia', ''), '%d/%m/%Y').date()
+        except ValueError:
+            return Response({'error': "Se requiere 'dia' con formato DD/MM/YYYY"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'estacion': estacion.id_punt,
+            'dia': fecha.strftime('%d/%m/%Y'),
+            'nplaces': plazas_estacion(estacion),
+            'minutos_franja': MINUTOS_FRANJA,
+            'franjas': ocupacion_franjas_dia(estacion, fecha),
+        })
+
+    @action(detail=True, methods=['get'])
+    def ventana_carga_economica(self, request, pk=None):
+        """
+        Ventana contigua más barata del día (?dia=DD/MM/YYYY, por defecto hoy) para cargar en
+        la estación con plaza libre todo el rato, según los precios de REE guardados. La
+        energía sale de ?vehicle=<matricula> (del usuario) o de ?energia_kwh directamente.
+        """
+        estacion = get_object_or_404(EstacioCarrega.objects.only('id_punt', 'nplaces', 'potencia'), pk=pk)
+        if not estacion.potencia or estacion.potencia <= 0:
+            return Response({'error': "L'estació no té potència informada"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ahora = datetime.now()
+        try:
+            fecha = ahora.date()
+            if request.query_params.get('dia'):
+                fecha = datetime.strptime(request.query_params['dia'], '%d/%m/%Y').date()
+            if request.query_params.get('vehicle'):
+                if not request.user.is_authenticated:
+                    raise Vehicle.DoesNotExist
+                energia_kwh = energia_necesaria(
+                    Vehicle.objects.get(matricula=request.query_params['vehicle'], propietari=request.user)
+                )
+            else:
+                energia_kwh = float(request.query_params.get('energia_kwh', ''))
+                # float() acepta "nan" e "inf"
+                if not math.isfinite(energia_kwh):
+                    raise ValueError(energia_kwh)
+        except Vehicle.DoesNotExist:
+            return Response({'error': "Vehicle no trobat o no pertany a l'usuari"}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError:
+            return Response(
+                {'error': "Se requiere 'vehicle' o 'energia_kwh' numérico y, opcionalmente, 'dia' con formato DD/MM/YYYY"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if fecha < ahora.date():
+            return Response({'error': "El dia no pot ser passat"}, status=status.HTTP_400_BAD_REQUEST)
+        if energia_kwh <= 0:
+            return Response({'error': "No cal energia: la bateria ja és plena"}, status=status.HTTP_400_BAD_REQUEST)
+
+        precios = precios_guardados(fecha)
+        if precios is None:
+            return Response({'error': "Encara no hi ha preus de REE per a aquest dia"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        desde_franja = 0
+        if fecha == ahora.date():
+            segundos = ahora.hour * 3600 + ahora.minute * 60 + ahora.second
+            desde_franja = math.ceil(segundos / SEGUNDOS_FRANJA)
+        ventana = ventana_mas_barata(precios, estacion, energia_kwh, desde_franja)
+        if ventana is None:
+            return Response(
+                {'error': "No hi ha cap finestra amb places lliures i preus disponibles per carregar aquest dia"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        inicio, num_franjas, coste, energia_bucket = ventana
+        return Response({
+            'estacion': estacion.id_punt,
+            'dia': fecha.strftime('%d/%m/%Y'),
+            'energia_kwh': energia_bucket,
+            'potencia_kw': estacion.potencia,
+            'inicio': formatear_segundos(inicio * SEGUNDOS_FRANJA),
+            'fin': formatear_segundos((inicio + num_franjas) * SEGUNDOS_FRANJA),
+            'duracion': formatear_segundos(num_franjas * SEGUNDOS_FRANJA),
+            'coste_estimado': round(coste, 4),
+            'precio_medio_kwh': round(coste / energia_bucket, 5),
+            'unidad': '€',
+        })
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def reportar_error(self, request, pk=None):
         estacion_reportada = self.get_object()
@@ -190,6 +351,15 @@ def sincronizar_refugios(request):
         return Response({'error': 'Ocurrió un error inesperado en el servidor'}, 
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _parse_radio_km(request):
+    radio_km = request.query_params.get('radio_km')
+    if radio_km is None:
+        return None
+    radio_km = float(radio_km)
+    if not radio_km > 0:
+        raise ValueError("El radio debe ser positivo")
+    return radio_km
+
 @api_view(['GET'])
 def refugios_mas_cercanos(request):
     
@@ -211,24 +381,36 @@ def refugios_mas_cercanos(request):
             status=404
         )
         
-    refugios = RefugioClimatico.objects.all()
-    
-    distancias = []
-    
-    for refugio in refugios:      
-        if refugio.lat is not None and refugio.lng is not None:
-            distance = haversine_distance(lat, lng, refugio.lat, refugio.lng)
-            distancias.append((refugio, distance))
+    try:
+        radio_km = _parse_radio_km(request)
+    except ValueError:
+        return Response(
+            {"error": "El valor de 'radio_km' debe ser un número positivo"},
+            status=400
+        )
 
-    distancias = sorted(distancias, key=lambda x: x[1])
-    distancias = distancias[:60]  # Limitamos a los 60 más cercanos
+    refugios = RefugioClimatico.objects.filter(lat__isnull=False, lng__isnull=False)
+    if radio_km is not None:
+        refugios = filtrar_por_caja(refugios, lat, lng, radio_km)
+    # La base de datos ordena por una distancia aproximada y solo devuelve los candidatos
+    candidatos = MAX_REFUGIOS_CERCANOS * FACTOR_CANDIDATOS_BD
+    puntos = list(ordenar_por_distancia_aproximada(refugios, lat, lng).values_list('pk', 'lat', 'lng')[:candidatos])
+    lats = np.fromiter((p[1] for p in puntos), dtype=np.float64, count=len(puntos))
+    lngs = np.fromiter((p[2] for p in puntos), dtype=np.float64, count=len(puntos))
+
+    distancias = haversine_distances(lat, lng, lats, lngs)
+    if radio_km is not None:
+        distancias[distancias > radio_km] = np.inf
+    mas_cercanos = k_menores(distancias, MAX_REFUGIOS_CERCANOS)  # Limitamos a los 60 más cercanos
+    mas_cercanos = [pos for pos in mas_cercanos if np.isfinite(distancias[pos])]
+    refugios = RefugioClimatico.objects.in_bulk([puntos[pos][0] for pos in mas_cercanos])
     
     resultado = []
     
-    for refugio, distance in distancias:
+    for pos in mas_cercanos:
         resultado.append({
-            "refugio": RefugioClimaticoSerializer(refugio).data,
-            "distancia_km": distance,
+            "refugio": RefugioClimaticoSerializer(refugios[puntos[pos][0]]).data,
+            "distancia_km": float(distancias[pos]),
         })
             
     return Response(resultado)
@@ -267,6 +449,7 @@ class ReservaViewSet(viewsets.ModelViewSet):
 
 
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def crear(self, request):
         data = json.loads(request.body)
 
@@ -281,9 +464,8 @@ class ReservaViewSet(viewsets.ModelViewSet):
             fecha = datetime.strptime(fecha_str, '%d/%m/%Y').date()
             hora_inicio = datetime.strptime(hora_str, '%H:%M').time()
             duracion_td = self._parse_duracion(duracion_str)
-            hora_fin = (datetime.combine(date.today(), hora_inicio) + duracion_td).time()
 
-            if self._hay_solapamiento(estacio, fecha, hora_inicio, hora_fin):
+            if self._hay_solapamiento(estacio, fecha, hora_inicio, duracion_td):
                 return Response({'error': 'No hi ha places lliures en aquest punt de càrrega en aquesta data i hora'}, status=409)
 
             vehicle = None
@@ -310,6 +492,129 @@ class ReservaViewSet(viewsets.ModelViewSet):
         except ValueError as e:
             return Response({'error': str(e)}, status=400)
 
+    @action(detail=False, methods=['post'])
+    def crear_lote(self, request):
+        """
+        Crea varias reservas en una petición: {"reservas": [...], "parcial": false}, donde cada
+        reserva tiene los mismos campos que en crear. Por defecto el lote es atómico (se crean
+        todas o ninguna); con "parcial": true se crean las que caben. Estaciones, vehículos y
+        reservas existentes se leen una sola vez para todo el lote, la compatibilidad sale de
+        las máscaras de compatibilidad.py y el resultado de cada reserva se devuelve en el
+        mismo orden en que llegó.
+        """
+        reservas = request.data.get('reservas')
+        try:
+            # "false" en un formulario es texto: se interpreta como en cualquier BooleanField
+            parcial = serializers.BooleanField().to_internal_value(request.data.get('parcial', False))
+        except serializers.ValidationError:
+            return Response({'error': "'parcial' ha de ser un booleà"}, status=400)
+        if not isinstance(reservas, list) or not reservas:
+            return Response({'error': "Cal indicar una llista 'reservas' no buida"}, status=400)
+        if len(reservas) > MAX_RESERVAS_LOTE:
+            return Response({'error': f'Com a màxim {MAX_RESERVAS_LOTE} reserves per lot'}, status=400)
+
+        estacions = EstacioCarrega.objects.in_bulk(
+            {dades.get('estacion') for dades in reservas if isinstance(dades, dict) and isinstance(dades.get('estacion'), str)}
+        )
+        vehicles = {
+            vehicle.matricula: vehicle
+            for vehicle in Vehicle.objects.filter(
+                propietari=request.user,
+                matricula__in={dades.get('vehicle') for dades in reservas if isinstance(dades, dict) and isinstance(dades.get('vehicle'), str)}
+            )
+        }
+
+        resultados = [None] * len(reservas)
+        validas = []
+        for indice, dades in enumerate(reservas):
+            reserva = self._validar_reserva_lote(dades, estacions, vehicles)
+            if isinstance(reserva, Response):
+                resultados[indice] = {'indice': indice, 'status': reserva.status_code, 'error': reserva.data['error']}
+            else:
+                validas.append((indice, reserva))
+
+        with transaction.atomic():
+            if validas:
+                bloquear_estaciones_dias(
+                    (reserva['estacio'].pk, dia)
+                    for _, reserva in validas
+                    for dia in franjas_reserva(reserva['fecha'], reserva['hora'], reserva['duracion'])
+                )
+                intervalos = intervalos_reservas_estaciones(
+                    (reserva['estacio'].pk, reserva['fecha']) for _, reserva in validas
+                )
+
+            admitidas = []
+            for indice, reserva in validas:
+                estacio = reserva['estacio']
+                inicio, fin = intervalo_absoluto(reserva['fecha'], reserva['hora'], reserva['duracion'])
+                perfil = PerfilOcupacion(intervalos[estacio.pk])
+                if perfil.ocupacion_maxima(inicio, fin) >= plazas_estacion(estacio):
+                    resultados[indice] = {
+                        'indice': indice, 'status': 409,
+                        'error': 'No hi ha places lliures en aquest punt de càrrega en aquesta data i hora'
+                    }
+                    continue
+                # Las reservas admitidas del propio lote también ocupan plaza
+                intervalos[estacio.pk].append((inicio, fin))
+                admitidas.append((indice, reserva))
+
+            if not parcial and len(admitidas) < len(reservas):
+                for indice, _ in admitidas:
+                    resultados[indice] = {
+                        'indice': indice, 'status': 424,
+                        'error': "No creada: el lot és atòmic i alguna altra reserva ha fallat"
+                    }
+                admitidas = []
+
+            for indice, reserva in admitidas:
+                creada = Reserva.objects.create(
+                    usuario=request.user,
+                    estacion=reserva['estacio'],
+                    fecha=reserva['fecha'],
+                    hora=reserva['hora'],
+                    duracion=reserva['duracion'],
+                    vehicle=reserva['vehicle']
+                )
+                resultados[indice] = {'indice': indice, 'status': 201, 'id': creada.id}
+
+        if len(admitidas) == len(reservas):
+            codigo = status.HTTP_201_CREATED
+        elif admitidas:
+            codigo = status.HTTP_207_MULTI_STATUS
+        elif any(resultado['status'] == 409 for resultado in resultados):
+            codigo = status.HTTP_409_CONFLICT
+        else:
+            codigo = status.HTTP_400_BAD_REQUEST
+        return Response({'creadas': len(admitidas), 'resultados': resultados}, status=codigo)
+
+    def _validar_reserva_lote(self, dades, estacions, vehicles):
+        """Reserva ya interpretada de un elemento del lote, o la Response de error que le corresponde."""
+        if not isinstance(dades, dict):
+            return Response({'error': 'Cada reserva ha de ser un objecte'}, status=400)
+        # Llistes o objectes no es poden fer servir com a claus dels diccionaris del lot
+        if any(dades.get(camp) is not None and not isinstance(dades.get(camp), str) for camp in ('estacion', 'vehicle')):
+            return Response({'error': "'estacion' i 'vehicle' han de ser text"}, status=400)
+        estacio = estacions.get(dades.get('estacion'))
+        if estacio is None:
+            return Response({'error': 'Estació no trobada'}, status=404)
+        try:
+            fecha = datetime.strptime(dades.get('fecha'), '%d/%m/%Y').date()
+            hora_inicio = datetime.strptime(dades.get('hora'), '%H:%M').time()
+            duracion_td = self._parse_duracion(dades.get('duracion'))
+        except (ValueError, TypeError) as e:
+            return Response({'error': str(e)}, status=400)
+
+        vehicle = None
+        if dades.get('vehicle'):
+            vehicle = vehicles.get(dades['vehicle'])
+            if vehicle is None:
+                return Response({'error': 'Vehicle no trobat'}, status=404)
+            if not self._es_compatible(vehicle, estacio):
+                return Response({'error': 'El vehicle no és compatible amb aquesta estació de càrrega'}, status=400)
+
+        return {'estacio': estacio, 'fecha': fecha, 'hora': hora_inicio, 'duracion': duracion_td, 'vehicle': vehicle}
+
     def _get_estacio(self, estacio_id):
         return EstacioCarrega.objects.get(id_punt=estacio_id)
 
@@ -323,28 +628,20 @@ class ReservaViewSet(viewsets.ModelViewSet):
         else:
             return timedelta(seconds=int(duracion_str))
 
-    def _hay_solapamiento(self, estacio, fecha, hora_inicio, hora_fin):
-        reservas_existentes = Reserva.objects.filter(estacion=estacio, fecha=fecha)
-        places_reservades = 0
-        for reserva_existente in reservas_existentes:
-            hora_reserva_fin = (datetime.combine(date.today(), reserva_existente.hora) +
-                                reserva_existente.duracion).time()
-            if not (hora_fin <= reserva_existente.hora or hora_inicio >= hora_reserva_fin):
-                places_reservades += 1
-                if places_reservades >= int(estacio.nplaces):
-                    return True
-        return False
+    def _hay_solapamiento(self, estacio, fecha, hora_inicio, duracion_td):
+        # Las reservas de la misma estación y día se admiten de una en una hasta el commit
+        bloquear_dias_reserva(estacio, fecha, hora_inicio, duracion_td)
+        return not hay_plaza_libre(estacio, fecha, hora_inicio, duracion_td)
 
     def _get_vehicle(self, matricula, user):
         return Vehicle.objects.get(matricula=matricula, propietari=user)
 
     def _es_compatible(self, vehicle, estacio):
-        vehicle_carregadors = set(vehicle.tipus_carregador.all().values_list('id_carregador', flat=True))
-        estacio_carregadors = set(estacio.tipus_carregador.all().values_list('id_carregador', flat=True))
-        return bool(vehicle_carregadors.intersection(estacio_carregadors))
+        return compatibilidad_carregadors.son_compatibles(vehicle.pk, estacio.pk)
 
    
     @action(detail=True, methods=['put'])
+    @transaction.atomic
     def modificar(self, request, pk=None):
         try:
             reserva = get_object_or_404(Reserva, id=pk, usuario=request.user)
@@ -365,16 +662,12 @@ class ReservaViewSet(viewsets.ModelViewSet):
                     try:
                         vehicle = get_object_or_404(Vehicle, matricula=vehicle_matricula, propietari=request.user)
                         # Verificar compatibilidad
-                        vehicle_carregadors = set(vehicle.tipus_carregador.all().values_list('id_carregador', flat=True))
-                        estacio_carregadors = set(reserva.estacion.tipus_carregador.all().values_list('id_carregador', flat=True))
-                        if not vehicle_carregadors.intersection(estacio_carregadors):
+                        if not self._es_compatible(vehicle, reserva.estacion):
                             return Response({'error': 'Nou vehicle no compatible'}, status=status.HTTP_400_BAD_REQUEST)
                     except Vehicle.DoesNotExist:
                         return Response({'error': 'Vehicle especificat no trobat o no pertany a l\'usuari'}, status=status.HTTP_404_NOT_FOUND)
             
-            hora_fin = (datetime.combine(date.min, hora_inicio) + duracion_td).time()
-
-            error_solapamiento = self._comprobar_solapamiento(reserva, fecha, hora_inicio, hora_fin, pk)
+            error_solapamiento = self._comprobar_solapamiento(reserva, fecha, hora_inicio, duracion_td, pk)
             if error_solapamiento:
                 return error_solapamiento
 
@@ -412,55 +705,21 @@ class ReservaViewSet(viewsets.ModelViewSet):
             duracion_td = timedelta(seconds=int(duracion_str))
         return fecha, hora_inicio, duracion_td
 
-    def _comprobar_solapamiento(self, reserva, fecha, hora_inicio, hora_fin, pk):
-        reservas_existentes = Reserva.objects.filter(estacion=reserva.estacion, fecha=fecha).exclude(id=pk)
-        places_reservades = 0
-        try:
-            n_places_disponibles = int(reserva.estacion.nplaces)
-        except (ValueError, TypeError):
-            n_places_disponibles = 1
-        for reserva_existente in reservas_existentes:
-            hora_reserva_fin = (datetime.combine(date.min, reserva_existente.hora) + reserva_existente.duracion).time()
-            if not (hora_fin <= reserva_existente.hora or hora_inicio >= hora_reserva_fin):
-                places_reservades += 1
-                if places_reservades >= n_places_disponibles:
-                    return Response({'error': 'No hi ha places lliures...'}, status=409)
+    def _comprobar_solapamiento(self, reserva, fecha, hora_inicio, duracion_td, pk):
+        bloquear_dias_reserva(reserva.estacion, fecha, hora_inicio, duracion_td)
+        if not hay_plaza_libre(reserva.estacion, fecha, hora_inicio, duracion_td, excluir_id=pk):
+            return Response({'error': 'No hi ha places lliures...'}, status=409)
         return None
 
 
     @action(detail=True, methods=['delete'])
+    @transaction.atomic
     def eliminar(self, request, pk=None):
 
         reserva = get_object_or_404(Reserva, id=pk, usuario=request.user)
         reserva.delete()
         return Response({'message': 'Reserva eliminada con éxito'}, status=200)
 
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    # Earth radius in km
-    R = 6378.0
-    
-    # degree 2 radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    # Haversine forumla
-    # a = sin²(difLat/2) + cos(lat1) * cos(lat2) * sin²(difLon/2)
-    # c = 2*atan2(√a, √(1-a))
-    # distance = R * c
-
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    distance = R * c
-    
-    return distance
-
 @api_view(['GET'])
 def punt_mes_proper(request):
     lat = request.query_params.get('lat')
@@ -481,23 +740,27 @@ def punt_mes_proper(request):
             status=404
         )
         
-    estacions = EstacioCarrega.objects.all()
-
-    
-    distancies = []
-    
-    for estacio in estacions:      
-        if estacio.lat is not None and estacio.lng is not None:
-            distance = haversine_distance(lat, lng, estacio.lat, estacio.lng)
-            distancies.append((estacio, distance))
-
+    try:
+        radio_km = _parse_radio_km(request)
+    except ValueError:
+        return Response(
+            {"error": "El valor de 'radio_km' debe ser un número positivo"},
+            status=400
+        )
 
-    distancies = sorted(distancies, key=lambda x: x[1]) #The second element (x[1]) of each item in the list will be taken as the sorting criterion.
-    distancies = distancies[:60]
+    # Solo se calculan distancias de los candidatos que devuelve el índice espacial;
+    # de la base de datos solo se leen las estaciones seleccionadas
+    distancies = indice_estaciones.k_mas_cercanos(lat, lng, MAX_ESTACIONS_PROPERES, radio_km=radio_km)
+    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat').in_bulk(
+        [id_punt for id_punt, _ in distancies]
+    )
     resultat = []
     
-    for estacio, distance in distancies:
-        # Get charging points for this station        
+    for id_punt, distance in distancies:
+        estacio = estacions.get(id_punt)
+        if estacio is None:
+            # El índice aún no refleja una estación eliminada
+            continue
         resultat.append({
             "estacio_carrega": EstacioCarregaSerializer(estacio).data,
             "distancia_km": distance,
@@ -506,10 +769,122 @@ def punt_mes_proper(request):
     return Response(resultat)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estacions_compatibles_properes(request):
+    """
+    Estaciones más cercanas a (lat, lng) donde puede cargar el vehículo indicado: comparten
+    algún tipo de cargador, no están fuera de servicio y tienen alguna plaza libre durante
+    toda la franja pedida (fecha DD/MM/YYYY, hora HH:MM, duracion HH:MM).
+    Parámetros opcionales: radio_km y limit (máximo MAX_ESTACIONS_COMPATIBLES).
+    """
+    params = request.query_params
+    try:
+        lat = float(params.get('lat'))
+        lng = float(params.get('lng'))
+        fecha = datetime.strptime(params.get('fecha', ''), '%d/%m/%Y').date()
+        hora_inicio = datetime.strptime(params.get('hora', ''), '%H:%M').time()
+        duracion = datetime.strptime(params.get('duracion', ''), '%H:%M')
+        duracion_td = timedelta(hours=duracion.hour, minutes=duracion.minute)
+        radio_km = _parse_radio_km(request)
+        limit = min(int(params.get('limit', MAX_ESTACIONS_COMPATIBLES)), MAX_ESTACIONS_COMPATIBLES)
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "Se requieren 'lat' y 'lng' numéricos, 'fecha' (DD/MM/YYYY), 'hora' (HH:MM) y 'duracion' (HH:MM)"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if limit <= 0 or not duracion_td:
+        return Response({"error": "'limit' y 'duracion' deben ser positivos"}, status=status.HTTP_400_BAD_REQUEST)
+
+    matricula = params.get('vehicle')
+    if not matricula or not Vehicle.objects.filter(matricula=matricula, propietari=request.user).exists():
+        return Response({"error": "Vehicle no trobat o no pertany a l'usuari"}, status=status.HTTP_404_NOT_FOUND)
+
+    compatibles = set(compatibilidad_carregadors.estaciones_compatibles(
+        compatibilidad_carregadors.mascara_vehicle(matricula)
+    ))
+
+    # Se piden al índice candidatos compatibles en tandas crecientes hasta reunir `limit`
+    # estaciones con plaza o agotar los candidatos
+    resultat = []
+    descartados = set()
+    pedidos = limit * FACTOR_CANDIDATOS_BD
+    while True:
+        distancies = indice_estaciones.k_mas_cercanos(lat, lng, pedidos, radio_km=radio_km, admitidos=compatibles)
+        nuevos = [(id_punt, distancia) for id_punt, distancia in distancies if id_punt not in descartados]
+        estacions = EstacioCarrega.objects.filter(fuera_de_servicio=False).prefetch_related(
+            'tipus_carregador', 'tipus_velocitat'
+        ).in_bulk([id_punt for id_punt, _ in nuevos])
+        libres = plazas_libres_estaciones(list(estacions.values()), fecha, hora_inicio, duracion_td)
+
+        for id_punt, distancia in nuevos:
+            descartados.add(id_punt)
+            if libres.get(id_punt, 0) > 0:
+                resultat.append({
+                    "estacio_carrega": EstacioCarregaSerializer(estacions[id_punt]).data,
+                    "distancia_km": distancia,
+                    "places_lliures": libres[id_punt],
+                })
+        if len(resultat) >= limit or len(distancies) < pedidos:
+            break
+        pedidos *= 2
+
+    return Response(resultat[:limit])
+
+
+@api_view(['GET'])
+def tile_estacions(request, z, x, y):
+    """Estaciones de una tesela z/x/y del mapa, agrupadas en clústeres y con los campos mínimos."""
+    if not tile_valido(z, x, y):
+        return Response(
+            {"error": "Coordenadas de tesela fuera de rango"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    response = Response(obtener_tile(z, x, y))
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+@api_view(['GET'])
+def clusters_estacions(request):
+    """
+    Clústeres de estaciones de carga (centroide, número y potencia total) para ?zoom y,
+    opcionalmente, la caja visible del mapa con lat_min, lat_max, lng_min y lng_max.
+    """
+    try:
+        zoom = int(request.query_params.get('zoom'))
+    except (TypeError, ValueError):
+        zoom = None
+    if zoom is None or not 0 <= zoom <= clusters_estaciones.zoom_maximo:
+        return Response(
+            {"error": f"Se requiere el parámetro 'zoom' entre 0 y {clusters_estaciones.zoom_maximo}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    nombres_caja = ('lat_min', 'lat_max', 'lng_min', 'lng_max')
+    caja = [request.query_params.get(nombre) for nombre in nombres_caja]
+    if any(valor is not None for valor in caja):
+        try:
+            caja = [float(valor) for valor in caja]
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "La caja requiere valores numéricos para lat_min, lat_max, lng_min y lng_max"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        clusters = clusters_estaciones.clusters(zoom, *caja)
+    else:
+        clusters = clusters_estaciones.clusters(zoom)
+
+    response = Response({'zoom': zoom, 'clusters': clusters})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
 @api_view(['GET'])
 def filtrar_per_potencia(request):
    
-    estacions = EstacioCarrega.objects.all()
+    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat').all()
     
 
     potencia_min = request.query_params.get('min')
@@ -535,13 +910,12 @@ def filtrar_per_potencia(request):
             )
     
 
-    serializer = EstacioCarregaSerializer(estacions, many=True)
-    return Response(serializer.data)
+    return listar_estaciones(request, estacions, EstacioCarregaSerializer)
 
 @api_view(['GET'])
 def filtrar_per_velocitat(request):
     
-    estacions = EstacioCarrega.objects.all()
+    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat').all()
     
     velocitat = request.query_params.get('velocitat')
     if velocitat is not None:
@@ -549,14 +923,13 @@ def filtrar_per_velocitat(request):
         velocitats = velocitat.split(',')
         estacions = estacions.filter(tipus_velocitat__in=velocitats)
     
-    serializer = EstacioCarregaSerializer(estacions, many=True)
-    return Response(serializer.data)
+    return listar_estaciones(request, estacions, EstacioCarregaSerializer)
 
 
 @api_view(['GET'])
 def filtrar_per_carregador(request):
     
-    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador').all()
+    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat').all()
     
     
     carregador_id = request.query_params.get('id')
@@ -566,8 +939,7 @@ def filtrar_per_carregador(request):
         estacions = estacions.filter(tipus_carregador__id_carregador__in=carregador_ids)
     
     
-    serializer = EstacioCarregaSerializer(estacions, many=True)
-    return Response(serializer.data)
+    return listar_estaciones(request, estacions, EstacioCarregaSerializer)
 
 @api_view(['GET'])
 def obtenir_opcions_filtres(request):
@@ -606,7 +978,7 @@ def obtenir_opcions_filtres(request):
 @api_view(['GET'])
 def filtrar_estacions(request):
     
-    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador').all()
+    estacions = EstacioCarrega.objects.prefetch_related('tipus_carregador', 'tipus_velocitat').all()
     
     
     potencia_min = request.query_params.get('potencia_min')
@@ -645,6 +1017,16 @@ def filtrar_estacions(request):
         estacions = estacions.filter(tipus_carregador__id_carregador__in=tipus_carregador)
 
 
+    matricula = request.query_params.get('vehicle')
+    if matricula is not None:
+        if not (request.user.is_authenticated and Vehicle.objects.filter(matricula=matricula, propietari=request.user).exists()):
+            return Response(
+                {"error": "Vehicle no trobat o no pertany a l'usuari"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        mascara = compatibilidad_carregadors.mascara_vehicle(matricula)
+        estacions = estacions.filter(pk__in=compatibilidad_carregadors.estaciones_compatibles(mascara))
+
     
     ciutat = request.query_params.get('ciutat')
     if ciutat is not None:
@@ -652,96 +1034,62 @@ def filtrar_estacions(request):
         estacions = estacions.filter(ciutat__in=ciutats)
 
 
-    serializer = EstacioCarregaSerializer(estacions, many=True)
-    return Response(serializer.data)
+    return listar_estaciones(request, estacions, EstacioCarregaSerializer)
 
 
 @api_view(['GET'])
 def obtenir_preu_actual_kwh(request):
-    """Obtiene el precio del kWh para hoy desde la API de REE."""
+    """
+    Precio del kWh de hoy. Se sirve de PreciosElectricidad (ver precios_ree.py); solo se
+    llama a REE si aún no están guardados los de hoy, y no otra vez hasta pasado un rato si
+    falla. Si REE falla se devuelven los últimos precios guardados marcados como obsoletos.
+    """
 
     hoy = datetime.now().date()
-    fecha_str_api = hoy.strftime("%Y-%m-%d")
-    fecha_str_display = hoy.strftime("%d/%m/%Y")
-
-    fecha_inicio = f"{fecha_str_api}T00:00"
-    fecha_fin = f"{fecha_str_api}T23:59"
-
-    url = (
-        "https://apidatos.ree.es/es/datos/mercados/precios-mercados-tiempo-real"
-        f"?start_date={fecha_inicio}&end_date={fecha_fin}&time_trunc=hour"
-    )
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json'
-    }
-
+    error = None
+    precios = None
+    llamada_ree = False
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        precios_kwh_hoy = _parse_precios_kwh_ree(data)
-        if not precios_kwh_hoy:
-            return Response({"error": "No se encontraron datos horarios en la respuesta de la API REE"}, status=status.HTTP_404_NOT_FOUND)
-
-        return Response({
-            "fecha": fecha_str_display,
-            "precios_hoy": precios_kwh_hoy,
-            "unidad": "€/kWh",
-            "fuente": "Red Eléctrica de España (REE)"
-        }, status=status.HTTP_200_OK)
-
+        precios = precios_guardados(hoy)
+        if precios is None:
+            error = fallo_reciente(hoy)
+            if error is None:
+                llamada_ree = True
+                precios = actualizar_precios(hoy)
+                if precios is None:
+                    error = ({"error": "No se encontraron datos horarios en la respuesta de la API REE"}, status.HTTP_404_NOT_FOUND)
     except requests.Timeout:
-        return Response({"error": "Timeout conectando con API REE"}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        error = ({"error": "Timeout conectando con API REE"}, status.HTTP_504_GATEWAY_TIMEOUT)
     except requests.HTTPError as e:
-        error_detail = _parse_ree_http_error(e)
-        return Response({"error": f"Error al obtener datos de REE: {error_detail}"}, status=e.response.status_code)
+        error_detail = parse_ree_http_error(e)
+        error = ({"error": f"Error al obtener datos de REE: {error_detail}"}, e.response.status_code)
     except requests.RequestException as e:
-        return Response({"error": f"Fallo conexión con API REE: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        error = ({"error": f"Fallo conexión con API REE: {str(e)}"}, status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         print(f"Error inesperado en obtenir_preu_actual_kwh: {e}")
         return Response({'error': 'Error inesperado en el servidor'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def _procesar_valor_hora(valor_hora):
-    precio_mwh = valor_hora.get("value")
-    timestamp_str = valor_hora.get("datetime")
-    if precio_mwh is not None and timestamp_str:
-        try:
-            precio_kwh = float(precio_mwh) / 1000
-            hora_dt = datetime.fromisoformat(timestamp_str)
-            hora_simple = hora_dt.strftime("%H:%M")
-            return {"hora": hora_simple, "precio_kwh": round(precio_kwh, 5)}
-        except (ValueError, TypeError) as e:
-            print(f"Error procesando valor REE {valor_hora}: {e}")
-    return None
-
-def _parse_precios_kwh_ree(data):
-    precios_kwh_hoy = []
-    valores_horarios = _obtener_valores_horarios(data)
-    for valor_hora in valores_horarios:
-        resultado = _procesar_valor_hora(valor_hora)
-        if resultado:
-            precios_kwh_hoy.append(resultado)
-    return precios_kwh_hoy
-
-def _obtener_valores_horarios(data):
-    if "included" in data and data["included"]:
-        indicador_precios = data["included"][0]
-        if "attributes" in indicador_precios and "values" in indicador_precios["attributes"]:
-            return indicador_precios["attributes"]["values"]
-    return []
-
-def _parse_ree_http_error(e):
-    error_detail = f"Error HTTP {e.response.status_code} desde API REE"
-    try:
-        error_data = e.response.json()
-        if "errors" in error_data and error_data["errors"]:
-            error_detail = error_data["errors"][0].get("detail", error_detail)
-    except (json.JSONDecodeError, AttributeError, IndexError, KeyError):
-        pass
-    return error_detail
+    if llamada_ree and error is not None:
+        recordar_fallo(hoy, error)
+
+    obsoleto = error is not None
+    if obsoleto:
+        precios = ultimos_precios_guardados(hoy)
+        if precios is None:
+            datos, codigo = error
+            return Response(datos, status=codigo)
+
+    response = Response({
+        "fecha": precios.fecha.strftime("%d/%m/%Y"),
+        "precios_hoy": precios.precios,
+        "unidad": "€/kWh",
+        "fuente": "Red Eléctrica de España (REE)",
+        "obsoleto": obsoleto,
+    }, status=status.HTTP_200_OK)
+    response['Last-Modified'] = http_date(precios.actualizado.timestamp())
+    if obsoleto:
+        response['Warning'] = '110 - "Response is Stale"'
+    return response
 
 class UsuarioViewSet(viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
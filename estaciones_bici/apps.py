@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EstacionesBiciConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'estaciones_bici'
+
+    def ready(self):
+        import estaciones_bici.signals
@@ -0,0 +1,119 @@
+"""
+Historial compacto de la disponibilidad de Bicing.
+
+Guardar una fila por estación y minuto serían unas 720.000 filas al día, así que cada
+estación tiene una fila por día (HistorialDisponibilidadBici) con un blob de registros de
+8 bytes: minuto del día (uint16) y los deltas (int16) de bicis mecánicas, eléctricas y
+anclajes libres respecto al registro anterior. Solo se añade un registro cuando cambia
+algún valor, y el estado en un instante es el del último registro anterior (si el día
+aún no tiene ninguno, el último valor del día anterior).
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.utils.timezone import now
+
+from .models import HistorialDisponibilidadBici
+
+FORMATO_REGISTRO = np.dtype([
+    ('minuto', '<u2'), ('mecanicas', '<i2'), ('electricas', '<i2'), ('docks', '<i2'),
+])
+CAMPOS_VALORES = ('mecanicas', 'electricas', 'docks')
+TAMANO_LOTE_HISTORIAL = 500
+
+
+def codificar_registro(minuto, valores, anteriores):
+    registro = np.zeros(1, dtype=FORMATO_REGISTRO)
+    registro['minuto'] = minuto
+    for campo, valor, anterior in zip(CAMPOS_VALORES, valores, anteriores):
+        registro[campo] = valor - anterior
+    return registro.tobytes()
+
+
+def decodificar_muestras(muestras):
+    """Devuelve (minutos, valores) con los valores absolutos de cada registro (array N x 3)."""
+    registros = np.frombuffer(bytes(muestras), dtype=FORMATO_REGISTRO)
+    deltas = np.stack([registros[campo].astype(np.int64) for campo in CAMPOS_VALORES], axis=1)
+    return registros['minuto'].astype(np.int64), np.cumsum(deltas, axis=0).reshape(-1, len(CAMPOS_VALORES))
+
+
+def registrar_muestras(muestras, momento=None):
+    """
+    Añade al historial del día la disponibilidad de las estaciones indicadas, como
+    diccionario estacion_id -> (mecanicas, electricas, docks). Se leen las filas del día de
+    una vez y se escriben en bloque; las estaciones cuyo valor no ha cambiado no se tocan.
+    """
+    momento = (momento or now()).astimezone(dt_timezone.utc)
+    fecha = momento.date()
+    minuto = momento.hour * 60 + momento.minute
+
+    por_estacion = {
+        fila.estacion_id: fila
+        for fila in HistorialDisponibilidadBici.objects.filter(fecha=fecha, estacion_id__in=list(muestras))
+    }
+
+    cambiadas = []
+    nuevas = []
+    for estacion_id, valores in muestras.items():
+        fila = por_estacion.get(estacion_id)
+        if fila is None:
+            fila = HistorialDisponibilidadBici(estacion_id=estacion_id, fecha=fecha, muestras=b'')
+            nuevas.append(fila)
+        else:
+            anteriores = (fila.ultimo_mecanicas, fila.ultimo_electricas, fila.ultimo_docks)
+            if tuple(valores) == anteriores:
+                continue
+            cambiadas.append(fila)
+        fila.muestras = bytes(fila.muestras) + codificar_registro(
+            minuto, valores, (fila.ultimo_mecanicas, fila.ultimo_electricas, fila.ultimo_docks)
+        )
+        fila.ultimo_mecanicas, fila.ultimo_electricas, fila.ultimo_docks = valores
+
+    HistorialDisponibilidadBici.objects.bulk_update(
+        cambiadas, ['muestras', 'ultimo_mecanicas', 'ultimo_electricas', 'ultimo_docks'],
+        batch_size=TAMANO_LOTE_HISTORIAL
+    )
+    HistorialDisponibilidadBici.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE_HISTORIAL)
+
+
+def disponibilidad_historica(estacion_id, desde, hasta=None):
+    """
+    Lista de {'momento', 'num_bicis_mecanicas', 'num_bicis_electricas', 'num_docks_disponibles'}
+    con los cambios de disponibilidad de la estación entre desde y hasta. El primer elemento
+    es el estado en `desde` si se conoce.
+    """
+    hasta = hasta or now()
+    filas = list(
+        HistorialDisponibilidadBici.objects.filter(
+            estacion_id=estacion_id,
+            fecha__gte=desde.astimezone(dt_timezone.utc).date(),
+            fecha__lte=hasta.astimezone(dt_timezone.utc).date(),
+        ).order_by('fecha')
+    )
+    anterior = HistorialDisponibilidadBici.objects.filter(
+        estacion_id=estacion_id, fecha__lt=desde.astimezone(dt_timezone.utc).date()
+    ).order_by('-fecha').values_list('ultimo_mecanicas', 'ultimo_electricas', 'ultimo_docks').first()
+
+    puntos = []
+    estado_inicial = anterior
+    for fila in filas:
+        inicio_dia = datetime.combine(fila.fecha, time.min, tzinfo=dt_timezone.utc)
+        minutos, valores = decodificar_muestras(fila.muestras)
+        for minuto, fila_valores in zip(minutos.tolist(), valores.tolist()):
+            momento = inicio_dia + timedelta(minutes=minuto)
+            if momento <= desde:
+                estado_inicial = fila_valores
+            elif momento <= hasta:
+                puntos.append((momento, fila_valores))
+
+    if estado_inicial is not None:
+        puntos.insert(0, (desde, estado_inicial))
+    return [
+        {
+            'momento': momento,
+            'num_bicis_mecanicas': valores[0],
+            'num_bicis_electricas': valores[1],
+            'num_docks_disponibles': valores[2],
+        }
+        for momento, valores in puntos
+    ]
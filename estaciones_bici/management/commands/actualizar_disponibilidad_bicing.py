@@ -1,12 +1,38 @@
+import time
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
-from estaciones_bici.utils import actualizar_disponibilidad_estaciones
+from estaciones_bici.utils import refrescar_disponibilidad, INTERVALO_DISPONIBILIDAD
 
 class Command(BaseCommand):
     help = 'Actualiza la disponibilidad en tiempo real de las estaciones de bicicletas'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Sigue en marcha y actualiza cada --intervalo segundos (proceso trabajador)',
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=int(INTERVALO_DISPONIBILIDAD.total_seconds()),
+            help='Segundos entre actualizaciones con --loop',
+        )
+
     def handle(self, *args, **kwargs):
+        if not kwargs['loop']:
+            self.actualizar(max_edad=timedelta(0))
+            return
+
+        intervalo = kwargs['intervalo']
+        while True:
+            # Si otro trabajador ya ha actualizado en este intervalo no se vuelve a llamar a la API
+            self.actualizar(max_edad=timedelta(seconds=intervalo))
+            time.sleep(intervalo)
+
+    def actualizar(self, max_edad):
         try:
-            actualizar_disponibilidad_estaciones()
-            self.stdout.write(self.style.SUCCESS('Disponibilidad actualizada correctamente'))
+            if refrescar_disponibilidad(max_edad=max_edad, esperar=True):
+                self.stdout.write(self.style.SUCCESS('Disponibilidad actualizada correctamente'))
+            else:
+                self.stdout.write('Disponibilidad ya actualizada por otro proceso')
         except Exception as e:
             self.stderr.write(self.style.ERROR(f'Error al actualizar: {e}'))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from estaciones_bici.reservas import barrer_reservas_expiradas, INTERVALO_BARRIDO, TAMANO_LOTE_EXPIRACION
+
+class Command(BaseCommand):
+    help = 'Desactiva las reservas de bicicletas expiradas y libera sus plazas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Sigue en marcha y barre cada --intervalo segundos (proceso trabajador)',
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=int(INTERVALO_BARRIDO.total_seconds()),
+            help='Segundos entre barridos con --loop',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=TAMANO_LOTE_EXPIRACION,
+            help='Reservas desactivadas por transacción',
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            self.barrer(kwargs['lote'])
+            if not kwargs['loop']:
+                return
+            time.sleep(kwargs['intervalo'])
+
+    def barrer(self, lote):
+        try:
+            expiradas = barrer_reservas_expiradas(tamano_lote=lote)
+            self.stdout.write(self.style.SUCCESS(f'{expiradas} reservas expiradas desactivadas'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Error al expirar reservas: {e}'))
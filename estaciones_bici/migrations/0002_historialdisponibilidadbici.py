@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estaciones_bici', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialDisponibilidadBici',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('muestras', models.BinaryField(default=bytes)),
+                ('ultimo_mecanicas', models.IntegerField(default=0)),
+                ('ultimo_electricas', models.IntegerField(default=0)),
+                ('ultimo_docks', models.IntegerField(default=0)),
+                ('estacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_disponibilidad', to='estaciones_bici.estacionbici')),
+            ],
+            options={
+                'unique_together': {('estacion', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estaciones_bici', '0002_historialdisponibilidadbici'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrediccionDisponibilidadBici',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(help_text='0 = lunes ... 6 = domingo')),
+                ('franja', models.PositiveSmallIntegerField(help_text='Índice de la franja de 15 minutos dentro del día (0-95)')),
+                ('media_mecanicas', models.FloatField(default=0)),
+                ('media_electricas', models.FloatField(default=0)),
+                ('muestras', models.PositiveIntegerField(default=0)),
+                ('ultima_observacion', models.DateTimeField(blank=True, null=True)),
+                ('estacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='predicciones', to='estaciones_bici.estacionbici')),
+            ],
+            options={
+                'unique_together': {('estacion', 'dia_semana', 'franja')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:23
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def rellenar_contadores(apps, schema_editor):
+    """Cuenta las reservas que seguían activas y desactiva las ya expiradas."""
+    ReservaBici = apps.get_model('estaciones_bici', 'ReservaBici')
+    DisponibilidadEstacionBici = apps.get_model('estaciones_bici', 'DisponibilidadEstacionBici')
+
+    ReservaBici.objects.filter(activa=True, expiracion__lte=timezone.now()).update(activa=False)
+    campos = {'mecanica': 'reservas_mecanicas', 'electrica': 'reservas_electricas'}
+    for fila in ReservaBici.objects.filter(activa=True).values('estacion_id', 'tipo_bicicleta').annotate(n=Count('id')):
+        campo = campos.get(fila['tipo_bicicleta'])
+        if campo:
+            DisponibilidadEstacionBici.objects.filter(estacion_id=fila['estacion_id']).update(**{campo: fila['n']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estaciones_bici', '0003_predicciondisponibilidadbici'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilidadestacionbici',
+            name='reservas_electricas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='disponibilidadestacionbici',
+            name='reservas_mecanicas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rellenar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estaciones_bici', '0004_contadores_reservas_bici'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservabici',
+            index=models.Index(fields=['activa', 'expiracion'], name='reservabici_activa_exp_idx'),
+        ),
+    ]
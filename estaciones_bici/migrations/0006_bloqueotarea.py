@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estaciones_bici', '0005_indice_expiracion_reservabici'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('hasta', models.DateTimeField()),
+            ],
+        ),
+    ]
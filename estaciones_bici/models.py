@@ -29,6 +29,9 @@ class DisponibilidadEstacionBici(models.Model):
     num_bicis_electricas = models.IntegerField(default=0)
     num_docks_disponibles = models.IntegerField(default=0)
     estado = models.CharField(max_length=50, default="IN_SERVICE")
+    # Reservas activas de cada tipo, mantenidas por reservas.py (no vienen de la API)
+    reservas_mecanicas = models.IntegerField(default=0)
+    reservas_electricas = models.IntegerField(default=0)
 
     def __str__(self):
         return f"Estado de {self.estacion}"
@@ -41,6 +44,18 @@ class UltimaActualizacionBicing(models.Model):
     def __str__(self):
         return f"{self.tipo}: llamada={self.fecha_llamada}, api={self.fecha_actualizacion_api}"
     
+class BloqueoTarea(models.Model):
+    """
+    Bloqueo con caducidad compartido por todos los procesos: lo tiene quien consigue poner
+    `hasta` en el futuro con un UPDATE condicional (ver utils.tomar_bloqueo). Si el proceso
+    muere sin soltarlo, caduca solo.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    hasta = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.nombre} hasta {self.hasta}"
+
 class ReservaBici(models.Model):
     TIPOS = (
         ('mecanica', 'Mecánica'),
@@ -54,8 +69,54 @@ class ReservaBici(models.Model):
     expiracion = models.DateTimeField()
     activa = models.BooleanField(default=True)
 
+    class Meta:
+        # Para el barrido de reservas expiradas (ver reservas.barrer_reservas_expiradas)
+        indexes = [models.Index(fields=['activa', 'expiracion'], name='reservabici_activa_exp_idx')]
+
     def ha_expirado(self) -> bool:
         return now() > self.expiracion
 
     def __str__(self):
-        return f"{self.usuario} - {self.tipo_bicicleta} en {self.estacion} hasta {self.expiracion}"
\ No newline at end of file
+        return f"{self.usuario} - {self.tipo_bicicleta} en {self.estacion} hasta {self.expiracion}"
+
+class HistorialDisponibilidadBici(models.Model):
+    """
+    Historial de disponibilidad de una estación durante un día (UTC) en formato compacto:
+    solo se guardan los cambios, como registros de 8 bytes (minuto del día y los deltas en
+    int16 de bicis mecánicas, eléctricas y anclajes libres) respecto al registro anterior.
+    Los últimos valores se guardan aparte para añadir registros sin decodificar los demás.
+    Ver historial.py.
+    """
+    estacion = models.ForeignKey(EstacionBici, on_delete=models.CASCADE, related_name='historial_disponibilidad')
+    fecha = models.DateField()
+    muestras = models.BinaryField(default=bytes)
+    ultimo_mecanicas = models.IntegerField(default=0)
+    ultimo_electricas = models.IntegerField(default=0)
+    ultimo_docks = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('estacion', 'fecha')
+
+    def __str__(self):
+        return f"Historial de {self.estacion} el {self.fecha}"
+
+
+class PrediccionDisponibilidadBici(models.Model):
+    """
+    Disponibilidad típica de una estación para cada día de la semana y franja de 15 minutos:
+    media móvil exponencial de las observaciones, actualizada con cada refresco (una vez por
+    franja). Ver prediccion.py.
+    """
+    estacion = models.ForeignKey(EstacionBici, on_delete=models.CASCADE, related_name='predicciones')
+    dia_semana = models.PositiveSmallIntegerField(help_text="0 = lunes ... 6 = domingo")
+    franja = models.PositiveSmallIntegerField(help_text="Índice de la franja de 15 minutos dentro del día (0-95)")
+    media_mecanicas = models.FloatField(default=0)
+    media_electricas = models.FloatField(default=0)
+    muestras = models.PositiveIntegerField(default=0)
+    ultima_observacion = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('estacion', 'dia_semana', 'franja')
+
+    def __str__(self):
+        return f"Predicción de {self.estacion} ({self.dia_semana}, franja {self.franja})"
@@ -0,0 +1,99 @@
+"""
+Predicción de bicis disponibles a partir de una tabla precalculada.
+
+Para cada estación, día de la semana y franja de 15 minutos (hora local) se guarda una
+media móvil exponencial de las bicis mecánicas y eléctricas observadas. La tabla se
+actualiza de forma incremental desde el refresco de disponibilidad, con una observación
+por estación y franja, y una predicción es leer la fila de la franja de destino: no se
+ajusta ningún modelo al atender una petición.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import PrediccionDisponibilidadBici
+
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+# Peso de la observación nueva en la media: las semanas recientes pesan más
+ALFA_MEDIA = 0.2
+# Por debajo de estas observaciones la predicción no se considera fiable
+MUESTRAS_MINIMAS = 3
+HORIZONTES_MINUTOS = (15, 30, 60)
+TAMANO_LOTE_PREDICCION = 500
+CAMPOS_MEDIA = ['media_mecanicas', 'media_electricas', 'muestras', 'ultima_observacion']
+
+
+def franja_de(momento):
+    """(dia_semana, franja, inicio de la franja) del momento en hora local."""
+    local = timezone.localtime(momento)
+    franja = (local.hour * 60 + local.minute) // MINUTOS_FRANJA
+    inicio = local.replace(minute=local.minute - local.minute % MINUTOS_FRANJA, second=0, microsecond=0)
+    return local.weekday(), franja, inicio
+
+
+def registrar_observaciones(observaciones, momento=None):
+    """
+    Añade a la tabla la disponibilidad actual, como diccionario estacion_id -> (mecanicas,
+    electricas). Cada estación cuenta una sola vez por franja: las filas ya observadas en
+    esta franja se saltan, así que casi todos los refrescos no escriben nada.
+    """
+    dia_semana, franja, inicio = franja_de(momento or timezone.now())
+    filas = {
+        fila.estacion_id: fila
+        for fila in PrediccionDisponibilidadBici.objects.filter(
+            dia_semana=dia_semana, franja=franja, estacion_id__in=list(observaciones)
+        )
+    }
+
+    cambiadas = []
+    nuevas = []
+    for estacion_id, (mecanicas, electricas) in observaciones.items():
+        fila = filas.get(estacion_id)
+        if fila is None:
+            nuevas.append(PrediccionDisponibilidadBici(
+                estacion_id=estacion_id, dia_semana=dia_semana, franja=franja,
+                media_mecanicas=mecanicas, media_electricas=electricas, muestras=1, ultima_observacion=inicio,
+            ))
+            continue
+        if fila.ultima_observacion is not None and fila.ultima_observacion >= inicio:
+            continue
+        fila.media_mecanicas += ALFA_MEDIA * (mecanicas - fila.media_mecanicas)
+        fila.media_electricas += ALFA_MEDIA * (electricas - fila.media_electricas)
+        fila.muestras += 1
+        fila.ultima_observacion = inicio
+        cambiadas.append(fila)
+
+    PrediccionDisponibilidadBici.objects.bulk_update(cambiadas, CAMPOS_MEDIA, batch_size=TAMANO_LOTE_PREDICCION)
+    PrediccionDisponibilidadBici.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE_PREDICCION)
+
+
+def predecir(estacion_id, horizontes=HORIZONTES_MINUTOS, momento=None):
+    """
+    Predicción para cada horizonte (minutos desde `momento`): lista de diccionarios con
+    'minutos', 'momento', 'num_bicis_mecanicas', 'num_bicis_electricas' y 'fiable'. Los
+    valores son None si no hay datos de esa franja. Una sola consulta por índice único.
+    """
+    momento = momento or timezone.now()
+    destinos = [(minutos, momento + timedelta(minutes=minutos)) for minutos in horizontes]
+    claves = {minutos: franja_de(destino)[:2] for minutos, destino in destinos}
+    filas = {
+        (fila.dia_semana, fila.franja): fila
+        for fila in PrediccionDisponibilidadBici.objects.filter(
+            estacion_id=estacion_id,
+            dia_semana__in={dia for dia, _ in claves.values()},
+            franja__in={franja for _, franja in claves.values()},
+        )
+    }
+
+    predicciones = []
+    for minutos, destino in destinos:
+        fila = filas.get(claves[minutos])
+        predicciones.append({
+            'minutos': minutos,
+            'momento': destino,
+            'num_bicis_mecanicas': round(fila.media_mecanicas, 1) if fila else None,
+            'num_bicis_electricas': round(fila.media_electricas, 1) if fila else None,
+            'fiable': bool(fila and fila.muestras >= MUESTRAS_MINIMAS),
+        })
+    return predicciones
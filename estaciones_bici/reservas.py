@@ -0,0 +1,101 @@
+"""
+Admisión y liberación de reservas de Bicing con contadores.
+
+DisponibilidadEstacionBici guarda, además de las bicis que da la API, cuántas reservas
+activas hay de cada tipo. Admitir una reserva es un solo UPDATE condicional que suma uno
+al contador solo si sigue por debajo de las bicis disponibles de ese tipo, así que dos
+peticiones a la vez no pueden reservar la misma bici y no hace falta contar filas de
+ReservaBici. Cancelar o expirar una reserva resta del contador las filas que realmente
+se han desactivado, y borrar una reserva activa (también en cascada, al borrar el
+usuario) resta la suya (ver signals.py).
+
+Las reservas expiradas las desactiva el comando expirar_reservas_bici (ver
+barrer_reservas_expiradas); las vistas de lectura solo las filtran por expiracion.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import DisponibilidadEstacionBici, ReservaBici
+
+TAMANO_LOTE_EXPIRACION = 200
+INTERVALO_BARRIDO = timedelta(seconds=30)
+
+CAMPOS_TIPO = {
+    'mecanica': ('num_bicis_mecanicas', 'reservas_mecanicas'),
+    'electrica': ('num_bicis_electricas', 'reservas_electricas'),
+}
+
+
+def admitir_reserva(estacion_id, tipo):
+    """
+    Reserva una plaza en el contador del tipo. Devuelve False si ya están reservadas todas
+    las bicis disponibles (o la estación no tiene datos de disponibilidad).
+    """
+    campo_bicis, campo_reservas = CAMPOS_TIPO[tipo]
+    return bool(
+        DisponibilidadEstacionBici.objects.filter(
+            estacion_id=estacion_id, **{f'{campo_reservas}__lt': F(campo_bicis)}
+        ).update(**{campo_reservas: F(campo_reservas) + 1})
+    )
+
+
+def _descontar(conteos):
+    for (estacion_id, tipo), cantidad in conteos.items():
+        if not cantidad:
+            continue
+        campo_reservas = CAMPOS_TIPO[tipo][1]
+        DisponibilidadEstacionBici.objects.filter(estacion_id=estacion_id).update(
+            **{campo_reservas: F(campo_reservas) - cantidad}
+        )
+
+
+def liberar_reserva_borrada(reserva):
+    """Descuenta del contador una reserva que se borra mientras aún estaba activa."""
+    if reserva.activa:
+        _descontar({(reserva.estacion_id, reserva.tipo_bicicleta): 1})
+
+
+def desactivar_reservas(reservas):
+    """
+    Desactiva las reservas activas de `reservas` (queryset) y descuenta de los contadores
+    las que ha desactivado esta llamada. Devuelve cuántas han sido.
+    """
+    with transaction.atomic():
+        grupos = {}
+        for pk, estacion_id, tipo in reservas.filter(activa=True).values_list('pk', 'estacion_id', 'tipo_bicicleta'):
+            grupos.setdefault((estacion_id, tipo), []).append(pk)
+
+        # Si otro proceso desactiva alguna a la vez, el UPDATE no la cuenta y no se descuenta dos veces
+        conteos = {
+            clave: ReservaBici.objects.filter(pk__in=pks, activa=True).update(activa=False)
+            for clave, pks in grupos.items()
+        }
+        _descontar(conteos)
+    return sum(conteos.values())
+
+
+def expirar_reservas(**filtros):
+    """Desactiva las reservas ya expiradas que cumplan `filtros`."""
+    return desactivar_reservas(ReservaBici.objects.filter(expiracion__lte=now(), **filtros))
+
+
+def barrer_reservas_expiradas(tamano_lote=TAMANO_LOTE_EXPIRACION):
+    """
+    Desactiva todas las reservas expiradas en lotes pequeños por orden de expiración
+    (usa el índice de activa y expiracion), cada lote en su propia transacción para no
+    bloquear la tabla. Devuelve cuántas se han desactivado.
+    """
+    total = 0
+    while True:
+        pks = list(
+            ReservaBici.objects.filter(activa=True, expiracion__lte=now())
+            .order_by('expiracion').values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not pks:
+            return total
+        total += desactivar_reservas(ReservaBici.objects.filter(pk__in=pks))
+        if len(pks) < tamano_lote:
+            return total
@@ -11,16 +11,26 @@ class EstacionBiciLiteSerializer(serializers.ModelSerializer):
         model = EstacionBici
         fields = ['id', 'lat', 'lon']
 
+def ultima_actualizacion_disponibilidad():
+    return UltimaActualizacionBicing.objects.filter(tipo="disponibilidad").values_list(
+        'fecha_actualizacion_api', flat=True
+    ).first()
+
 class DisponibilidadEstacionBiciSerializer(serializers.ModelSerializer):
+    """
+    La vista pasa 'ultima_actualizacion_global' en el contexto para consultarla una vez
+    por petición y no una por estación.
+    """
     ultima_actualizacion_global = serializers.SerializerMethodField()
 
     class Meta:
         model = DisponibilidadEstacionBici
-        exclude = ['estacion']
+        exclude = ['estacion', 'reservas_mecanicas', 'reservas_electricas']
 
     def get_ultima_actualizacion_global(self, obj):
-        ultima = UltimaActualizacionBicing.objects.get(tipo="disponibilidad")
-        return ultima.fecha_actualizacion_api if ultima else None
+        if 'ultima_actualizacion_global' not in self.context:
+            self.context['ultima_actualizacion_global'] = ultima_actualizacion_disponibilidad()
+        return self.context['ultima_actualizacion_global']
 
 class EstacionBiciDetalleSerializer(serializers.ModelSerializer):
     estado = DisponibilidadEstacionBiciSerializer(read_only=True)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import EstacionBici, ReservaBici
+from .reservas import liberar_reserva_borrada
+from .utils import invalidar_estaciones_bici
+
+
+@receiver([post_save, post_delete], sender=EstacionBici)
+def invalidar_clusters_bici(sender, **kwargs):
+    invalidar_estaciones_bici()
+
+
+@receiver(post_delete, sender=ReservaBici)
+def liberar_plaza_reserva_borrada(sender, instance, **kwargs):
+    # El barrido no puede descontarla: la fila ya no existe
+    liberar_reserva_borrada(instance)
@@ -1,10 +1,27 @@
+import threading
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework_simplejwt.tokens import RefreshToken
 from unittest.mock import patch, Mock
 from django.utils.timezone import now, timedelta
-from estaciones_bici.models import EstacionBici, DisponibilidadEstacionBici, ReservaBici
+from estaciones_bici.models import (
+    BloqueoTarea, EstacionBici, DisponibilidadEstacionBici, HistorialDisponibilidadBici,
+    PrediccionDisponibilidadBici, ReservaBici, UltimaActualizacionBicing
+)
+from estaciones_bici.historial import registrar_muestras, decodificar_muestras, disponibilidad_historica
+from estaciones_bici.prediccion import registrar_observaciones, ALFA_MEDIA
+from estaciones_bici.reservas import admitir_reserva
+from estaciones_bici.serializers import EstacionBiciDetalleSerializer
+from estaciones_bici.utils import (
+    CLAVE_BLOQUEO_DISPONIBILIDAD, _estacion_bici, _lock_disponibilidad, actualizar_disponibilidad_estaciones,
+    clusters_estaciones_bici, guardar_estaciones_bici, refrescar_disponibilidad,
+    refrescar_disponibilidad_en_segundo_plano
+)
+from estaciones_bici.views import EstacionBiciLiteViewSet
 
 User = get_user_model()
 
@@ -49,6 +66,23 @@ class BicingForceEndpointsTests(APITestCase):
         response = self.client.post("/api/bicing/estaciones/forzar-actualizar/")
         self.assertEqual(response.status_code, 200)
 
+    @patch("estaciones_bici.views.refrescar_disponibilidad", return_value=False)
+    def test_forzar_actualizar_sin_actualizar_responde_503(self, mock_refrescar):
+        response = self.client.post("/api/bicing/estaciones/forzar-actualizar/")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("error", response.data)
+
+    @patch("estaciones_bici.views.refrescar_disponibilidad")
+    def test_forzar_actualizar_aprovecha_la_que_estaba_en_marcha(self, mock_refrescar):
+        # Mientras se esperaba, otra petición ha terminado su actualización
+        def otra_actualizacion(**kwargs):
+            UltimaActualizacionBicing.objects.create(tipo="disponibilidad", fecha_llamada=now(), fecha_actualizacion_api=now())
+            return False
+        mock_refrescar.side_effect = otra_actualizacion
+
+        response = self.client.post("/api/bicing/estaciones/forzar-actualizar/")
+        self.assertEqual(response.status_code, 200)
+
 
 class ReservaBiciTests(APITestCase):
     def setUp(self):
@@ -86,15 +120,13 @@ class ReservaBiciTests(APITestCase):
         self.assertEqual(response.data["activa"], True)
 
     def test_crear_reserva_fallida_sin_disponibilidad(self):
-        # Simula que todas las mecánicas están ya reservadas
+        # Reserva todas las mecánicas (el contador se mantiene al reservar por la API)
         for _ in range(3):
-            ReservaBici.objects.create(
-                usuario=self.user,
-                estacion=self.estacion,
-                tipo_bicicleta='mecanica',
-                activa=True,
-                expiracion=now() + timedelta(minutes=15)
-            )
+            response = self.client.post('/api/bicing/reservas/', {
+                "estacion": self.estacion.id,
+                "tipo_bicicleta": "mecanica"
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         response = self.client.post('/api/bicing/reservas/', {
             "estacion": self.estacion.id,
@@ -157,3 +189,442 @@ class ReservaBiciTests(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]["activa"], False)
         self.assertEqual(response.data[0]["tipo_bicicleta"], "electrica")
+
+
+class ClustersEstacionesBiciTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i, (lat, lon) in enumerate([(41.3851, 2.1734), (41.3852, 2.1735), (41.4036, 2.1744)]):
+            EstacionBici.objects.create(
+                station_id=100 + i,
+                name=f"Estacion {i}",
+                address="Calle Falsa",
+                lat=lat,
+                lon=lon,
+                capacity=20
+            )
+
+    def test_clusters_por_zoom(self):
+        response = self.client.get("/api/bicing/estaciones/clusters/", {"zoom": 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["clusters"]), 1)
+        self.assertEqual(response.data["clusters"][0]["num_estacions"], 3)
+        self.assertEqual(response.data["clusters"][0]["capacity_total"], 60)
+
+        response = self.client.get("/api/bicing/estaciones/clusters/", {"zoom": 20})
+        self.assertEqual(len(response.data["clusters"]), 3)
+        self.assertIn("lon", response.data["clusters"][0])
+
+    def test_clusters_sin_zoom(self):
+        response = self.client.get("/api/bicing/estaciones/clusters/")
+        self.assertEqual(response.status_code, 400)
+
+
+class RefrescoDisponibilidadTests(APITestCase):
+
+    @patch("estaciones_bici.views.refrescar_disponibilidad_en_segundo_plano")
+    def test_listar_lanza_actualizacion_en_segundo_plano(self, mock_segundo_plano):
+        response = self.client.get("/api/bicing/estaciones/")
+        self.assertEqual(response.status_code, 200)
+        mock_segundo_plano.assert_called_once()
+
+    @patch("estaciones_bici.utils.threading.Thread")
+    def test_segundo_plano_solo_si_hace_falta(self, mock_thread):
+        self.assertTrue(refrescar_disponibilidad_en_segundo_plano())
+        self.assertEqual(mock_thread.call_count, 1)
+
+        # Ya hay una actualización en marcha en este proceso
+        with _lock_disponibilidad:
+            self.assertFalse(refrescar_disponibilidad_en_segundo_plano())
+
+        UltimaActualizacionBicing.objects.create(tipo="disponibilidad", fecha_llamada=now(), fecha_actualizacion_api=now())
+        self.assertFalse(refrescar_disponibilidad_en_segundo_plano())
+        self.assertEqual(mock_thread.call_count, 1)
+
+    # El hilo no puede escribir el bloqueo en la base de datos mientras la transacción del test
+    # está abierta (SQLite): aquí se prueba el lock del proceso y el bloqueo en el test siguiente
+    @patch("estaciones_bici.utils.soltar_bloqueo")
+    @patch("estaciones_bici.utils.tomar_bloqueo", return_value=now())
+    @patch("estaciones_bici.utils.disponibilidad_actualizada_desde", return_value=False)
+    @patch("estaciones_bici.utils.actualizar_disponibilidad_estaciones")
+    def test_una_sola_actualizacion_a_la_vez(self, mock_actualizar, mock_reciente, mock_tomar, mock_soltar):
+        dentro = threading.Event()
+        salir = threading.Event()
+
+        def actualizar_lento():
+            dentro.set()
+            salir.wait(5)
+        mock_actualizar.side_effect = actualizar_lento
+
+        primero = threading.Thread(target=refrescar_disponibilidad)
+        primero.start()
+        dentro.wait(5)
+        # Mientras hay una en marcha, el resto de llamadas no vuelven a llamar a la API
+        resultados = [refrescar_disponibilidad() for _ in range(5)]
+        salir.set()
+        primero.join(5)
+
+        self.assertEqual(resultados, [False] * 5)
+        self.assertEqual(mock_actualizar.call_count, 1)
+
+    @patch("estaciones_bici.utils.actualizar_disponibilidad_estaciones")
+    def test_respeta_el_bloqueo_de_otro_proceso(self, mock_actualizar):
+        # Fila del bloqueo tomada por otro proceso (no comparte ni el lock ni la caché)
+        bloqueo = BloqueoTarea.objects.create(nombre=CLAVE_BLOQUEO_DISPONIBILIDAD, hasta=now() + timedelta(seconds=60))
+        self.assertFalse(refrescar_disponibilidad())
+        mock_actualizar.assert_not_called()
+
+        # Caducado (el proceso murió sin soltarlo)
+        bloqueo.hasta = now() - timedelta(seconds=1)
+        bloqueo.save()
+
+        self.assertTrue(refrescar_disponibilidad())
+        mock_actualizar.assert_called_once()
+        bloqueo.refresh_from_db()
+        self.assertLessEqual(bloqueo.hasta, now())
+
+    @patch("estaciones_bici.utils.actualizar_disponibilidad_estaciones")
+    def test_no_actualiza_si_los_datos_son_recientes(self, mock_actualizar):
+        UltimaActualizacionBicing.objects.create(tipo="disponibilidad", fecha_llamada=now(), fecha_actualizacion_api=now())
+        self.assertFalse(refrescar_disponibilidad())
+        mock_actualizar.assert_not_called()
+
+
+class ActualizacionDisponibilidadEnBloqueTests(APITestCase):
+    def setUp(self):
+        self.estaciones = [
+            EstacionBici.objects.create(
+                station_id=i, name=f"Estacion {i}", address="Calle", lat=41.38, lon=2.17, capacity=20
+            )
+            for i in range(1, 6)
+        ]
+
+    def _feed(self, mecanicas):
+        return {
+            "last_updated": 1234567890,
+            "data": {"stations": [
+                {
+                    "station_id": station_id, "num_bikes_available": num,
+                    "num_bikes_available_types": {"mechanical": num, "ebike": 0},
+                    "num_docks_available": 20 - num, "status": "IN_SERVICE",
+                }
+                for station_id, num in mecanicas.items()
+            ]},
+        }
+
+    @patch("estaciones_bici.utils.get_bicing_headers", return_value={})
+    @patch("estaciones_bici.utils.requests.get")
+    def test_solo_escribe_lo_que_cambia(self, mock_get, mock_headers):
+        mock_get.return_value = Mock(json=Mock(return_value=self._feed({1: 3, 2: 4, 3: 5, 99: 1})))
+        self.assertEqual(actualizar_disponibilidad_estaciones(), {"actualizadas": 0, "creadas": 3})
+
+        mock_get.return_value = Mock(json=Mock(return_value=self._feed({1: 3, 2: 7, 3: 5, 4: 1})))
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(actualizar_disponibilidad_estaciones(), {"actualizadas": 1, "creadas": 1})
+        # El número de consultas no depende del número de estaciones
+        self.assertLessEqual(len(consultas), 15)
+
+        estados = dict(DisponibilidadEstacionBici.objects.values_list("estacion__station_id", "num_bicis_mecanicas"))
+        self.assertEqual(estados, {1: 3, 2: 7, 3: 5, 4: 1})
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion__station_id=2).num_docks_disponibles, 13)
+
+
+class ImportacionEstacionesEnBloqueTests(APITestCase):
+    def _estacion(self, station_id, capacity=20, **extra):
+        return _estacion_bici({
+            "station_id": station_id, "name": f"Estacion {station_id}", "address": "Calle",
+            "lat": 41.38, "lon": 2.17, "capacity": capacity, "is_charging_station": False, **extra
+        })
+
+    def _comprobar_upsert(self):
+        original = EstacionBici.objects.create(
+            station_id=1, name="Antigua", address="Calle", lat=41.0, lon=2.0, capacity=10
+        )
+
+        guardados = guardar_estaciones_bici(
+            [self._estacion(1, capacity=30), self._estacion(2), self._estacion(3), self._estacion(3, capacity=5)],
+            tamano_lote=2,
+        )
+
+        self.assertEqual(guardados, 3)
+        self.assertEqual(EstacionBici.objects.count(), 3)
+        actualizada = EstacionBici.objects.get(station_id=1)
+        # Se conserva la fila (y con ella reservas y disponibilidad) y se actualizan los datos
+        self.assertEqual(actualizada.pk, original.pk)
+        self.assertEqual((actualizada.name, actualizada.capacity), ("Estacion 1", 30))
+        self.assertEqual(EstacionBici.objects.get(station_id=3).capacity, 5)
+
+    def test_upsert_con_on_conflict(self):
+        self._comprobar_upsert()
+
+    def test_upsert_sin_on_conflict(self):
+        with patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            self._comprobar_upsert()
+
+    def test_invalida_los_clusters(self):
+        clusters_estaciones_bici.clusters(0)
+        guardar_estaciones_bici([self._estacion(1)])
+        self.assertEqual(clusters_estaciones_bici.clusters(0)[0]["num_estacions"], 1)
+
+
+class HistorialDisponibilidadTests(APITestCase):
+    def setUp(self):
+        self.estacion = EstacionBici.objects.create(
+            station_id=1, name="Estacion 1", address="Calle", lat=41.38, lon=2.17, capacity=20
+        )
+        self.otra = EstacionBici.objects.create(
+            station_id=2, name="Estacion 2", address="Calle", lat=41.39, lon=2.18, capacity=20
+        )
+
+    def test_codificacion_compacta_y_solo_cambios(self):
+        inicio = now().replace(hour=8, minute=0, second=0, microsecond=0)
+        valores = [(5, 2, 13), (5, 2, 13), (4, 2, 14), (10, 0, 10), (0, 0, 20)]
+        for minuto, muestra in enumerate(valores):
+            registrar_muestras({self.estacion.id: muestra, self.otra.id: (1, 1, 18)}, inicio + timedelta(minutes=minuto))
+
+        fila = HistorialDisponibilidadBici.objects.get(estacion=self.estacion)
+        self.assertEqual(len(bytes(fila.muestras)), 4 * 8)  # la muestra repetida no se guarda
+        minutos, absolutos = decodificar_muestras(fila.muestras)
+        self.assertEqual(minutos.tolist(), [480, 482, 483, 484])
+        self.assertEqual(absolutos.tolist(), [[5, 2, 13], [4, 2, 14], [10, 0, 10], [0, 0, 20]])
+        self.assertEqual(len(bytes(HistorialDisponibilidadBici.objects.get(estacion=self.otra).muestras)), 8)
+
+    def test_consulta_ultimas_horas_con_estado_del_dia_anterior(self):
+        ahora = now()
+        registrar_muestras({self.estacion.id: (7, 1, 12)}, ahora - timedelta(days=2))
+        registrar_muestras({self.estacion.id: (3, 0, 17)}, ahora - timedelta(minutes=30))
+
+        response = self.client.get(f"/api/bicing/estaciones/{self.estacion.id}/disponibilidad_historica/?horas=2")
+
+        self.assertEqual(response.status_code, 200)
+        puntos = response.data["disponibilidad"]
+        self.assertEqual([p["num_bicis_mecanicas"] for p in puntos], [7, 3])
+        self.assertEqual(puntos[0]["momento"], response.data["desde"])
+        self.assertEqual(
+            self.client.get(f"/api/bicing/estaciones/{self.estacion.id}/disponibilidad_historica/?horas=0").status_code,
+            400
+        )
+
+    @patch("estaciones_bici.utils.get_bicing_headers", return_value={})
+    @patch("estaciones_bici.utils.requests.get")
+    def test_la_actualizacion_alimenta_el_historial(self, mock_get, mock_headers):
+        mock_get.return_value = Mock(json=Mock(return_value={
+            "last_updated": 1234567890,
+            "data": {"stations": [{
+                "station_id": 1, "num_bikes_available": 6,
+                "num_bikes_available_types": {"mechanical": 4, "ebike": 2},
+                "num_docks_available": 14, "status": "IN_SERVICE",
+            }]},
+        }))
+        actualizar_disponibilidad_estaciones()
+
+        puntos = disponibilidad_historica(self.estacion.id, now() - timedelta(hours=1))
+        self.assertEqual(
+            [(p["num_bicis_mecanicas"], p["num_bicis_electricas"], p["num_docks_disponibles"]) for p in puntos],
+            [(4, 2, 14)]
+        )
+
+
+class PrediccionDisponibilidadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='12345678')
+        self.estacion = EstacionBici.objects.create(
+            station_id=1, name="Estacion 1", address="Calle", lat=41.38, lon=2.17, capacity=20
+        )
+        DisponibilidadEstacionBici.objects.create(
+            estacion=self.estacion, num_bicis_disponibles=3, num_bicis_mecanicas=3,
+            num_bicis_electricas=0, num_docks_disponibles=17, estado="IN_SERVICE"
+        )
+
+    def _observar_semanas(self, valores, momento):
+        for semana, muestra in enumerate(valores):
+            registrar_observaciones({self.estacion.id: muestra}, momento - timedelta(weeks=len(valores) - semana))
+
+    def test_media_movil_una_vez_por_franja(self):
+        momento = now().replace(hour=8, minute=2, second=0, microsecond=0)
+        registrar_observaciones({self.estacion.id: (10, 4)}, momento)
+        registrar_observaciones({self.estacion.id: (0, 0)}, momento + timedelta(minutes=5))  # misma franja
+        registrar_observaciones({self.estacion.id: (0, 0)}, momento + timedelta(weeks=1))
+
+        fila = PrediccionDisponibilidadBici.objects.get(estacion=self.estacion)
+        self.assertEqual(fila.muestras, 2)
+        self.assertAlmostEqual(fila.media_mecanicas, 10 * (1 - ALFA_MEDIA))
+        self.assertAlmostEqual(fila.media_electricas, 4 * (1 - ALFA_MEDIA))
+
+    def test_endpoint_prediccion(self):
+        ahora = now()
+        self._observar_semanas([(6, 2)] * 3, ahora + timedelta(minutes=30))
+
+        response = self.client.get(f"/api/bicing/estaciones/{self.estacion.id}/prediccion/")
+
+        self.assertEqual(response.status_code, 200)
+        predicciones = {p["minutos"]: p for p in response.data["predicciones"]}
+        self.assertEqual(set(predicciones), {15, 30, 60})
+        self.assertEqual(predicciones[30]["num_bicis_mecanicas"], 6)
+        self.assertTrue(predicciones[30]["fiable"])
+
+    def test_reserva_avisa_si_se_preven_pocas_bicis(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        datos = {"estacion": self.estacion.id, "tipo_bicicleta": "mecanica"}
+
+        response = client.post('/api/bicing/reservas/', datos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("aviso", response.data)
+
+        self._observar_semanas([(0, 0)] * 3, now() + timedelta(minutes=15))
+        response = client.post('/api/bicing/reservas/', datos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("aviso", response.data)
+
+
+class ContadoresReservaBiciTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='12345678')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.estacion = EstacionBici.objects.create(
+            station_id=101, name="Estació Test", address="Carrer Test", lat=41.38, lon=2.17, capacity=20
+        )
+        self.otra = EstacionBici.objects.create(
+            station_id=102, name="Otra", address="Carrer Test", lat=41.39, lon=2.18, capacity=20
+        )
+        for estacion in (self.estacion, self.otra):
+            DisponibilidadEstacionBici.objects.create(
+                estacion=estacion, num_bicis_disponibles=1, num_bicis_mecanicas=1,
+                num_bicis_electricas=0, num_docks_disponibles=19, estado="IN_SERVICE"
+            )
+
+    def _reservar(self, estacion, tipo="mecanica"):
+        return self.client.post('/api/bicing/reservas/', {"estacion": estacion.id, "tipo_bicicleta": tipo}, format='json')
+
+    def test_admision_con_un_update_condicional(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(admitir_reserva(self.estacion.id, "mecanica"))
+        with self.assertNumQueries(1):
+            self.assertFalse(admitir_reserva(self.estacion.id, "mecanica"))
+        self.assertFalse(admitir_reserva(self.estacion.id, "electrica"))
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.estacion).reservas_mecanicas, 1)
+
+    def test_cancelar_libera_la_plaza(self):
+        reserva = self._reservar(self.estacion).data
+        self.assertEqual(self._reservar(self.estacion).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.client.delete(f'/api/bicing/reservas/{reserva["id"]}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/bicing/reservas/{reserva["id"]}/').status_code, 404)
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.estacion).reservas_mecanicas, 0)
+        self.assertEqual(self._reservar(self.estacion).status_code, status.HTTP_201_CREATED)
+
+    def test_reserva_expirada_libera_la_plaza_sin_tocar_otras_estaciones(self):
+        self._reservar(self.estacion)
+        self._reservar(self.otra)
+        ReservaBici.objects.update(expiracion=now() - timedelta(minutes=1))
+
+        self.assertEqual(self._reservar(self.estacion).status_code, status.HTTP_201_CREATED)
+
+        self.assertTrue(ReservaBici.objects.get(estacion=self.otra).activa)
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.estacion).reservas_mecanicas, 1)
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.otra).reservas_mecanicas, 1)
+
+    def test_no_se_puede_cambiar_el_tipo_de_una_reserva(self):
+        reserva = self._reservar(self.estacion).data
+
+        for metodo in (self.client.patch, self.client.put):
+            response = metodo(f'/api/bicing/reservas/{reserva["id"]}/', {"tipo_bicicleta": "electrica"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(ReservaBici.objects.get(pk=reserva["id"]).tipo_bicicleta, "mecanica")
+
+        self.assertEqual(self.client.delete(f'/api/bicing/reservas/{reserva["id"]}/').status_code, 200)
+        disponibilidad = DisponibilidadEstacionBici.objects.get(estacion=self.estacion)
+        self.assertEqual((disponibilidad.reservas_mecanicas, disponibilidad.reservas_electricas), (0, 0))
+        self.assertEqual(self._reservar(self.estacion).status_code, status.HTTP_201_CREATED)
+
+    def test_borrar_el_usuario_libera_sus_reservas(self):
+        self._reservar(self.estacion)
+        cancelada = self._reservar(self.otra).data
+        self.client.delete(f'/api/bicing/reservas/{cancelada["id"]}/')
+
+        self.user.delete()
+
+        self.assertFalse(ReservaBici.objects.exists())
+        for estacion in (self.estacion, self.otra):
+            self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=estacion).reservas_mecanicas, 0)
+
+    def test_sin_datos_de_disponibilidad(self):
+        DisponibilidadEstacionBici.objects.filter(estacion=self.estacion).delete()
+        response = self._reservar(self.estacion)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("No hay datos de disponibilidad", str(response.data))
+
+
+class BarridoReservasBiciTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='12345678')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.estacion = EstacionBici.objects.create(
+            station_id=101, name="Estació Test", address="Carrer Test", lat=41.38, lon=2.17, capacity=20
+        )
+        DisponibilidadEstacionBici.objects.create(
+            estacion=self.estacion, num_bicis_disponibles=5, num_bicis_mecanicas=5,
+            num_bicis_electricas=0, num_docks_disponibles=15, estado="IN_SERVICE"
+        )
+        for _ in range(5):
+            self.client.post('/api/bicing/reservas/', {"estacion": self.estacion.id, "tipo_bicicleta": "mecanica"}, format='json')
+        self.expiradas = list(ReservaBici.objects.order_by('pk').values_list('pk', flat=True)[:3])
+        ReservaBici.objects.filter(pk__in=self.expiradas).update(expiracion=now() - timedelta(minutes=1))
+
+    def test_barrido_por_lotes_libera_las_plazas(self):
+        call_command('expirar_reservas_bici', lote=2, stdout=Mock())
+
+        self.assertEqual(
+            set(ReservaBici.objects.filter(activa=False).values_list('pk', flat=True)), set(self.expiradas)
+        )
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.estacion).reservas_mecanicas, 2)
+
+    def test_cancelar_una_expirada_sin_barrer(self):
+        response = self.client.delete(f'/api/bicing/reservas/{self.expiradas[0]}/')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["detail"], "La reserva ya no está activa.")
+        self.assertFalse(ReservaBici.objects.get(pk=self.expiradas[0]).activa)
+        self.assertEqual(DisponibilidadEstacionBici.objects.get(estacion=self.estacion).reservas_mecanicas, 4)
+
+    def test_las_lecturas_no_escriben(self):
+        mis_reservas = self.client.get('/api/bicing/reservas/mis_reservas/')
+        historial = self.client.get('/api/bicing/reservas/historial/')
+
+        self.assertEqual(len(mis_reservas.data), 2)
+        self.assertEqual(len(historial.data), 3)
+        self.assertTrue(all(not reserva["activa"] for reserva in historial.data))
+        self.assertEqual(ReservaBici.objects.filter(activa=True).count(), 5)
+
+
+class ConsultasEstacionesBiciTests(APITestCase):
+    def setUp(self):
+        UltimaActualizacionBicing.objects.create(tipo="disponibilidad", fecha_llamada=now(), fecha_actualizacion_api=now())
+        self._crear_estaciones(0, 3)
+
+    def _crear_estaciones(self, desde, hasta):
+        for i in range(desde, hasta):
+            estacion = EstacionBici.objects.create(
+                station_id=i, name=f"Estacion {i}", address="Calle", lat=41.38, lon=2.17, capacity=20
+            )
+            DisponibilidadEstacionBici.objects.create(estacion=estacion, num_bicis_mecanicas=i)
+
+    def test_detalle_con_consultas_constantes(self):
+        estacion = EstacionBici.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/bicing/estaciones/{estacion.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data["estado"]["ultima_actualizacion_global"])
+
+    def test_volcado_sin_n_mas_1(self):
+        self._crear_estaciones(3, 10)
+        vista = EstacionBiciLiteViewSet(action='retrieve', request=None, format_kwarg=None)
+        # Estaciones con su estado y la fecha global de actualización, sea cual sea el número de estaciones
+        with self.assertNumQueries(2):
+            datos = EstacionBiciDetalleSerializer(
+                vista.get_queryset(), many=True, context=vista.get_serializer_context()
+            ).data
+        self.assertEqual(len(datos), 10)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EstacionBiciLiteViewSet, forzar_importar_estaciones, forzar_actualizar_disponibilidad, ReservaBiciViewSet
+from .views import EstacionBiciLiteViewSet, forzar_importar_estaciones, forzar_actualizar_disponibilidad, ReservaBiciViewSet, clusters_estaciones
 
 router = DefaultRouter()
 router.register(r'estaciones', EstacionBiciLiteViewSet)
@@ -9,5 +9,6 @@ router.register(r'reservas', ReservaBiciViewSet, basename='reserva-bici')
 urlpatterns = [
     path('estaciones/forzar-importar/', forzar_importar_estaciones),
     path('estaciones/forzar-actualizar/', forzar_actualizar_disponibilidad),
+    path('estaciones/clusters/', clusters_estaciones),
     path('', include(router.urls)),
 ]
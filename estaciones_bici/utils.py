@@ -1,8 +1,39 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import itertools
 import requests
 import os
+import threading
+import time
+from django.db import connection, transaction
 from django.utils.timezone import make_aware, now
-from .models import EstacionBici, DisponibilidadEstacionBici, UltimaActualizacionBicing
+from .models import BloqueoTarea, EstacionBici, DisponibilidadEstacionBici, UltimaActualizacionBicing
+from .historial import registrar_muestras
+from .prediccion import registrar_observaciones
+from api_punts_carrega.clustering import MotorClusters
+from api_punts_carrega.spatial_index import incrementar_version
+
+CLAVE_VERSION_ESTACIONES_BICI = 'estaciones_bici:version'
+
+INTERVALO_DISPONIBILIDAD = timedelta(minutes=1)
+CLAVE_BLOQUEO_DISPONIBILIDAD = 'estaciones_bici:disponibilidad:bloqueo'
+# Si el proceso que tiene el bloqueo muere, caduca solo pasado este tiempo
+TIMEOUT_BLOQUEO_DISPONIBILIDAD = timedelta(seconds=120)
+ESPERA_MAXIMA_DISPONIBILIDAD = 30
+
+_lock_disponibilidad = threading.Lock()
+
+TAMANO_LOTE_BICING = 500
+CAMPOS_ESTACION_BICI = ["name", "address", "post_code", "lat", "lon", "capacity", "is_charging_station"]
+CAMPOS_DISPONIBILIDAD = [
+    "num_bicis_disponibles", "num_bicis_mecanicas", "num_bicis_electricas", "num_docks_disponibles", "estado"
+]
+
+clusters_estaciones_bici = MotorClusters(
+    EstacionBici, CLAVE_VERSION_ESTACIONES_BICI, campo_lng='lon', campos_suma=('capacity',)
+)
+
+def invalidar_estaciones_bici():
+    incrementar_version(CLAVE_VERSION_ESTACIONES_BICI)
 
 def get_bicing_headers() -> dict:
     token = os.environ.get("Token_openData")
@@ -15,6 +46,56 @@ def get_bicing_headers() -> dict:
         "Accept": "application/json"
     }
 
+def _estacion_bici(est):
+    return EstacionBici(
+        station_id=est["station_id"],
+        name=est["name"],
+        address=est["address"],
+        post_code=est.get("post_code"),
+        lat=est["lat"],
+        lon=est["lon"],
+        capacity=est["capacity"],
+        is_charging_station=est["is_charging_station"],
+    )
+
+def _actualizar_por_diferencias(lote):
+    """Alternativa a ON CONFLICT DO UPDATE: lee el lote existente y escribe solo lo que cambia."""
+    existentes = EstacionBici.objects.in_bulk([estacion.station_id for estacion in lote], field_name="station_id")
+    cambiadas = []
+    nuevas = []
+    for estacion in lote:
+        actual = existentes.get(estacion.station_id)
+        if actual is None:
+            nuevas.append(estacion)
+        elif any(getattr(actual, campo) != getattr(estacion, campo) for campo in CAMPOS_ESTACION_BICI):
+            estacion.pk = actual.pk
+            cambiadas.append(estacion)
+    EstacionBici.objects.bulk_update(cambiadas, CAMPOS_ESTACION_BICI)
+    EstacionBici.objects.bulk_create(nuevas)
+
+def guardar_estaciones_bici(estaciones, tamano_lote=TAMANO_LOTE_BICING):
+    """
+    Alta o actualización en bloque de estaciones por station_id. Cada lote va en su propia
+    transacción corta, para no bloquear durante mucho rato las escrituras de la
+    disponibilidad. Con bases de datos que admiten ON CONFLICT (PostgreSQL, SQLite) es un
+    solo INSERT por lote; si no, se compara con lo guardado.
+    """
+    # Si el feed repite una estación, se queda la última
+    estaciones = list({estacion.station_id: estacion for estacion in estaciones}.values())
+    for inicio in range(0, len(estaciones), tamano_lote):
+        lote = estaciones[inicio:inicio + tamano_lote]
+        with transaction.atomic():
+            if connection.features.supports_update_conflicts_with_target:
+                EstacionBici.objects.bulk_create(
+                    lote, update_conflicts=True, unique_fields=["station_id"], update_fields=CAMPOS_ESTACION_BICI
+                )
+            else:
+                _actualizar_por_diferencias(lote)
+    # Las operaciones en bloque no lanzan post_save: se invalidan a mano los clústeres
+    if estaciones:
+        invalidar_estaciones_bici()
+    return len(estaciones)
+
 def importar_estaciones_bici_desde_api():
     url = os.environ.get("BICING_API_INFO_URL")
 
@@ -27,19 +108,7 @@ def importar_estaciones_bici_desde_api():
     last_updated = json_data.get("last_updated")  # <-- si la API lo da
     estaciones = json_data["data"]["stations"]
 
-    for est in estaciones:
-        EstacionBici.objects.update_or_create(
-            station_id=est["station_id"],
-            defaults={
-                "name": est["name"],
-                "address": est["address"],
-                "post_code": est.get("post_code"),
-                "lat": est["lat"],
-                "lon": est["lon"],
-                "capacity": est["capacity"],
-                "is_charging_station": est["is_charging_station"],
-            }
-        )
+    guardar_estaciones_bici(_estacion_bici(est) for est in estaciones)
 
     UltimaActualizacionBicing.objects.update_or_create(
         tipo="informacion",
@@ -49,7 +118,23 @@ def importar_estaciones_bici_desde_api():
         }
     )
 
+def _datos_disponibilidad(est):
+    return {
+        "num_bicis_disponibles": est["num_bikes_available"],
+        "num_bicis_mecanicas": est["num_bikes_available_types"].get("mechanical", 0),
+        "num_bicis_electricas": est["num_bikes_available_types"].get("ebike", 0),
+        "num_docks_disponibles": est["num_docks_available"],
+        "estado": est["status"],
+    }
+
 def actualizar_disponibilidad_estaciones():
+    """
+    Guarda la disponibilidad en tiempo real. Se leen de una vez las filas existentes, se
+    comparan en memoria y solo se escriben (en bloque y en una transacción) las que han
+    cambiado y las nuevas, que también se añaden al historial (ver historial.py). Todas
+    las estaciones alimentan la tabla de predicción (ver prediccion.py).
+    Devuelve cuántas se han actualizado y creado.
+    """
     url = os.environ.get("BICING_API_REALTIME_URL")
     
     headers = get_bicing_headers()
@@ -61,29 +146,118 @@ def actualizar_disponibilidad_estaciones():
     last_updated = json_data["last_updated"]
     estaciones = json_data["data"]["stations"]
 
-    estaciones_bd = {e.station_id: e for e in EstacionBici.objects.all()}
-    for est in estaciones:
-        try:
-            estacion = estaciones_bd.get(est["station_id"])
-            if not estacion:
+    ids_estaciones = dict(EstacionBici.objects.values_list("station_id", "id"))
+    with transaction.atomic():
+        existentes = {d.estacion_id: d for d in DisponibilidadEstacionBici.objects.all()}
+        cambiadas = {}
+        nuevas = {}
+        observaciones = {}
+        for est in estaciones:
+            estacion_id = ids_estaciones.get(est["station_id"])
+            if estacion_id is None:
                 continue
-            DisponibilidadEstacionBici.objects.update_or_create(
-                estacion=estacion,
-                defaults={
-                    "num_bicis_disponibles": est["num_bikes_available"],
-                    "num_bicis_mecanicas": est["num_bikes_available_types"].get("mechanical", 0),
-                    "num_bicis_electricas": est["num_bikes_available_types"].get("ebike", 0),
-                    "num_docks_disponibles": est["num_docks_available"],
-                    "estado": est["status"]
-                }
-            )
-        except EstacionBici.DoesNotExist:
-            continue
+            datos = _datos_disponibilidad(est)
+            observaciones[estacion_id] = (datos["num_bicis_mecanicas"], datos["num_bicis_electricas"])
+            actual = existentes.get(estacion_id)
+            if actual is None:
+                nuevas[estacion_id] = DisponibilidadEstacionBici(estacion_id=estacion_id, **datos)
+            elif any(getattr(actual, campo) != valor for campo, valor in datos.items()):
+                for campo, valor in datos.items():
+                    setattr(actual, campo, valor)
+                cambiadas[estacion_id] = actual
 
-    UltimaActualizacionBicing.objects.update_or_create(
-        tipo="disponibilidad",
-        defaults={
-            "fecha_llamada": now(),
-            "fecha_actualizacion_api": make_aware(datetime.fromtimestamp(last_updated))
-        }
-    )
\ No newline at end of file
+        DisponibilidadEstacionBici.objects.bulk_update(
+            cambiadas.values(), CAMPOS_DISPONIBILIDAD, batch_size=TAMANO_LOTE_BICING
+        )
+        DisponibilidadEstacionBici.objects.bulk_create(nuevas.values(), batch_size=TAMANO_LOTE_BICING)
+        registrar_muestras({
+            estacion_id: (disponibilidad.num_bicis_mecanicas, disponibilidad.num_bicis_electricas, disponibilidad.num_docks_disponibles)
+            for estacion_id, disponibilidad in itertools.chain(cambiadas.items(), nuevas.items())
+        })
+        registrar_observaciones(observaciones)
+
+        UltimaActualizacionBicing.objects.update_or_create(
+            tipo="disponibilidad",
+            defaults={
+                "fecha_llamada": now(),
+                "fecha_actualizacion_api": make_aware(datetime.fromtimestamp(last_updated))
+            }
+        )
+    return {"actualizadas": len(cambiadas), "creadas": len(nuevas)}
+
+
+def tomar_bloqueo(nombre, duracion):
+    """
+    Intenta tomar el bloqueo `nombre` (BloqueoTarea) durante `duracion`. Devuelve la marca
+    con la que soltarlo, o None si lo tiene otro proceso. Debe llamarse fuera de una
+    transacción para que los demás procesos lo vean enseguida.
+    """
+    ahora = now()
+    BloqueoTarea.objects.bulk_create([BloqueoTarea(nombre=nombre, hasta=ahora)], ignore_conflicts=True)
+    hasta = ahora + duracion
+    if BloqueoTarea.objects.filter(nombre=nombre, hasta__lte=ahora).update(hasta=hasta):
+        return hasta
+    return None
+
+def soltar_bloqueo(nombre, marca):
+    # Si ya había caducado y lo tiene otro proceso, la marca no coincide y no se toca
+    BloqueoTarea.objects.filter(nombre=nombre, hasta=marca).update(hasta=now())
+
+def disponibilidad_actualizada_desde(momento):
+    return UltimaActualizacionBicing.objects.filter(tipo="disponibilidad", fecha_llamada__gte=momento).exists()
+
+
+def refrescar_disponibilidad(max_edad=INTERVALO_DISPONIBILIDAD, esperar=False, espera_maxima=ESPERA_MAXIMA_DISPONIBILIDAD):
+    """
+    Actualiza la disponibilidad si la última actualización tiene más de max_edad, con a lo
+    sumo una actualización en marcha a la vez: un lock dentro del proceso y una fila de
+    BloqueoTarea en la base de datos entre procesos. Si ya hay una en marcha, con esperar=False se
+    vuelve enseguida y con esperar=True se espera a que acabe y se aprovecha su resultado
+    en lugar de llamar otra vez a la API. Devuelve True si esta llamada ha actualizado.
+    """
+    reciente_desde = now() - max_edad
+    if not _lock_disponibilidad.acquire(blocking=esperar, timeout=espera_maxima if esperar else -1):
+        return False
+    try:
+        limite = time.monotonic() + espera_maxima
+        while True:
+            if disponibilidad_actualizada_desde(reciente_desde):
+                return False
+            marca = tomar_bloqueo(CLAVE_BLOQUEO_DISPONIBILIDAD, TIMEOUT_BLOQUEO_DISPONIBILIDAD)
+            if marca is not None:
+                break
+            # Otro proceso está actualizando
+            if not esperar or time.monotonic() >= limite:
+                return False
+            time.sleep(0.2)
+
+        try:
+            # Puede haber acabado otra actualización justo antes de tomar el bloqueo
+            if disponibilidad_actualizada_desde(reciente_desde):
+                return False
+            actualizar_disponibilidad_estaciones()
+            return True
+        finally:
+            soltar_bloqueo(CLAVE_BLOQUEO_DISPONIBILIDAD, marca)
+    finally:
+        _lock_disponibilidad.release()
+
+
+def refrescar_disponibilidad_en_segundo_plano():
+    """
+    Lanza refrescar_disponibilidad en un hilo si los datos tienen más de INTERVALO_DISPONIBILIDAD
+    y este proceso no está ya actualizando, sin hacer esperar a quien la llama. Entre procesos
+    decide el bloqueo de refrescar_disponibilidad. Devuelve True si ha lanzado el hilo.
+    """
+    if _lock_disponibilidad.locked() or disponibilidad_actualizada_desde(now() - INTERVALO_DISPONIBILIDAD):
+        return False
+    threading.Thread(target=_refrescar_disponibilidad_en_hilo, daemon=True).start()
+    return True
+
+
+def _refrescar_disponibilidad_en_hilo():
+    try:
+        refrescar_disponibilidad()
+    finally:
+        # El hilo abre su propia conexión y nadie más la cerraría
+        connection.close()
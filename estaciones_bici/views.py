@@ -1,16 +1,28 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status, serializers
 from .models import EstacionBici, DisponibilidadEstacionBici, ReservaBici, UltimaActualizacionBicing    
-from .serializers import EstacionBiciSerializer, EstacionBiciLiteSerializer, ReservaBiciSerializer
-from .utils import importar_estaciones_bici_desde_api, actualizar_disponibilidad_estaciones
+from .serializers import (
+    EstacionBiciSerializer, EstacionBiciLiteSerializer, ReservaBiciSerializer, ultima_actualizacion_disponibilidad
+)
+from .historial import disponibilidad_historica
+from .prediccion import predecir
+from .reservas import CAMPOS_TIPO, admitir_reserva, desactivar_reservas, expirar_reservas
+from .utils import (
+    importar_estaciones_bici_desde_api, refrescar_disponibilidad, refrescar_disponibilidad_en_segundo_plano,
+    disponibilidad_actualizada_desde, clusters_estaciones_bici
+)
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.utils.cache import patch_cache_control
 from django.utils.timezone import now, timedelta
 from rest_framework.viewsets import ModelViewSet
-import threading
+from django.db import transaction
+from django.db.models import Q
 
 RESERVA_BICI_MINUTOS = 15
+HORAS_HISTORIAL_DEFECTO = 24
+HORAS_HISTORIAL_MAXIMAS = 24 * 7
 
 """""
 class EstacionBiciViewSet(viewsets.ReadOnlyModelViewSet):
@@ -20,23 +32,58 @@ class EstacionBiciViewSet(viewsets.ReadOnlyModelViewSet):
 """""
 
 class EstacionBiciLiteViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    La disponibilidad se lee tal como está en la base de datos. Si tiene más de un minuto, el
+    listado lanza una actualización en segundo plano sin esperarla (a lo sumo una a la vez, ver
+    utils.refrescar_disponibilidad_en_segundo_plano); el comando actualizar_disponibilidad_bicing
+    --loop la mantiene al día aunque nadie consulte.
+    """
     queryset = EstacionBici.objects.all()
     serializer_class = EstacionBiciLiteSerializer
     permission_classes = [permissions.AllowAny]
 
     def list(self, request, *args, **kwargs):
-        def actualizar_si_es_necesario():
-            try:
-                ultima = UltimaActualizacionBicing.objects.get(tipo="disponibilidad")
-                hace_un_minuto = now() - timedelta(minutes=1)
-                if ultima.fecha_llamada < hace_un_minuto:
-                    actualizar_disponibilidad_estaciones()
-            except UltimaActualizacionBicing.DoesNotExist:
-                actualizar_disponibilidad_estaciones()
+        refrescar_disponibilidad_en_segundo_plano()
+        return super().list(request, *args, **kwargs)
 
-        threading.Thread(target=actualizar_si_es_necesario).start()
+    @action(detail=True, methods=['get'])
+    def disponibilidad_historica(self, request, pk=None):
+        """Cambios de disponibilidad de la estación en las últimas ?horas (por defecto 24, máximo una semana)."""
+        estacion = self.get_object()
+        try:
+            horas = float(request.query_params.get('horas', HORAS_HISTORIAL_DEFECTO))
+        except ValueError:
+            horas = None
+        if horas is None or not 0 < horas <= HORAS_HISTORIAL_MAXIMAS:
+            return Response(
+                {"error": f"'horas' debe ser un número entre 0 y {HORAS_HISTORIAL_MAXIMAS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        hasta = now()
+        return Response({
+            "estacion": estacion.id,
+            "desde": hasta - timedelta(hours=horas),
+            "hasta": hasta,
+            "disponibilidad": disponibilidad_historica(estacion.id, hasta - timedelta(hours=horas), hasta),
+        })
 
-        return super().list(request, *args, **kwargs)
+    @action(detail=True, methods=['get'])
+    def prediccion(self, request, pk=None):
+        """Bicis mecánicas y eléctricas previstas dentro de 15, 30 y 60 minutos (ver prediccion.py)."""
+        estacion = self.get_object()
+        return Response({"estacion": estacion.id, "predicciones": predecir(estacion.id)})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.select_related('estado')
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['ultima_actualizacion_global'] = ultima_actualizacion_disponibilidad()
+        return context
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -45,6 +92,42 @@ class EstacionBiciLiteViewSet(viewsets.ReadOnlyModelViewSet):
         from .serializers import EstacionBiciLiteSerializer
         return EstacionBiciLiteSerializer
     
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def clusters_estaciones(request):
+    """
+    Clústeres de estaciones de Bicing (centroide, número y capacidad total) para ?zoom y,
+    opcionalmente, la caja visible del mapa con lat_min, lat_max, lng_min y lng_max.
+    """
+    try:
+        zoom = int(request.query_params.get('zoom'))
+    except (TypeError, ValueError):
+        zoom = None
+    if zoom is None or not 0 <= zoom <= clusters_estaciones_bici.zoom_maximo:
+        return Response(
+            {"error": f"Se requiere el parámetro 'zoom' entre 0 y {clusters_estaciones_bici.zoom_maximo}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    nombres_caja = ('lat_min', 'lat_max', 'lng_min', 'lng_max')
+    caja = [request.query_params.get(nombre) for nombre in nombres_caja]
+    if any(valor is not None for valor in caja):
+        try:
+            caja = [float(valor) for valor in caja]
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "La caja requiere valores numéricos para lat_min, lat_max, lng_min y lng_max"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        clusters = clusters_estaciones_bici.clusters(zoom, *caja)
+    else:
+        clusters = clusters_estaciones_bici.clusters(zoom)
+
+    response = Response({'zoom': zoom, 'clusters': clusters})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def forzar_importar_estaciones(request):
@@ -55,16 +138,31 @@ def forzar_importar_estaciones(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def forzar_actualizar_disponibilidad(request):
-    actualizar_disponibilidad_estaciones()
+    # Si ya hay una actualización en marcha se espera a que acabe en lugar de lanzar otra
+    inicio = now()
+    if not refrescar_disponibilidad(max_edad=timedelta(0), esperar=True) and not disponibilidad_actualizada_desde(inicio):
+        # La que estaba en marcha no ha acabado a tiempo o ha fallado
+        return Response(
+            {"error": "Hay otra actualización en curso; inténtalo de nuevo en unos segundos."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     return Response({"message": "Disponibilidad actualizada correctamente."})
 
 class ReservaBiciViewSet(ModelViewSet):
     queryset = ReservaBici.objects.all()
     serializer_class = ReservaBiciSerializer
     permission_classes = [IsAuthenticated]
+    # Sin PUT/PATCH: cambiar la estación o el tipo descuadraría los contadores (ver reservas.py).
+    # Para cambiar una reserva se cancela y se crea otra
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
     def get_queryset(self):
-        return ReservaBici.objects.filter(usuario=self.request.user, activa=True)
+        reservas = ReservaBici.objects.filter(usuario=self.request.user, activa=True)
+        if self.action == 'destroy':
+            # Cancelar una expirada que el barrido aún no ha desactivado responde 400, no 404
+            return reservas
+        # Las expiradas las desactiva el comando expirar_reservas_bici; aquí solo se filtran
+        return reservas.filter(expiracion__gt=now())
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -73,44 +171,53 @@ class ReservaBiciViewSet(ModelViewSet):
         estacion = serializer.validated_data["estacion"]
         tipo = serializer.validated_data["tipo_bicicleta"]
 
-        # Obtener disponibilidad real
-        try:
-            disponibilidad = estacion.estado
-        except:
-            raise serializers.ValidationError("No hay datos de disponibilidad.")
-
-        # Limpiar reservas expiradas
-        ReservaBici.objects.filter(activa=True, expiracion__lt=now()).update(activa=False)
-
-        reservas_activas = ReservaBici.objects.filter(
-            estacion=estacion,
-            tipo_bicicleta=tipo,
-            activa=True,
-            expiracion__gt=now()
-        ).count()
-
-        disponibles = (
-            disponibilidad.num_bicis_mecanicas if tipo == 'mecanica'
-            else disponibilidad.num_bicis_electricas
-        )
+        # Un UPDATE condicional sobre el contador del tipo (ver reservas.py)
+        with transaction.atomic():
+            admitida = admitir_reserva(estacion.id, tipo)
+            # Puede que el contador aún cuente reservas expiradas de esta estación
+            if not admitida and expirar_reservas(estacion=estacion, tipo_bicicleta=tipo):
+                admitida = admitir_reserva(estacion.id, tipo)
+            if not admitida:
+                if not DisponibilidadEstacionBici.objects.filter(estacion=estacion).exists():
+                    raise serializers.ValidationError("No hay datos de disponibilidad.")
+                raise serializers.ValidationError("No hay bicicletas disponibles para reservar.")
 
-        if reservas_activas >= disponibles:
-            raise serializers.ValidationError("No hay bicicletas disponibles para reservar.")
-
-        reserva = serializer.save(
-            usuario=request.user,
-            expiracion=now() + timedelta(minutes=RESERVA_BICI_MINUTOS),
-            activa=True
-        )
+            reserva = serializer.save(
+                usuario=request.user,
+                expiracion=now() + timedelta(minutes=RESERVA_BICI_MINUTOS),
+                activa=True
+            )
 
         response_serializer = self.get_serializer(reserva)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        data = response_serializer.data
+        aviso = self._aviso_prediccion(estacion, tipo)
+        if aviso:
+            data["aviso"] = aviso
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def _aviso_prediccion(self, estacion, tipo):
+        """
+        Aviso (la reserva se acepta igual) si la predicción para cuando expira la reserva
+        no llega a cubrir las bicis reservadas de ese tipo.
+        """
+        prediccion, = predecir(estacion.id, horizontes=(RESERVA_BICI_MINUTOS,))
+        if not prediccion['fiable']:
+            return None
+        previstas = prediccion['num_bicis_mecanicas' if tipo == 'mecanica' else 'num_bicis_electricas']
+        reservadas = DisponibilidadEstacionBici.objects.filter(estacion=estacion).values_list(
+            CAMPOS_TIPO[tipo][1], flat=True
+        ).first()
+        if previstas >= (reservadas or 0):
+            return None
+        return (
+            f"Según el histórico, dentro de {RESERVA_BICI_MINUTOS} minutos se prevén {previstas} "
+            f"bicis de este tipo en la estación; podría no quedar ninguna al llegar."
+        )
 
 
     @action(detail=False, methods=['get'])
     def mis_reservas(self, request):
-        ReservaBici.objects.filter(usuario=request.user, activa=True, expiracion__lt=now()).update(activa=False)
-        reservas = ReservaBici.objects.filter(usuario=request.user, activa=True)
+        reservas = self.get_queryset()
         serializer = self.get_serializer(reservas, many=True)
         return Response(serializer.data)
     
@@ -123,14 +230,21 @@ class ReservaBiciViewSet(ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        if not reserva.activa:
+        if reserva.ha_expirado():
+            # Se libera ya su plaza, sin esperar al barrido
+            desactivar_reservas(ReservaBici.objects.filter(pk=reserva.pk))
+            return Response(
+                {"detail": "La reserva ya no está activa."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Solo cuenta si la desactiva esta petición, para no liberar la plaza dos veces
+        if not reserva.activa or not desactivar_reservas(ReservaBici.objects.filter(pk=reserva.pk)):
             return Response(
                 {"detail": "La reserva ya no está activa."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        reserva.activa = False
-        reserva.save()
         return Response(
             {"detail": "Reserva cancelada correctamente."},
             status=status.HTTP_200_OK
@@ -138,7 +252,11 @@ class ReservaBiciViewSet(ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def historial(self, request):
-        ReservaBici.objects.filter(usuario=request.user, activa=True, expiracion__lt=now()).update(activa=False)
-        reservas = ReservaBici.objects.filter(usuario=request.user, activa=False)
+        reservas = list(ReservaBici.objects.filter(
+            Q(activa=False) | Q(expiracion__lte=now()), usuario=request.user
+        ))
+        # Las expiradas que el barrido aún no ha desactivado se muestran como inactivas
+        for reserva in reservas:
+            reserva.activa = False
         serializer = self.get_serializer(reservas, many=True)
         return Response(serializer.data)
@@ -1,4 +1,4 @@
-import math
+import numpy as np
 
 from django.shortcuts import get_object_or_404
 from django.db.models import Q, Max
@@ -18,6 +18,7 @@ from .models import  (
     Report,
 )
 from api_punts_carrega.models import Usuario
+from api_punts_carrega.geo import haversine_distances
 from .serializers import ( 
     ChatSerializer,
     AlertSerializer,
@@ -98,13 +99,12 @@ class AlertsViewSet(viewsets.ModelViewSet):
         if active_only:
             alerts_queryset = alerts_queryset.filter(is_active=True)
             
-        alerts_with_distance = []
-        for alert in alerts_queryset:
-            distance = haversine_distance(lat_usuario, lng_usuario, alert.lat, alert.lng)
-            alerts_with_distance.append((alert, distance))
+        alerts = list(alerts_queryset)
+        lats = np.fromiter((alert.lat for alert in alerts), dtype=np.float64, count=len(alerts))
+        lngs = np.fromiter((alert.lng for alert in alerts), dtype=np.float64, count=len(alerts))
+        distances = haversine_distances(lat_usuario, lng_usuario, lats, lngs)
         
-        alerts_with_distance.sort(key=lambda x: x[1])
-        sorted_alerts = [alert for alert, _ in alerts_with_distance]
+        sorted_alerts = [alerts[pos] for pos in np.argsort(distances, kind='stable')]
         
         serializer = self.get_serializer(sorted_alerts, many=True)
         
@@ -259,25 +259,6 @@ class MessageViewSet(viewsets.ModelViewSet):
 
 
 
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6378.0
-    
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    distance = R * c
-    
-    return distance
-
 class ReportViewSet(viewsets.ModelViewSet):
     queryset = Report.objects.all()
     serializer_class = ReportSerializer